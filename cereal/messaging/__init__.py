@@ -7,7 +7,8 @@ import os
 import capnp
 import time
 
-from typing import Optional, List, Union, Dict
+from struct import unpack_from
+from typing import Optional, List, Union, Dict, Tuple
 
 from cereal import log
 from cereal.services import SERVICE_LIST
@@ -15,6 +16,15 @@ from openpilot.common.utils import MovingAverage
 
 NO_TRAVERSAL_LIMIT = 2**64-1
 
+# schema fields of log.Event, reading a struct by field is a lot cheaper than by name
+EVENT_FIELDS = log.Event.schema.fields
+_LOG_MONO_TIME_FIELD = EVENT_FIELDS['logMonoTime']
+_VALID_FIELD = EVENT_FIELDS['valid']
+# where logMonoTime (bytes) and valid (bits) are in the data section of an Event
+_LOG_MONO_TIME_OFFSET = _LOG_MONO_TIME_FIELD.proto.slot.offset * 8
+_VALID_OFFSET = _VALID_FIELD.proto.slot.offset
+_VALID_DEFAULT = _VALID_FIELD.proto.slot.defaultValue.bool
+
 
 def pub_sock(endpoint: str) -> PubSocket:
   service = SERVICE_LIST.get(endpoint)
@@ -34,18 +44,63 @@ def reset_context():
   msgq.context = Context()
 
 
-def log_from_bytes(dat: bytes, struct: capnp.lib.capnp._StructModule = log.Event) -> capnp.lib.capnp._DynamicStructReader:
-  with struct.from_bytes(dat, traversal_limit_in_words=NO_TRAVERSAL_LIMIT) as msg:
-    return msg
-
-
-def new_message(service: Optional[str], size: Optional[int] = None, **kwargs) -> capnp.lib.capnp._DynamicStructBuilder:
+def _segments(buf: memoryview) -> List[memoryview]:
+  # capnp stream framing: segment count - 1, the size of each segment in words, padding to a word
+  num_segments = unpack_from('<I', buf)[0] + 1
+  pos = (4 + 4 * num_segments + 7) & ~7
+  segments = []
+  for size in unpack_from(f'<{num_segments}I', buf, 4):
+    segments.append(buf[pos:pos + size * 8])
+    pos += size * 8
+  return segments
+
+
+def _message_words(dat: bytes) -> int:
+  # words in all segments, from the framing header. Unlike total_size this includes the root pointer, and
+  # it doesn't walk the message
+  num_segments = unpack_from('<I', dat)[0] + 1
+  return (len(dat) - ((4 + 4 * num_segments + 7) & ~7)) // 8
+
+
+def log_from_bytes(dat: Union[bytes, bytearray, memoryview], struct: capnp.lib.capnp._StructModule = log.Event) -> capnp.lib.capnp._DynamicStructReader:
+  """
+  Decodes a message from bytes or any other buffer (bytearray, memoryview, ...) without copying it. The reader
+  keeps the buffer alive, but if the buffer's memory gets reused, the reader sees the new contents.
+  """
+  if isinstance(dat, bytes):
+    with struct.from_bytes(dat, traversal_limit_in_words=NO_TRAVERSAL_LIMIT) as msg:
+      return msg
+  # from_bytes releases other buffers when its context exits, segment readers hold on to them
+  return struct.from_segments(_segments(memoryview(dat).cast('B')), traversal_limit_in_words=NO_TRAVERSAL_LIMIT)
+
+
+def event_header(dat: bytes) -> Tuple[int, bool]:
+  """logMonoTime and valid of a serialized Event, read from the root struct without decoding the message"""
+  num_segments = unpack_from('<I', dat)[0] + 1
+  pos = (4 + 4 * num_segments + 7) & ~7
+  # root struct pointer: offset in words and pointer kind, then the data section size in words
+  ptr, data_words = unpack_from('<iH', dat, pos)
+  if ptr & 3 != 0:
+    # the root is only behind a far pointer if the first segment had no room for it, decode normally
+    msg = log_from_bytes(dat)
+    return msg.logMonoTime, msg.valid
+
+  # fields past the end of the data section are at their default, values are stored xor their default
+  data = pos + 8 + (ptr >> 2) * 8
+  log_mono_time = unpack_from('<Q', dat, data + _LOG_MONO_TIME_OFFSET)[0] if _LOG_MONO_TIME_OFFSET < data_words * 8 else 0
+  valid_byte = _VALID_OFFSET // 8
+  valid = bool(dat[data + valid_byte] >> (_VALID_OFFSET % 8) & 1) if valid_byte < data_words * 8 else False
+  return log_mono_time, valid != _VALID_DEFAULT
+
+
+def new_message(service: Optional[str], size: Optional[int] = None, num_first_segment_words: Optional[int] = None,
+                **kwargs) -> capnp.lib.capnp._DynamicStructBuilder:
   args = {
     'valid': False,
     'logMonoTime': int(time.monotonic() * 1e9),
     **kwargs
   }
-  dat = log.Event.new_message(**args)
+  dat = log.Event.new_message(num_first_segment_words=num_first_segment_words, **args)
   if service is not None:
     if size is None:
       dat.init(service)
@@ -150,7 +205,8 @@ class FrequencyTracker:
 class SubMaster:
   def __init__(self, services: List[str], poll: Optional[str] = None,
                ignore_alive: Optional[List[str]] = None, ignore_avg_freq: Optional[List[str]] = None,
-               ignore_valid: Optional[List[str]] = None, addr: str = "127.0.0.1", frequency: Optional[float] = None):
+               ignore_valid: Optional[List[str]] = None, addr: str = "127.0.0.1", frequency: Optional[float] = None,
+               lazy_decode: bool = False):
     self.frame = -1
     self.services = services
     self.seen = {s: False for s in services}
@@ -158,7 +214,7 @@ class SubMaster:
     self.recv_time = {s: 0. for s in services}
     self.recv_frame = {s: 0 for s in services}
     self.sock = {}
-    self.data = {}
+    self._data: Dict[str, capnp.lib.capnp._DynamicStructReader] = {}
     self.logMonoTime = {s: 0 for s in services}
 
     # zero-frequency / on-demand services are always alive and presumed valid; all others must pass checks
@@ -167,6 +223,7 @@ class SubMaster:
     self.alive = {s: on_demand[s] for s in services}
     self.freq_ok = {s: on_demand[s] for s in services}
     self.valid = {s: on_demand[s] for s in services}
+    self.max_recv_delay = {s: 10. / SERVICE_LIST[s].frequency for s in self.static_freq_services}
 
     self.freq_tracker: Dict[str, FrequencyTracker] = {}
     self.poller = Poller()
@@ -179,29 +236,53 @@ class SubMaster:
 
     self.simulation = bool(int(os.getenv("SIMULATION", "0")))
 
+    # with lazy_decode, received messages are kept as bytes and only decoded when they're read
+    self.lazy_decode = lazy_decode
+    self._pending: Dict[str, bytes] = {}
+    self._service_field = {s: EVENT_FIELDS[s] for s in services}
+
     # if freq and poll aren't specified, assume the max to be conservative
     assert frequency is None or poll is None, "Do not specify 'frequency' - frequency of the polled service will be used."
     self.update_freq = frequency or max([SERVICE_LIST[s].frequency for s in polled_services])
 
     for s in services:
       p = self.poller if s not in self.non_polled_services else None
-      self.sock[s] = sub_sock(s, poller=p, addr=addr, conflate=True)
+      self.sock[s] = self._create_socket(s, p, addr)
 
       try:
         data = new_message(s)
       except capnp.lib.capnp.KjException:
         data = new_message(s, 0) # lists
 
-      self.data[s] = getattr(data.as_reader(), s)
+      self._data[s] = getattr(data.as_reader(), s)
       self.freq_tracker[s] = FrequencyTracker(SERVICE_LIST[s].frequency, self.update_freq, s == poll)
 
+  def _create_socket(self, s: str, poller: Optional[Poller], addr: str) -> Optional[SubSocket]:
+    return sub_sock(s, poller=poller, addr=addr, conflate=True)
+
   def __getitem__(self, s: str) -> capnp.lib.capnp._DynamicStructReader:
-    return self.data[s]
+    if s in self._pending:
+      self._decode(s)
+    return self._data[s]
+
+  @property
+  def data(self) -> Dict[str, capnp.lib.capnp._DynamicStructReader]:
+    # messages that weren't read through sm[s] yet are decoded, so reads of sm.data are up to date
+    for s in list(self._pending):
+      self._decode(s)
+    return self._data
+
+  def _decode(self, s: str) -> None:
+    self._data[s] = log_from_bytes(self._pending.pop(s))._get_by_field(self._service_field[s])
 
   def _check_avg_freq(self, s: str) -> bool:
     return SERVICE_LIST[s].frequency > 0.99 and (s not in self.ignore_average_freq) and (s not in self.ignore_alive)
 
   def update(self, timeout: int = 100) -> None:
+    if self.lazy_decode:
+      self._update_raw(timeout)
+      return
+
     msgs = []
     for sock in self.poller.poll(timeout):
       msgs.append(recv_one_or_none(sock))
@@ -211,28 +292,49 @@ class SubMaster:
       msgs.append(recv_one_or_none(self.sock[s]))
     self.update_msgs(time.monotonic(), msgs)
 
+  def _update_raw(self, timeout: int) -> None:
+    # the poller is only used to wait, all sockets are drained as raw bytes so the service
+    # of each message is known without asking the message for it
+    self.poller.poll(timeout)
+    msgs = []
+    for s in self.services:
+      dat = self.sock[s].receive(non_blocking=True)
+      if dat is not None:
+        self._pending[s] = dat
+        msgs.append((s, *event_header(dat)))
+    self._update_msgs(time.monotonic(), msgs)
+
   def update_msgs(self, cur_time: float, msgs: List[capnp.lib.capnp._DynamicStructReader]) -> None:
-    self.frame += 1
-    self.updated = dict.fromkeys(self.services, False)
+    headers = []
     for msg in msgs:
       if msg is None:
         continue
 
       s = msg.which()
+      self._pending.pop(s, None)
+      self._data[s] = msg._get_by_field(self._service_field[s])
+      headers.append((s, msg._get_by_field(_LOG_MONO_TIME_FIELD), msg._get_by_field(_VALID_FIELD)))
+    self._update_msgs(cur_time, headers)
+
+  def _update_msgs(self, cur_time: float, msgs: List[Tuple[str, int, bool]]) -> None:
+    self.frame += 1
+    self.updated = dict.fromkeys(self.services, False)
+    for s, log_mono_time, valid in msgs:
       self.seen[s] = True
       self.updated[s] = True
 
       self.freq_tracker[s].record_recv_time(cur_time)
       self.recv_time[s] = cur_time
       self.recv_frame[s] = self.frame
-      self.data[s] = getattr(msg, s)
-      self.logMonoTime[s] = msg.logMonoTime
-      self.valid[s] = msg.valid
+      self.logMonoTime[s] = log_mono_time
+      self.valid[s] = valid
 
     for s in self.static_freq_services:
       # alive if delay is within 10x the expected frequency; checks relaxed in simulator
-      self.alive[s] = (cur_time - self.recv_time[s]) < (10. / SERVICE_LIST[s].frequency) or (self.seen[s] and self.simulation)
-      self.freq_ok[s] = self.freq_tracker[s].valid or self.simulation
+      self.alive[s] = (cur_time - self.recv_time[s]) < self.max_recv_delay[s] or (self.seen[s] and self.simulation)
+      # the average frequency only changes when the service is received
+      if self.updated[s] or self.simulation:
+        self.freq_ok[s] = self.freq_tracker[s].valid or self.simulation
 
   def all_alive(self, service_list: Optional[List[str]] = None) -> bool:
     return all(self.alive[s] for s in (service_list or self.services) if s not in self.ignore_alive)
@@ -253,9 +355,23 @@ class PubMaster:
     for s in services:
       self.sock[s] = pub_sock(s)
 
+    # size in words of the largest message sent on each service
+    self.message_words: Dict[str, int] = {}
+
+  def new_message(self, s: str, size: Optional[int] = None, **kwargs) -> capnp.lib.capnp._DynamicStructBuilder:
+    """
+    Same as new_message, but the first segment of the message is sized to hold the largest message sent
+    on s so far. Large messages are then built in one allocation, instead of growing the arena segment
+    by segment every time, and serialize to a single segment.
+    """
+    return new_message(s, size, num_first_segment_words=self.message_words.get(s), **kwargs)
+
   def send(self, s: str, dat: Union[bytes, capnp.lib.capnp._DynamicStructBuilder]) -> None:
     if not isinstance(dat, bytes):
       dat = dat.to_bytes()
+      words = _message_words(dat)
+      if words > self.message_words.get(s, 0):
+        self.message_words[s] = words
     self.sock[s].send(dat)
 
   def wait_for_readers_to_update(self, s: str, timeout: int, dt: float = 0.05) -> bool:
@@ -72,6 +72,39 @@ class TestMessaging:
     assert not msg.valid
     assert evt == msg.which()
 
+  def test_log_from_bytes_view(self):
+    msg = messaging.new_message("modelV2")
+    msg.modelV2.position.x = [random.random() for _ in range(2000)]
+    dat = msg.to_bytes()
+    expected = messaging.log_from_bytes(dat)
+
+    for buf in (bytearray(dat), memoryview(bytearray(dat))):
+      evt = messaging.log_from_bytes(buf)
+      del buf
+      assert evt.logMonoTime == expected.logMonoTime
+      assert list(evt.modelV2.position.x) == list(expected.modelV2.position.x)
+
+    # the buffer isn't copied, the reader decodes from it
+    buf = bytearray(messaging.new_message("modelV2", logMonoTime=0x1122334455667788).to_bytes())
+    evt = messaging.log_from_bytes(memoryview(buf))
+    buf[buf.index(bytes.fromhex("8877665544332211"))] = 0
+    assert evt.logMonoTime == 0x1122334455667700
+
+  @parameterized.expand(events)
+  def test_event_header(self, evt):
+    # with a one word first segment, the root struct is behind a far pointer
+    for num_first_segment_words in (None, 1):
+      for valid in (True, False):
+        kwargs = {'num_first_segment_words': num_first_segment_words, 'logMonoTime': random.getrandbits(64), 'valid': valid}
+        try:
+          msg = messaging.new_message(evt, **kwargs)
+        except capnp.lib.capnp.KjException:
+          msg = messaging.new_message(evt, random.randrange(200), **kwargs)
+        assert messaging.event_header(msg.to_bytes()) == (msg.logMonoTime, valid)
+
+    # fields that were never set
+    assert messaging.event_header(log.Event.new_message().to_bytes()) == (0, True)
+
   @parameterized.expand(events)
   def test_pub_sock(self, evt):
     messaging.pub_sock(evt)
@@ -63,6 +63,24 @@ class TestSubMaster:
       assert sm.frame == i
       assert all(sm.updated.values())
 
+  def test_lazy_decode(self):
+    sock = "carState"
+    pub_sock = messaging.pub_sock(sock)
+    sm = messaging.SubMaster([sock,], lazy_decode=True)
+    zmq_sleep()
+
+    for i in range(10):
+      msg = random_carstate()
+      msg.valid = bool(i % 2)
+      pub_sock.send(msg.to_bytes())
+      sm.update(1000)
+      assert sm.frame == i
+      assert sm.updated[sock]
+      assert sm.valid[sock] == msg.valid
+      assert sm.logMonoTime[sock] == msg.logMonoTime
+      # messages are decoded on the first read, through sm[s] or sm.data
+      assert_carstate(msg.carState, sm[sock] if i % 2 else sm.data[sock])
+
   def test_update_timeout(self):
     sock = random_sock()
     sm = messaging.SubMaster([sock,])
@@ -98,13 +116,62 @@ class TestSubMaster:
           assert not sm._check_avg_freq(service)
 
   def test_alive(self):
-    pass
+    sock = "carState"
+    sm = messaging.SubMaster([sock, "carParams"])
+    dt = 1. / SERVICE_LIST[sock].frequency
+    for i in range(200):
+      sm.update_msgs(100 + i * dt, [messaging.new_message(sock).as_reader()])
+    assert sm.alive[sock] and sm.freq_ok[sock]
+    assert sm.all_alive() and sm.all_freq_ok()
+
+    # alive expires after 10x the expected interval
+    last_recv_time = 100 + 199 * dt
+    sm.update_msgs(last_recv_time + 9 * dt, [])
+    assert sm.alive[sock]
+    sm.update_msgs(last_recv_time + 11 * dt, [])
+    assert not sm.alive[sock] and not sm.all_alive() and not sm.all_checks()
+    assert sm.all_alive(["carParams"])
+
+  def test_freq_tracker(self):
+    sock = "carState"
+    sm = messaging.SubMaster([sock, ])
+    tracker = sm.freq_tracker[sock]
+
+    # the first receive starts the first interval
+    sm.update_msgs(100, [messaging.new_message(sock).as_reader()])
+    assert tracker.avg_dt.count == 0 and not sm.freq_ok[sock]
+
+    # every message is an interval, also when a service is received twice in a frame
+    sm.update_msgs(100.01, [messaging.new_message(sock).as_reader()] * 2)
+    assert tracker.avg_dt.count == 2
+    assert tracker.prev_time == 100.01
 
   def test_ignore_alive(self):
-    pass
+    sock = "carState"
+    sm = messaging.SubMaster([sock, "carParams"])
+    sm.update_msgs(100, [])
+    assert not sm.all_alive() and not sm.all_freq_ok()
+
+    # the ignore lists can be changed after init
+    sm.ignore_alive.append(sock)
+    assert sm.all_alive() and sm.all_freq_ok()
+    assert not sm.alive[sock]
 
   def test_valid(self):
-    pass
+    sock = "carState"
+    sm = messaging.SubMaster([sock, "userBookmark"])
+    for i, valid in enumerate((True, False, True)):
+      msg = messaging.new_message(sock)
+      msg.valid = valid
+      sm.update_msgs(100 + i, [msg.as_reader()])
+      assert sm.valid[sock] == sm.all_valid() == valid
+    # on demand services are presumed valid
+    assert sm.valid["userBookmark"]
+
+    sm.valid[sock] = False
+    assert not sm.all_valid()
+    sm.ignore_valid.append(sock)
+    assert sm.all_valid()
 
   # SubMaster should always conflate
   def test_conflate(self):
@@ -158,3 +225,20 @@ class TestPubMaster:
           msg.clear_write_flag()
           msg = msg.to_bytes()
         assert msg == recvd, i
+
+  def test_new_message(self):
+    sock = "modelV2"
+    pm = messaging.PubMaster([sock, ])
+
+    def fill(msg):
+      for p in (msg.modelV2.position, msg.modelV2.velocity, msg.modelV2.acceleration):
+        p.x = p.y = p.z = [random.random() for _ in range(1000)]
+      return msg
+
+    # once a message is sent, later messages of the service are built in one segment
+    msg = fill(pm.new_message(sock))
+    assert len(msg.to_segments()) > 1
+    pm.send(sock, msg)
+    # the root pointer is part of the first segment, total_size leaves it out
+    assert pm.message_words[sock] >= msg.total_size.word_count + 1
+    assert len(fill(pm.new_message(sock)).to_segments()) == 1
@@ -11,9 +11,42 @@ def get_kalman_gain(dt, A, C, Q, R, iterations=100):
   return K
 
 
+def solve_dare(A, C, Q, R, tol=1e-12, max_iterations=100):
+  """
+  Steady state prediction covariance P of a Kalman filter with constant A, C, Q and R, the solution of the
+  discrete algebraic Riccati equation P = A P A' - A P C' (C P C' + R)^-1 C P A' + Q.
+  Solved with the structure-preserving doubling algorithm, which converges quadratically.
+  """
+  A_k = np.array(A, dtype=np.float64).T
+  C = np.atleast_2d(np.array(C, dtype=np.float64))
+  G_k = C.T @ np.linalg.solve(np.atleast_2d(R), C)
+  H_k = np.array(Q, dtype=np.float64)
+  eye = np.eye(len(A_k))
+  for _ in range(max_iterations):
+    W = eye + G_k @ H_k
+    W_inv_A = np.linalg.solve(W, A_k)
+    H_next = H_k + A_k.T @ H_k @ W_inv_A
+    G_k = G_k + A_k @ np.linalg.solve(W, G_k) @ A_k.T
+    A_k = A_k @ W_inv_A
+    converged = np.abs(H_next - H_k).max() <= tol * np.abs(H_next).max()
+    H_k = H_next
+    if converged:
+      return H_k
+  raise ValueError("DARE did not converge, is (A, C) detectable?")
+
+
+def get_steady_state_gain(A, C, Q, R):
+  """
+  Kalman gain for KF1D, K = A P C' (C P C' + R)^-1 with P from solve_dare. Same as control.dare(A', C', Q, R)[2]'
+  """
+  C = np.atleast_2d(np.array(C, dtype=np.float64))
+  P = solve_dare(A, C, Q, R)
+  return np.array(A, dtype=np.float64) @ P @ C.T @ np.linalg.inv(C @ P @ C.T + np.atleast_2d(R))
+
+
 class KF1D:
   # this EKF assumes constant covariance matrix, so calculations are much simpler
-  # the Kalman gain also needs to be precomputed using the control module
+  # the Kalman gain also needs to be precomputed, see get_steady_state_gain
 
   def __init__(self, x0, A, C, K):
     self.x0_0 = x0[0][0]
@@ -32,10 +65,7 @@ class KF1D:
     self.A_K_2 = self.A1_0 - self.K1_0 * self.C0_0
     self.A_K_3 = self.A1_1 - self.K1_0 * self.C0_1
 
-    # K matrix needs to  be pre-computed as follow:
-    # import control
-    # (x, l, K) = control.dare(np.transpose(self.A), np.transpose(self.C), Q, R)
-    # self.K = np.transpose(K)
+    # K matrix needs to be pre-computed with get_steady_state_gain(A, C, Q, R)
 
   def update(self, meas):
     #self.x = np.dot(self.A_K, self.x) + np.dot(self.K, meas)
@@ -52,3 +82,38 @@ class KF1D:
   def set_x(self, x):
     self.x0_0 = x[0][0]
     self.x1_0 = x[1][0]
+
+
+class KF1DBatch(KF1D):
+  """
+  Many independent KF1D filters with the same A, C and K, in one. x0 is (2, N), one column per filter, and
+  measurements are (N,). The arithmetic is KF1D's on arrays, so each filter gives the same results as its own KF1D.
+  """
+  def __init__(self, x0, A, C, K):
+    super().__init__([[0.0], [0.0]], A, C, K)
+    self.set_x(x0)
+
+  def __len__(self):
+    return len(self.x0_0)
+
+  def update(self, meas, where=None):
+    """
+    Updates the filters, only those where `where` is True if given, and returns the states like KF1D
+    """
+    x0_0 = self.A_K_0 * self.x0_0 + self.A_K_1 * self.x1_0 + self.K0_0 * meas
+    x1_0 = self.A_K_2 * self.x0_0 + self.A_K_3 * self.x1_0 + self.K1_0 * meas
+    if where is not None:
+      x0_0 = np.where(where, x0_0, self.x0_0)
+      x1_0 = np.where(where, x1_0, self.x1_0)
+    self.x0_0 = x0_0
+    self.x1_0 = x1_0
+    return [self.x0_0, self.x1_0]
+
+  @property
+  def x(self):
+    return np.array([self.x0_0, self.x1_0])
+
+  def set_x(self, x):
+    # the states are replaced on update, never written to, so they can share memory with x
+    self.x0_0 = np.asarray(x[0], dtype=np.float64)
+    self.x1_0 = np.asarray(x[1], dtype=np.float64)
@@ -1,4 +1,6 @@
-from openpilot.common.simple_kalman import KF1D
+import numpy as np
+
+from openpilot.common.simple_kalman import KF1D, KF1DBatch, get_steady_state_gain
 
 
 class TestSimpleKalman:
@@ -15,6 +17,9 @@ class TestSimpleKalman:
     K0_0 = 0.12287673
     K1_0 = 0.29666309
 
+    self.A = [[A0_0, A0_1], [A1_0, A1_1]]
+    self.C = [C0_0, C0_1]
+    self.K = [[K0_0], [K1_0]]
     self.kf = KF1D(x0=[[x0_0], [x1_0]],
                    A=[[A0_0, A0_1], [A1_0, A1_1]],
                    C=[C0_0, C0_1],
@@ -27,3 +32,23 @@ class TestSimpleKalman:
   def test_update_returns_state(self):
     x = self.kf.update(100)
     assert x == [i[0] for i in self.kf.x]
+
+  def test_steady_state_gain(self):
+    # the gain in setup_method was computed with control.dare for these noises
+    K = get_steady_state_gain(self.A, self.C, np.diag([10., 100.]), 1e3)
+    np.testing.assert_allclose(K, self.K, atol=1e-8)
+
+  def test_batch(self):
+    rng = np.random.default_rng(0)
+    x0 = rng.normal(size=(2, 5))
+    batch = KF1DBatch(x0, self.A, self.C, self.K)
+    kfs = [KF1D(x0=[[x0[0, i]], [x0[1, i]]], A=self.A, C=self.C, K=self.K) for i in range(len(batch))]
+    for _ in range(20):
+      meas = rng.normal(size=len(batch))
+      where = rng.random(len(batch)) < 0.7
+      x = batch.update(meas, where=where)
+      for i, kf in enumerate(kfs):
+        if where[i]:
+          kf.update(meas[i])
+      np.testing.assert_array_equal(x, [[kf.x0_0 for kf in kfs], [kf.x1_0 for kf in kfs]])
+      np.testing.assert_array_equal(batch.x, x)
@@ -1,18 +1,21 @@
-from openpilot.common.transformations.orientation import numpy_wrap
-from openpilot.common.transformations.transformations import (ecef2geodetic_single,
-                                                    geodetic2ecef_single)
+from openpilot.common.transformations.transformations import (_as_array, ecef2geodetic,
+                                                    geodetic2ecef)
 from openpilot.common.transformations.transformations import LocalCoord as LocalCoord_single
 
 
 class LocalCoord(LocalCoord_single):
-  ecef2ned = numpy_wrap(LocalCoord_single.ecef2ned_single, (3,), (3,))
-  ned2ecef = numpy_wrap(LocalCoord_single.ned2ecef_single, (3,), (3,))
-  geodetic2ned = numpy_wrap(LocalCoord_single.geodetic2ned_single, (3,), (3,))
-  ned2geodetic = numpy_wrap(LocalCoord_single.ned2geodetic_single, (3,), (3,))
+  def ecef2ned(self, ecef):
+    return (_as_array(ecef, (3,)) - self.init_ecef) @ self.ecef2ned_matrix.T
 
+  def ned2ecef(self, ned):
+    return _as_array(ned, (3,)) @ self.ned2ecef_matrix.T + self.init_ecef
+
+  def geodetic2ned(self, geodetic):
+    return self.ecef2ned(geodetic2ecef(geodetic))
+
+  def ned2geodetic(self, ned):
+    return ecef2geodetic(self.ned2ecef(ned))
 
-geodetic2ecef = numpy_wrap(geodetic2ecef_single, (3,), (3,))
-ecef2geodetic = numpy_wrap(ecef2geodetic_single, (3,), (3,))
 
 geodetic_from_ecef = ecef2geodetic
 ecef_from_geodetic = geodetic2ecef
@@ -1,6 +1,10 @@
 import numpy as np
+import hypothesis.strategies as st
+from hypothesis import given, settings
+from hypothesis.extra.numpy import arrays
 
 import openpilot.common.transformations.coordinates as coord
+from openpilot.common.transformations.transformations import geodetic2ecef_single, ecef2geodetic_single
 
 geodetic_positions = np.array([[37.7610403, -122.4778699, 115],
                                  [27.4840915, -68.5867592, 2380],
@@ -105,7 +109,7 @@ class TestNED:
 
   def test_errors(self):
     # Test wrong shape/type for geodetic2ecef
-    # numpy_wrap raises IndexError for scalar input
+    # scalar input raises IndexError
     with np.testing.assert_raises(IndexError):
       coord.geodetic2ecef(1.0)
 
@@ -135,3 +139,38 @@ class TestNED:
       coord.ecef2geodetic([1, 2, 3, 4])
     with np.testing.assert_raises(IndexError):
       coord.ecef2geodetic(1.0)
+
+
+geodetic_batches = st.integers(0, 20).flatmap(lambda n: st.tuples(
+  arrays(np.float64, n, elements=st.floats(-89, 89)),
+  arrays(np.float64, n, elements=st.floats(-180, 180)),
+  arrays(np.float64, n, elements=st.floats(-100, 5000)),
+)).map(lambda lla: np.column_stack(lla).reshape(-1, 3))
+
+
+class TestBatch:
+  """The vectorised versions against looping over the single ones"""
+  @settings(max_examples=50, deadline=None)
+  @given(geodetic_batches)
+  def test_ecef_geodetic(self, geodetics):
+    ecefs = coord.geodetic2ecef(geodetics)
+    np.testing.assert_allclose(ecefs, np.reshape([geodetic2ecef_single(g) for g in geodetics], (-1, 3)), atol=1e-8)
+    np.testing.assert_allclose(coord.ecef2geodetic(ecefs), np.reshape([ecef2geodetic_single(e) for e in ecefs], (-1, 3)), rtol=1e-12, atol=1e-8)
+
+  @settings(max_examples=50, deadline=None)
+  @given(geodetic_batches, arrays(np.float64, (10, 3), elements=st.floats(-1000, 1000)))
+  def test_ned(self, geodetics, neds):
+    for geodetic in geodetics:
+      converter = coord.LocalCoord.from_geodetic(geodetic)
+      ecefs = converter.ned2ecef(neds)
+      np.testing.assert_allclose(ecefs, [converter.ned2ecef_single(n) for n in neds], atol=1e-8)
+      np.testing.assert_allclose(converter.ecef2ned(ecefs), [converter.ecef2ned_single(e) for e in ecefs], atol=1e-8)
+      np.testing.assert_allclose(converter.ned2geodetic(neds), [converter.ned2geodetic_single(n) for n in neds], rtol=1e-12, atol=1e-8)
+
+  def test_ned_wrong_shape(self):
+    converter = coord.LocalCoord.from_geodetic(geodetic_positions[0])
+    for f in (converter.ecef2ned, converter.ned2ecef, converter.geodetic2ned, converter.ned2geodetic):
+      with np.testing.assert_raises(ValueError):
+        f([[1, 2], [3, 4]])
+      with np.testing.assert_raises(IndexError):
+        f(1.0)
@@ -1,9 +1,15 @@
 import numpy as np
 import pytest
+import hypothesis.strategies as st
+from hypothesis import given, settings
+from hypothesis.extra.numpy import arrays
 
 from openpilot.common.transformations.orientation import euler2quat, quat2euler, euler2rot, rot2euler, \
                                                rot2quat, quat2rot, \
-                                               ned_euler_from_ecef
+                                               ned_euler_from_ecef, ecef_euler_from_ned
+from openpilot.common.transformations.transformations import euler2quat_single, quat2euler_single, euler2rot_single, rot2euler_single, \
+                                                        rot2quat_single, quat2rot_single, \
+                                                        ned_euler_from_ecef_single, ecef_euler_from_ned_single, geodetic2ecef_single
 
 eulers = np.array([[ 1.46520501,  2.78688383,  2.92780854],
        [ 4.86909526,  3.60618161,  4.30648981],
@@ -89,3 +95,55 @@ class TestOrientation:
     rpy_from_rot = rot2euler(R)
     R_new3 = euler2rot(rpy_from_rot)
     np.testing.assert_allclose(R, R_new3, atol=1e-15)
+
+
+def batches(row_shape, elements):
+  return arrays(np.float64, st.integers(1, 20).map(lambda n: (n, *row_shape)), elements=elements)
+
+
+euler_batches = batches((3,), st.floats(-2 * np.pi, 2 * np.pi))
+quat_batches = batches((4,), st.floats(-1, 1)).filter(lambda q: (np.linalg.norm(q, axis=1) > 0.1).all()) \
+                                              .map(lambda q: q / np.linalg.norm(q, axis=1, keepdims=True))
+geodetics = st.tuples(st.floats(-89, 89), st.floats(-180, 180), st.floats(-100, 5000))
+
+
+class TestBatch:
+  """The vectorised versions against looping over the single ones"""
+  @settings(max_examples=50, deadline=None)
+  @given(euler_batches)
+  def test_from_euler(self, eulers):
+    np.testing.assert_allclose(euler2quat(eulers), [euler2quat_single(e) for e in eulers], atol=1e-15)
+    np.testing.assert_allclose(euler2rot(eulers), [euler2rot_single(e) for e in eulers], atol=1e-15)
+
+  @settings(max_examples=50, deadline=None)
+  @given(quat_batches)
+  def test_from_quat(self, quats):
+    np.testing.assert_allclose(quat2euler(quats), [quat2euler_single(q) for q in quats], atol=1e-15)
+    np.testing.assert_allclose(quat2rot(quats), [quat2rot_single(q) for q in quats], atol=1e-15)
+
+  @settings(max_examples=50, deadline=None)
+  @given(quat_batches)
+  def test_from_rot(self, quats):
+    rots = quat2rot(quats)
+    np.testing.assert_allclose(rot2quat(rots), [rot2quat_single(r) for r in rots], atol=1e-15)
+    np.testing.assert_allclose(rot2euler(rots), [rot2euler_single(r) for r in rots], atol=1e-15)
+
+  @settings(max_examples=50, deadline=None)
+  @given(geodetics, euler_batches)
+  def test_euler_ned(self, geodetic, eulers):
+    ecef = geodetic2ecef_single(geodetic)
+    # the single versions lose ~1e-9 to rounding in ECEF, and the angles aren't unique, so compare the rotations
+    np.testing.assert_allclose(euler2rot(ned_euler_from_ecef(ecef, eulers)),
+                               euler2rot([ned_euler_from_ecef_single(ecef, e) for e in eulers]), atol=1e-7)
+    np.testing.assert_allclose(euler2rot(ecef_euler_from_ned(ecef, eulers)),
+                               euler2rot([ecef_euler_from_ned_single(ecef, e) for e in eulers]), atol=1e-7)
+    # single poses use the batch formulation, so batching only changes the rounding of the matrix products
+    np.testing.assert_allclose(ned_euler_from_ecef(ecef, eulers), np.reshape([ned_euler_from_ecef(ecef, e) for e in eulers], (-1, 3)), rtol=0, atol=1e-14)
+    np.testing.assert_allclose(ecef_euler_from_ned(ecef, eulers), np.reshape([ecef_euler_from_ned(ecef, e) for e in eulers], (-1, 3)), rtol=0, atol=1e-14)
+
+  def test_shapes(self):
+    assert euler2quat(eulers[0]).shape == (4,)
+    assert rot2quat(euler2rot(eulers[0])).shape == (4,)
+    assert euler2rot(np.zeros((2, 5, 3))).shape == (2, 5, 3, 3)
+    assert rot2euler(np.zeros((0, 3, 3))).shape == (0, 3)
+    np.testing.assert_allclose(ned_eulers, ned_euler_from_ecef(ecef_positions, eulers), rtol=1e-7)
@@ -1,4 +1,5 @@
 import numpy as np
+from functools import wraps
 
 
 # Constants
@@ -180,6 +181,19 @@ def axis_angle_to_rot(axis, angle):
   return quat2rot_single(q)
 
 
+def ned2ecef_matrix(lat, lon):
+  """
+  Rotation matrix from NED to ECEF at latitude and longitude in radians, (..., 3, 3) for arrays of them.
+  """
+  sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+  sin_lon, cos_lon = np.sin(lon), np.cos(lon)
+  return np.stack([
+    np.stack([-sin_lat * cos_lon, -sin_lon, -cos_lat * cos_lon], axis=-1),
+    np.stack([-sin_lat * sin_lon, cos_lon, -cos_lat * sin_lon], axis=-1),
+    np.stack([cos_lat, np.zeros_like(lat), -sin_lat], axis=-1),
+  ], axis=-2)
+
+
 class LocalCoord:
   """
   A class to handle conversions between ECEF and local NED coordinates.
@@ -197,14 +211,7 @@ class LocalCoord:
     else:
       raise ValueError("Must provide geodetic or ecef")
 
-    lat = np.radians(lat)
-    lon = np.radians(lon)
-
-    self.ned2ecef_matrix = np.array([
-      [-np.sin(lat) * np.cos(lon), -np.sin(lon), -np.cos(lat) * np.cos(lon)],
-      [-np.sin(lat) * np.sin(lon), np.cos(lon), -np.cos(lat) * np.sin(lon)],
-      [np.cos(lat), 0, -np.sin(lat)]
-    ])
+    self.ned2ecef_matrix = ned2ecef_matrix(np.radians(lat), np.radians(lon))
     self.ecef2ned_matrix = self.ned2ecef_matrix.T
 
   @classmethod
@@ -340,3 +347,202 @@ def ned_euler_from_ecef_single(ecef_init, ecef_pose):
   phi_out = np.arctan2(np.dot(y3, z2), np.dot(y3, y2))
 
   return np.array([phi_out, theta_out, psi_out])
+
+
+# Vectorised versions of the above, on the last axes of (..., 3), (..., 4) and (..., 3, 3) arrays
+
+def _as_array(inp, input_shape, error_msg=None):
+  """
+  Input as an array of input_shape items, raising for wrong shapes like the single versions do.
+  """
+  inp = np.asarray(inp)
+  if inp.ndim < len(input_shape):
+    raise IndexError(f"Expected shape (..., {', '.join(map(str, input_shape))}), got {inp.shape}")
+  if inp.shape[inp.ndim - len(input_shape):] != input_shape:
+    # unpacking a wrong size vector, or indexing a wrong size matrix
+    error = ValueError if len(input_shape) == 1 else IndexError
+    raise error(error_msg or f"Expected shape (..., {', '.join(map(str, input_shape))}), got {inp.shape}")
+  return inp
+
+
+def vectorised(single_function, input_shape, error_msg=None):
+  """
+  Makes a vectorised function take the last argument as one input or an array of them. A single input goes to
+  single_function, numpy's per call overhead makes the vectorised version slower for one row.
+  """
+  def decorator(function):
+    @wraps(function)
+    def f(*args):
+      *consts, inp = args
+      inp = _as_array(inp, input_shape, error_msg)
+      if inp.ndim == len(input_shape) and all(np.ndim(c) <= 1 for c in consts):
+        return single_function(*consts, inp)
+      return function(*consts, inp)
+    return f
+  return decorator
+
+
+@vectorised(geodetic2ecef_single, (3,), "Geodetic must be size 3")
+def geodetic2ecef(geodetic):
+  lat = np.radians(geodetic[..., 0])
+  lon = np.radians(geodetic[..., 1])
+  alt = geodetic[..., 2]
+  sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+  xi = np.sqrt(1.0 - esq * sin_lat**2)
+  x = (a / xi + alt) * cos_lat * np.cos(lon)
+  y = (a / xi + alt) * cos_lat * np.sin(lon)
+  z = (a / xi * (1.0 - esq) + alt) * sin_lat
+  return np.stack([x, y, z], axis=-1)
+
+
+@vectorised(ecef2geodetic_single, (3,))
+def ecef2geodetic(e):
+  x, y, z = e[..., 0], e[..., 1], e[..., 2]
+  r = np.sqrt(x**2 + y**2)
+  Esq = a**2 - b**2
+  F = 54 * b**2 * z**2
+  G = r**2 + (1 - esq) * z**2 - esq * Esq
+  C = (esq**2 * F * r**2) / (G**3)
+  S = np.cbrt(1 + C + np.sqrt(C**2 + 2 * C))
+  P = F / (3 * (S + 1 / S + 1)**2 * G**2)
+  Q = np.sqrt(1 + 2 * esq**2 * P)
+  r_0 = -(P * esq * r) / (1 + Q) + np.sqrt(0.5 * a**2 * (1 + 1.0 / Q) - P * (1 - esq) * z**2 / (Q * (1 + Q)) - 0.5 * P * r**2)
+  U = np.sqrt((r - esq * r_0)**2 + z**2)
+  V = np.sqrt((r - esq * r_0)**2 + (1 - esq) * z**2)
+  Z_0 = b**2 * z / (a * V)
+  h = U * (1 - b**2 / (a * V))
+  lat = np.arctan((z + e1sq * Z_0) / r)
+  lon = np.arctan2(y, x)
+  return np.stack([np.degrees(lat), np.degrees(lon), h], axis=-1)
+
+
+@vectorised(euler2quat_single, (3,))
+def euler2quat(euler):
+  phi, theta, psi = euler[..., 0], euler[..., 1], euler[..., 2]
+
+  c_phi, s_phi = np.cos(phi / 2), np.sin(phi / 2)
+  c_theta, s_theta = np.cos(theta / 2), np.sin(theta / 2)
+  c_psi, s_psi = np.cos(psi / 2), np.sin(psi / 2)
+
+  w = c_phi * c_theta * c_psi + s_phi * s_theta * s_psi
+  x = s_phi * c_theta * c_psi - c_phi * s_theta * s_psi
+  y = c_phi * s_theta * c_psi + s_phi * c_theta * s_psi
+  z = c_phi * c_theta * s_psi - s_phi * s_theta * c_psi
+
+  q = np.stack([w, x, y, z], axis=-1)
+  return np.where(w[..., None] < 0, -q, q)
+
+
+@vectorised(quat2euler_single, (4,))
+def quat2euler(q):
+  w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+  gamma = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x**2 + y**2))
+  sin_arg = 2 * (w * y - z * x)
+  sin_arg = np.clip(sin_arg, -1.0, 1.0)
+  theta = np.arcsin(sin_arg)
+  psi = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y**2 + z**2))
+  return np.stack([gamma, theta, psi], axis=-1)
+
+
+@vectorised(quat2rot_single, (4,))
+def quat2rot(q):
+  w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+  xx, yy, zz = x * x, y * y, z * z
+  xy, xz, yz = x * y, x * z, y * z
+  wx, wy, wz = w * x, w * y, w * z
+
+  return np.stack([
+    np.stack([1 - 2 * (yy + zz), 2 * (xy - wz), 2 * (xz + wy)], axis=-1),
+    np.stack([2 * (xy + wz), 1 - 2 * (xx + zz), 2 * (yz - wx)], axis=-1),
+    np.stack([2 * (xz - wy), 2 * (yz + wx), 1 - 2 * (xx + yy)], axis=-1),
+  ], axis=-2)
+
+
+@vectorised(rot2quat_single, (3, 3))
+def rot2quat(rot):
+  # r[i, j] is element i, j of every rotation
+  r = np.moveaxis(rot.reshape(-1, 3, 3), 0, -1)
+  trace = r[0, 0] + r[1, 1] + r[2, 2]
+  # the branches of rot2quat_single: positive trace, else the largest diagonal element
+  branch = np.select([trace > 0, (r[0, 0] > r[1, 1]) & (r[0, 0] > r[2, 2]), r[1, 1] > r[2, 2]], [0, 1, 2], 3)
+
+  q = np.empty((4, r.shape[-1]))
+  idx = np.flatnonzero(branch == 0)
+  ri = r[:, :, idx]
+  s = 0.5 / np.sqrt(trace[idx] + 1.0)
+  q[0, idx] = 0.25 / s
+  q[1, idx] = (ri[2, 1] - ri[1, 2]) * s
+  q[2, idx] = (ri[0, 2] - ri[2, 0]) * s
+  q[3, idx] = (ri[1, 0] - ri[0, 1]) * s
+  for i in range(3):
+    j, k = (i + 1) % 3, (i + 2) % 3
+    idx = np.flatnonzero(branch == i + 1)
+    ri = r[:, :, idx]
+    s = 2.0 * np.sqrt(1.0 + ri[i, i] - ri[min(j, k), min(j, k)] - ri[max(j, k), max(j, k)])
+    q[0, idx] = (ri[k, j] - ri[j, k]) / s
+    q[i + 1, idx] = 0.25 * s
+    q[j + 1, idx] = (ri[i, j] + ri[j, i]) / s
+    q[k + 1, idx] = (ri[i, k] + ri[k, i]) / s
+
+  np.negative(q, out=q, where=q[0] < 0)
+  return np.moveaxis(q, 0, -1).reshape(rot.shape[:-2] + (4,))
+
+
+@vectorised(euler2rot_single, (3,))
+def euler2rot(euler):
+  phi, theta, psi = euler[..., 0], euler[..., 1], euler[..., 2]
+
+  cx, sx = np.cos(phi), np.sin(phi)
+  cy, sy = np.cos(theta), np.sin(theta)
+  cz, sz = np.cos(psi), np.sin(psi)
+
+  # Rz @ Ry @ Rx
+  return np.stack([
+    np.stack([cz * cy, -sz * cx + cz * sy * sx, sz * sx + cz * sy * cx], axis=-1),
+    np.stack([sz * cy, cz * cx + sz * sy * sx, -cz * sx + sz * sy * cx], axis=-1),
+    np.stack([-sy, cy * sx, cy * cx], axis=-1),
+  ], axis=-2)
+
+
+@vectorised(rot2euler_single, (3, 3))
+def rot2euler(rot):
+  return quat2euler(rot2quat(rot))
+
+
+def _euler_from_axes(rot):
+  """
+  Euler angles of the rotation, from its rotated x and y axes, like ecef_euler_from_ned_single does.
+  """
+  x3, y3 = rot[..., :, 0], rot[..., :, 1]
+  psi = np.arctan2(x3[..., 1], x3[..., 0])
+  theta = np.arctan2(-x3[..., 2], np.sqrt(x3[..., 0]**2 + x3[..., 1]**2))
+
+  # y axis after the yaw, and z axis after the yaw and pitch
+  sin_psi, cos_psi = np.sin(psi), np.cos(psi)
+  sin_theta, cos_theta = np.sin(theta), np.cos(theta)
+  y3_dot_y2 = -y3[..., 0] * sin_psi + y3[..., 1] * cos_psi
+  y3_dot_z2 = y3[..., 0] * cos_psi * sin_theta + y3[..., 1] * sin_psi * sin_theta + y3[..., 2] * cos_theta
+  phi = np.arctan2(y3_dot_z2, y3_dot_y2)
+  return np.stack([phi, theta, psi], axis=-1)
+
+
+def _ned2ecef_matrix_from_ecef(ecef_init):
+  geodetic = ecef2geodetic(ecef_init)
+  return ned2ecef_matrix(np.radians(geodetic[..., 0]), np.radians(geodetic[..., 1]))
+
+
+def ecef_euler_from_ned(ecef_init, ned_pose):
+  """
+  ecef_euler_from_ned_single on the last axis of ned_pose. Single poses use the same formulation as batches, so the
+  result doesn't depend on batching, it's also faster than ecef_euler_from_ned_single for one pose.
+  """
+  ned_pose = _as_array(ned_pose, (3,))
+  return _euler_from_axes(_ned2ecef_matrix_from_ecef(ecef_init) @ euler2rot(ned_pose))
+
+
+def ned_euler_from_ecef(ecef_init, ecef_pose):
+  """
+  ned_euler_from_ecef_single on the last axis of ecef_pose, with the same formulation for single poses and batches.
+  """
+  ecef_pose = _as_array(ecef_pose, (3,))
+  return _euler_from_axes(np.swapaxes(_ned2ecef_matrix_from_ecef(ecef_init), -1, -2) @ euler2rot(ecef_pose))
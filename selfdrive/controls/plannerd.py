@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+from collections.abc import Callable
+
 from cereal import car
 from openpilot.common.params import Params
 from openpilot.common.realtime import Priority, config_realtime_process
@@ -8,9 +10,7 @@ from openpilot.selfdrive.controls.lib.longitudinal_planner import LongitudinalPl
 import cereal.messaging as messaging
 
 
-def main():
-  config_realtime_process(5, Priority.CTRL_LOW)
-
+def setup(sub_master=messaging.SubMaster, pub_master=messaging.PubMaster) -> tuple[messaging.SubMaster, messaging.PubMaster, Callable[[], None]]:
   cloudlog.info("plannerd is waiting for CarParams")
   params = Params()
   CP = messaging.log_from_bytes(params.get("CarParams", block=True), car.CarParams)
@@ -18,12 +18,11 @@ def main():
 
   ldw = LaneDepartureWarning()
   longitudinal_planner = LongitudinalPlanner(CP)
-  pm = messaging.PubMaster(['longitudinalPlan', 'driverAssistance'])
-  sm = messaging.SubMaster(['carControl', 'carState', 'controlsState', 'liveParameters', 'radarState', 'modelV2', 'selfdriveState'],
-                           poll='modelV2')
+  pm = pub_master(['longitudinalPlan', 'driverAssistance'])
+  sm = sub_master(['carControl', 'carState', 'controlsState', 'liveParameters', 'radarState', 'modelV2', 'selfdriveState'],
+                  poll='modelV2')
 
-  while True:
-    sm.update()
+  def step() -> None:
     if sm.updated['modelV2']:
       longitudinal_planner.update(sm)
       longitudinal_planner.publish(sm, pm)
@@ -35,6 +34,17 @@ def main():
       msg.driverAssistance.rightLaneDeparture = ldw.right
       pm.send('driverAssistance', msg)
 
+  return sm, pm, step
+
+
+def main():
+  config_realtime_process(5, Priority.CTRL_LOW)
+
+  sm, _, step = setup()
+  while True:
+    sm.update()
+    step()
+
 
 if __name__ == "__main__":
   main()
@@ -2,6 +2,7 @@
 import math
 import numpy as np
 from collections import deque
+from collections.abc import Callable
 from typing import Any
 
 import capnp
@@ -10,7 +11,7 @@ from openpilot.common.filter_simple import FirstOrderFilter
 from openpilot.common.params import Params
 from openpilot.common.realtime import DT_MDL, Priority, config_realtime_process
 from openpilot.common.swaglog import cloudlog
-from openpilot.common.simple_kalman import KF1D
+from openpilot.common.simple_kalman import KF1DBatch, get_steady_state_gain
 
 
 # Default lead acceleration decay set to 50% at 1s
@@ -26,88 +27,99 @@ RADAR_TO_CENTER = 2.7   # (deprecated) RADAR is ~ 2.7m ahead from center of car
 RADAR_TO_CAMERA = 1.52  # RADAR is ~ 1.5m ahead from center of mesh frame
 
 
+# Lead Kalman Filter params, the steady state gain K for values of radar_ts between 0.01s and 0.2s. Rounded to
+# 8 digits, like the table it was hardcoded as, so radarState doesn't change
+KALMAN_DTS = [i * 0.01 for i in range(1, 21)]
+KALMAN_K = np.round([get_steady_state_gain([[1.0, dt], [0.0, 1.0]], [1.0, 0.0], np.diag([10., 100.]), 1e3)[:, 0] for dt in KALMAN_DTS], 8)
+
+
 class KalmanParams:
   def __init__(self, dt: float):
-    # Lead Kalman Filter params, calculating K from A, C, Q, R requires the control library.
-    # hardcoding a lookup table to compute K for values of radar_ts between 0.01s and 0.2s
+    # K is interpolated in the table
     assert dt > .01 and dt < .2, "Radar time step must be between .01s and 0.2s"
     self.A = [[1.0, dt], [0.0, 1.0]]
     self.C = [1.0, 0.0]
-    #Q = np.matrix([[10., 0.0], [0.0, 100.]])
-    #R = 1e3
-    #K = np.matrix([[ 0.05705578], [ 0.03073241]])
-    dts = [i * 0.01 for i in range(1, 21)]
-    K0 = [0.12287673, 0.14556536, 0.16522756, 0.18281627, 0.1988689,  0.21372394,
-          0.22761098, 0.24069424, 0.253096,   0.26491023, 0.27621103, 0.28705801,
-          0.29750003, 0.30757767, 0.31732515, 0.32677158, 0.33594201, 0.34485814,
-          0.35353899, 0.36200124]
-    K1 = [0.29666309, 0.29330885, 0.29042818, 0.28787125, 0.28555364, 0.28342219,
-          0.28144091, 0.27958406, 0.27783249, 0.27617149, 0.27458948, 0.27307714,
-          0.27162685, 0.27023228, 0.26888809, 0.26758976, 0.26633338, 0.26511557,
-          0.26393339, 0.26278425]
-    self.K = [[np.interp(dt, dts, K0)], [np.interp(dt, dts, K1)]]
-
-
-class Track:
-  def __init__(self, identifier: int, v_lead: float, kalman_params: KalmanParams):
-    self.identifier = identifier
-    self.cnt = 0
-    self.aLeadTau = FirstOrderFilter(_LEAD_ACCEL_TAU, 0.45, DT_MDL)
-    self.K_A = kalman_params.A
-    self.K_C = kalman_params.C
-    self.K_K = kalman_params.K
-    self.kf = KF1D([[v_lead], [0.0]], self.K_A, self.K_C, self.K_K)
-
-  def update(self, d_rel: float, y_rel: float, v_rel: float, v_lead: float, measured: float):
-    # relative values, copy
-    self.dRel = d_rel   # LONG_DIST
-    self.yRel = y_rel   # -LAT_DIST
-    self.vRel = v_rel   # REL_SPEED
-    self.vLead = v_lead
-    self.measured = measured   # measured or estimate
-
-    # computed velocity and accelerations
-    if self.cnt > 0:
-      self.kf.update(self.vLead)
-
-    self.vLeadK = float(self.kf.x[SPEED][0])
-    self.aLeadK = float(self.kf.x[ACCEL][0])
+    self.K = [[np.interp(dt, KALMAN_DTS, KALMAN_K[:, 0])], [np.interp(dt, KALMAN_DTS, KALMAN_K[:, 1])]]
+
+
+class Tracks:
+  """
+  Bank of radar tracks, one entry per track in each array, kept in the order the tracks were first seen.
+  The Kalman filters of all tracks are one KF1DBatch, and their aLeadTau filters are updated together with the
+  same arithmetic as FirstOrderFilter, so the results are identical to filtering each track on its own.
+  """
+  def __init__(self, kalman_params: KalmanParams):
+    self.kf = KF1DBatch(np.zeros((2, 0)), kalman_params.A, kalman_params.C, kalman_params.K)
+    self.a_lead_tau_alpha = FirstOrderFilter(_LEAD_ACCEL_TAU, 0.45, DT_MDL).alpha
+
+    self.ids: list[int] = []
+    self.cnt = np.zeros(0, dtype=np.int64)
+    self.vLeadK = np.zeros(0)  # Kalman filter state, same as self.kf.x
+    self.aLeadK = np.zeros(0)
+    self.aLeadTau = np.zeros(0)
+    self.dRel = np.zeros(0)
+    self.yRel = np.zeros(0)
+    self.vRel = np.zeros(0)
+    self.vLead = np.zeros(0)
+    self.measured = np.zeros(0, dtype=bool)
+
+  def __len__(self) -> int:
+    return len(self.ids)
+
+  def update(self, ar_pts: dict[int, tuple[float, float, float, bool]], v_ego: float):
+    # *** remove missing points, new points are appended ***
+    keep = np.fromiter((i in ar_pts for i in self.ids), dtype=bool, count=len(self.ids))
+    known = set(self.ids)
+    new_ids = [i for i in ar_pts if i not in known]
+    num_new = len(new_ids)
+    self.ids = [i for i in self.ids if i in ar_pts] + new_ids
+    pts = np.array([ar_pts[i] for i in self.ids], dtype=np.float64).reshape(len(self.ids), 4)
+    d_rel, y_rel, v_rel, measured = pts.T
+
+    # align v_ego by a fixed time to align it with the radar measurement
+    v_lead = v_rel + v_ego
+
+    # new tracks start at the measured speed
+    self.kf.set_x((np.concatenate((self.vLeadK[keep], v_lead[len(v_lead) - num_new:])),
+                   np.concatenate((self.aLeadK[keep], np.zeros(num_new)))))
+    a_lead_tau = np.concatenate((self.aLeadTau[keep], np.full(num_new, _LEAD_ACCEL_TAU)))
+    cnt = np.concatenate((self.cnt[keep], np.zeros(num_new, dtype=np.int64)))
+
+    # computed velocity and accelerations, new tracks are only filtered from their second measurement
+    self.vLeadK, self.aLeadK = self.kf.update(v_lead, where=cnt > 0)
 
     # Learn if constant acceleration
-    if abs(self.aLeadK) < 0.5:
-      self.aLeadTau.x = _LEAD_ACCEL_TAU
-    else:
-      self.aLeadTau.update(0.0)
+    alpha = self.a_lead_tau_alpha
+    self.aLeadTau = np.where(np.abs(self.aLeadK) < 0.5, _LEAD_ACCEL_TAU, (1. - alpha) * a_lead_tau + alpha * 0.0)
 
-    self.cnt += 1
+    self.cnt = cnt + 1
+    self.dRel, self.yRel, self.vRel, self.vLead = d_rel, y_rel, v_rel, v_lead
+    self.measured = measured.astype(bool)
 
-  def get_RadarState(self, model_prob: float = 0.0):
+  def get_RadarState(self, i: int, model_prob: float = 0.0):
     return {
-      "dRel": float(self.dRel),
-      "yRel": float(self.yRel),
-      "vRel": float(self.vRel),
-      "vLead": float(self.vLead),
-      "vLeadK": float(self.vLeadK),
-      "aLeadK": float(self.aLeadK),
-      "aLeadTau": float(self.aLeadTau.x),
+      "dRel": float(self.dRel[i]),
+      "yRel": float(self.yRel[i]),
+      "vRel": float(self.vRel[i]),
+      "vLead": float(self.vLead[i]),
+      "vLeadK": float(self.vLeadK[i]),
+      "aLeadK": float(self.aLeadK[i]),
+      "aLeadTau": float(self.aLeadTau[i]),
       "status": True,
-      "fcw": self.is_potential_fcw(model_prob),
+      "fcw": is_potential_fcw(model_prob),
       "modelProb": model_prob,
       "radar": True,
-      "radarTrackId": self.identifier,
+      "radarTrackId": self.ids[i],
     }
 
-  def potential_low_speed_lead(self, v_ego: float):
+  def potential_low_speed_lead(self, v_ego: float) -> np.ndarray:
     # stop for stuff in front of you and low speed, even without model confirmation
     # Radar points closer than 0.75, are almost always glitches on toyota radars
-    return abs(self.yRel) < 1.0 and (v_ego < V_EGO_STATIONARY) and (0.75 < self.dRel < 25)
+    return (np.abs(self.yRel) < 1.0) & (v_ego < V_EGO_STATIONARY) & (0.75 < self.dRel) & (self.dRel < 25)
 
-  def is_potential_fcw(self, model_prob: float):
-    return model_prob > .9
 
-  def __str__(self):
-    ret = f"x: {self.dRel:4.1f}  y: {self.yRel:4.1f}  v: {self.vRel:4.1f}  a: {self.aLeadK:4.1f}"
-    return ret
+def is_potential_fcw(model_prob: float):
+  return model_prob > .9
 
 
 def laplacian_pdf(x: float, mu: float, b: float):
@@ -115,25 +127,31 @@ def laplacian_pdf(x: float, mu: float, b: float):
   return math.exp(-abs(x-mu)/b)
 
 
-def match_vision_to_track(v_ego: float, lead: capnp._DynamicStructReader, tracks: dict[int, Track]):
+def match_vision_to_track(v_ego: float, lead: capnp._DynamicStructReader, tracks: Tracks) -> int | None:
   offset_vision_dist = lead.x[0] - RADAR_TO_CAMERA
+  x_std, y_std, v_std = max(lead.xStd[0], 1e-4), max(lead.yStd[0], 1e-4), max(lead.vStd[0], 1e-4)
 
-  def prob(c):
-    prob_d = laplacian_pdf(c.dRel, offset_vision_dist, lead.xStd[0])
-    prob_y = laplacian_pdf(c.yRel, -lead.y[0], lead.yStd[0])
-    prob_v = laplacian_pdf(c.vRel + v_ego, lead.v[0], lead.vStd[0])
+  def prob(i):
+    prob_d = laplacian_pdf(tracks.dRel[i], offset_vision_dist, x_std)
+    prob_y = laplacian_pdf(tracks.yRel[i], -lead.y[0], y_std)
+    prob_v = laplacian_pdf(tracks.vRel[i] + v_ego, lead.v[0], v_std)
 
     # This isn't exactly right, but it's a good heuristic
     return prob_d * prob_y * prob_v
 
-  track = max(tracks.values(), key=prob)
+  probs = np.exp(-np.abs(tracks.dRel - offset_vision_dist) / x_std) * \
+          np.exp(-np.abs(tracks.yRel - -lead.y[0]) / y_std) * \
+          np.exp(-np.abs(tracks.vRel + v_ego - lead.v[0]) / v_std)
+  # np.exp can differ from math.exp in the last bit, settle near ties like the scalar version would
+  candidates = np.flatnonzero(probs >= probs.max() * (1 - 1e-9))
+  i = int(candidates[0]) if len(candidates) == 1 else max(candidates.tolist(), key=prob)
 
   # if no 'sane' match is found return -1
   # stationary radar points can be false positives
-  dist_sane = abs(track.dRel - offset_vision_dist) < max([(offset_vision_dist)*.25, 5.0])
-  vel_sane = (abs(track.vRel + v_ego - lead.v[0]) < 10) or (v_ego + track.vRel > 3)
+  dist_sane = abs(tracks.dRel[i] - offset_vision_dist) < max([(offset_vision_dist)*.25, 5.0])
+  vel_sane = (abs(tracks.vRel[i] + v_ego - lead.v[0]) < 10) or (v_ego + tracks.vRel[i] > 3)
   if dist_sane and vel_sane:
-    return track
+    return i
   else:
     return None
 
@@ -156,7 +174,7 @@ def get_RadarState_from_vision(lead_msg: capnp._DynamicStructReader, v_ego: floa
   }
 
 
-def get_lead(v_ego: float, ready: bool, tracks: dict[int, Track], lead_msg: capnp._DynamicStructReader,
+def get_lead(v_ego: float, ready: bool, tracks: Tracks, lead_msg: capnp._DynamicStructReader,
              model_v_ego: float, low_speed_override: bool = True) -> dict[str, Any]:
   # Determine leads, this is where the essential logic happens
   if len(tracks) > 0 and ready and lead_msg.prob > .5:
@@ -166,18 +184,18 @@ def get_lead(v_ego: float, ready: bool, tracks: dict[int, Track], lead_msg: capn
 
   lead_dict = {'status': False}
   if track is not None:
-    lead_dict = track.get_RadarState(lead_msg.prob)
+    lead_dict = tracks.get_RadarState(track, lead_msg.prob)
   elif (track is None) and ready and (lead_msg.prob > .5):
     lead_dict = get_RadarState_from_vision(lead_msg, v_ego, model_v_ego)
 
   if low_speed_override:
-    low_speed_tracks = [c for c in tracks.values() if c.potential_low_speed_lead(v_ego)]
+    low_speed_tracks = np.flatnonzero(tracks.potential_low_speed_lead(v_ego))
     if len(low_speed_tracks) > 0:
-      closest_track = min(low_speed_tracks, key=lambda c: c.dRel)
+      closest_track = int(low_speed_tracks[np.argmin(tracks.dRel[low_speed_tracks])])
 
       # Only choose new track if it is actually closer than the previous one
-      if (not lead_dict['status']) or (closest_track.dRel < lead_dict['dRel']):
-        lead_dict = closest_track.get_RadarState()
+      if (not lead_dict['status']) or (tracks.dRel[closest_track] < lead_dict['dRel']):
+        lead_dict = tracks.get_RadarState(closest_track)
 
   return lead_dict
 
@@ -186,8 +204,8 @@ class RadarD:
   def __init__(self, delay: float = 0.0):
     self.current_time = 0.0
 
-    self.tracks: dict[int, Track] = {}
     self.kalman_params = KalmanParams(DT_MDL)
+    self.tracks = Tracks(self.kalman_params)
 
     self.v_ego = 0.0
     self.v_ego_hist = deque([0.0], maxlen=int(round(delay / DT_MDL))+1)
@@ -207,24 +225,9 @@ class RadarD:
       self.v_ego_hist.append(self.v_ego)
       self.last_v_ego_frame = sm.recv_frame['carState']
 
-    ar_pts = {pt.trackId: [pt.dRel, pt.yRel, pt.vRel, pt.measured] for pt in rr.points}
-
-    # *** remove missing points from meta data ***
-    for ids in list(self.tracks.keys()):
-      if ids not in ar_pts:
-        self.tracks.pop(ids, None)
-
     # *** compute the tracks ***
-    for ids in ar_pts:
-      rpt = ar_pts[ids]
-
-      # align v_ego by a fixed time to align it with the radar measurement
-      v_lead = rpt[2] + self.v_ego_hist[0]
-
-      # create the track if it doesn't exist or it's a new track
-      if ids not in self.tracks:
-        self.tracks[ids] = Track(ids, v_lead, self.kalman_params)
-      self.tracks[ids].update(rpt[0], rpt[1], rpt[2], v_lead, rpt[3])
+    ar_pts = {pt.trackId: (pt.dRel, pt.yRel, pt.vRel, pt.measured) for pt in rr.points}
+    self.tracks.update(ar_pts, self.v_ego_hist[0])
 
     # *** publish radarState ***
     self.radar_state_valid = sm.all_checks()
@@ -245,33 +248,40 @@ class RadarD:
   def publish(self, pm: messaging.PubMaster):
     assert self.radar_state is not None
 
-    radar_msg = messaging.new_message("radarState")
+    radar_msg = pm.new_message("radarState")
     radar_msg.valid = self.radar_state_valid
     radar_msg.radarState = self.radar_state
     pm.send("radarState", radar_msg)
 
 
 # fuses camera and radar data for best lead detection
-def main() -> None:
-  config_realtime_process(5, Priority.CTRL_LOW)
-
+def setup(sub_master=messaging.SubMaster, pub_master=messaging.PubMaster) -> tuple[messaging.SubMaster, messaging.PubMaster, Callable[[], None]]:
   # wait for stats about the car to come in from controls
   cloudlog.info("radard is waiting for CarParams")
   CP = messaging.log_from_bytes(Params().get("CarParams", block=True), car.CarParams)
   cloudlog.info("radard got CarParams")
 
   # *** setup messaging
-  sm = messaging.SubMaster(['modelV2', 'carState', 'liveTracks'], poll='modelV2')
-  pm = messaging.PubMaster(['radarState'])
+  sm = sub_master(['modelV2', 'carState', 'liveTracks'], poll='modelV2')
+  pm = pub_master(['radarState'])
 
   RD = RadarD(CP.radarDelay)
 
-  while 1:
-    sm.update()
-
+  def step() -> None:
     RD.update(sm, sm['liveTracks'])
     RD.publish(pm)
 
+  return sm, pm, step
+
+
+def main() -> None:
+  config_realtime_process(5, Priority.CTRL_LOW)
+
+  sm, _, step = setup()
+  while 1:
+    sm.update()
+    step()
+
 
 if __name__ == "__main__":
   main()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from openpilot.selfdrive.controls.radard import KALMAN_DTS, KALMAN_K, KalmanParams
+
+# the gains radard had hardcoded, for radar_ts of 0.01s to 0.2s
+K0 = [0.12287673, 0.14556536, 0.16522756, 0.18281627, 0.1988689, 0.21372394,
+      0.22761098, 0.24069424, 0.253096, 0.26491023, 0.27621103, 0.28705801,
+      0.29750003, 0.30757767, 0.31732515, 0.32677158, 0.33594201, 0.34485814,
+      0.35353899, 0.36200124]
+K1 = [0.29666309, 0.29330885, 0.29042818, 0.28787125, 0.28555364, 0.28342219,
+      0.28144091, 0.27958406, 0.27783249, 0.27617149, 0.27458948, 0.27307714,
+      0.27162685, 0.27023228, 0.26888809, 0.26758976, 0.26633338, 0.26511557,
+      0.26393339, 0.26278425]
+
+
+class TestKalmanParams:
+  def test_gain_table(self):
+    # the solved gains match the hardcoded table to 8 digits, so radarState doesn't change
+    np.testing.assert_array_equal(KALMAN_K[:, 0], K0)
+    np.testing.assert_array_equal(KALMAN_K[:, 1], K1)
+
+  def test_interpolated_gain(self):
+    for dt in np.linspace(0.011, 0.199, 50):
+      K = KalmanParams(dt).K
+      assert K == [[np.interp(dt, KALMAN_DTS, K0)], [np.interp(dt, KALMAN_DTS, K1)]]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import time
+
+import numpy as np
+
+from openpilot.selfdrive.locationd.calibrationd import Calibrator
+from openpilot.tools.lib.logreader import LogReader
+from openpilot.tools.plotjuggler.juggle import DEMO_ROUTE
+
+SERVICES = ['cameraOdometry', 'carState']
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per cameraOdometry cost of calibrationd over a route, calibrating from scratch')
+  parser.add_argument('route', nargs='?', default=DEMO_ROUTE)
+  args = parser.parse_args()
+
+  lr = list(LogReader(args.route))
+  CP = next(m.carParams for m in lr if m.which() == 'carParams')
+  msgs = sorted((m for m in lr if m.which() in SERVICES), key=lambda m: m.logMonoTime)
+
+  calibrator = Calibrator(param_put=False)
+  calibrator.not_car = CP.notCar
+  # the liveCalibration digest only depends on the inputs, compare it between commits to check the output didn't change
+  digest = hashlib.sha256()
+
+  ets, accepted_ets = [], []
+  for msg in msgs:
+    if msg.which() == 'carState':
+      calibrator.handle_v_ego(msg.carState.vEgo)
+      continue
+
+    cam_odom = msg.cameraOdometry
+    start_t = time.process_time_ns()
+    new_rpy = calibrator.handle_cam_odom(cam_odom.trans, cam_odom.rot, cam_odom.wideFromDeviceEuler, cam_odom.transStd,
+                                         cam_odom.roadTransformTrans, cam_odom.roadTransformTransStd)
+    ets.append((time.process_time_ns() - start_t) * 1e-3)
+    # only accepted inputs update the blocks and the status
+    if new_rpy is not None:
+      accepted_ets.append(ets[-1])
+
+    # 4Hz driven by cameraOdometry
+    if len(ets) % 5 == 0:
+      digest.update(str(calibrator.get_msg(True).liveCalibration.to_dict()).encode())
+
+  print(f'{len(ets)} cameraOdometry msgs, {len(accepted_ets)} accepted, {calibrator.valid_blocks} valid blocks, status {calibrator.cal_status}')
+  print(f'handle_cam_odom: {np.mean(ets):.1f} mean us, {np.percentile(ets, 99):.1f} p99 us')
+  if accepted_ets:
+    print(f'handle_cam_odom accepted: {np.mean(accepted_ets):.1f} mean us, {np.percentile(accepted_ets, 99):.1f} p99 us')
+  print(f'liveCalibration digest: {digest.hexdigest()[:16]}')
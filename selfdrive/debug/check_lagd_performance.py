@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import numpy as np
+
+from cereal.services import SERVICE_LIST
+from openpilot.selfdrive.locationd.lagd import LateralLagEstimator, CORR_BORDER_OFFSET, MAX_LAG, fft_next_good_size, masked_normalized_cross_correlation
+from openpilot.tools.lib.logreader import LogReader
+from openpilot.tools.plotjuggler.juggle import DEMO_ROUTE
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per livePose cost of lagd over a route, and the sliding correlation against the FFT one')
+  parser.add_argument('route', nargs='?', default=DEMO_ROUTE)
+  args = parser.parse_args()
+
+  lr = list(LogReader(args.route))
+  CP = next(m.carParams for m in lr if m.which() == 'carParams')
+  msgs = sorted((m for m in lr if m.which() in LateralLagEstimator.inputs), key=lambda m: m.logMonoTime)
+
+  dt = 1. / SERVICE_LIST['livePose'].frequency
+  estimator = LateralLagEstimator(CP, dt)
+  num_lags = int(MAX_LAG / dt) + 2 * CORR_BORDER_OFFSET
+
+  points_ets, estimate_ets, fft_ets, ncc_diffs, lag_diffs = [], [], [], [], []
+  for msg in msgs:
+    which = msg.which()
+    estimator.handle_log(msg.logMonoTime * 1e-9, which, getattr(msg, which))
+    if which != 'livePose':
+      continue
+
+    start_t = time.process_time_ns()
+    estimator.update_points()
+    points_ets.append((time.process_time_ns() - start_t) * 1e-3)
+
+    # 4Hz driven by livePose
+    if len(points_ets) % 5 == 0:
+      start_t = time.process_time_ns()
+      estimator.update_estimate()
+      estimate_ets.append((time.process_time_ns() - start_t) * 1e-3)
+
+      # what update_estimate did before, for the same window
+      _, desired, actual, okay = estimator.points.get()
+      start_t = time.process_time_ns()
+      fft_delay = estimator.actuator_delay(desired.copy(), actual.copy(), okay, dt, MAX_LAG)
+      fft_ets.append((time.process_time_ns() - start_t) * 1e-3)
+
+      if okay.any():
+        roi_start = len(desired) - 1 - CORR_BORDER_OFFSET
+        fft_ncc = masked_normalized_cross_correlation(desired.copy(), actual.copy(), okay, fft_next_good_size(len(desired) + int(MAX_LAG / dt)))
+        ncc_diffs.append(np.abs(fft_ncc[roi_start:roi_start + num_lags] - estimator.points.ncc()).max())
+        lag_diffs.append(np.abs(np.subtract(estimator.lag_from_ncc(estimator.points.ncc(), dt), fft_delay)).max())
+
+  print(f'{len(points_ets)} livePose msgs, {estimator.block_avg.valid_blocks} valid blocks, lag {estimator.block_avg.get()[2]:.3f} s')
+  print(f'update_points: {np.mean(points_ets):.1f} mean us, {np.percentile(points_ets, 99):.1f} p99 us')
+  print(f'update_estimate: {np.mean(estimate_ets):.1f} mean us, {np.percentile(estimate_ets, 99):.1f} p99 us (FFT estimate {np.mean(fft_ets):.1f} mean us)')
+  print(f'max difference to the FFT correlation: ncc {max(ncc_diffs, default=0):.2e}, lag/corr/confidence {max(lag_diffs, default=0):.2e}')
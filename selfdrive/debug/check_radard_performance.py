@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import time
+
+import capnp
+import numpy as np
+
+import cereal.messaging as messaging
+from openpilot.selfdrive.controls.radard import RadarD
+from openpilot.selfdrive.test.process_replay.process_replay import ReplaySubMaster
+from openpilot.tools.lib.logreader import LogReader
+from openpilot.tools.plotjuggler.juggle import DEMO_ROUTE
+
+SERVICES = ['modelV2', 'carState', 'liveTracks']
+
+
+def scale_tracks(msg: capnp._DynamicStructReader, num_tracks: int) -> capnp._DynamicStructReader:
+  """Copies of the recorded points, shifted further away, until there are num_tracks points"""
+  points = msg.liveTracks.points
+  if len(points) == 0:
+    return msg
+
+  dat = messaging.new_message('liveTracks', logMonoTime=msg.logMonoTime, valid=msg.valid)
+  dat.liveTracks.errors = msg.liveTracks.errors
+  new_points = dat.liveTracks.init('points', num_tracks)
+  for i, pt in enumerate(new_points):
+    copy, src = divmod(i, len(points))
+    pt.trackId = points[src].trackId + 1000 * copy
+    pt.dRel = points[src].dRel + 10. * copy
+    pt.yRel = points[src].yRel
+    pt.vRel = points[src].vRel
+    pt.measured = points[src].measured
+  return dat.as_reader()
+
+
+def run(msgs: list[capnp._DynamicStructReader], radar_delay: float) -> tuple[list[float], str, float]:
+  sm = ReplaySubMaster(SERVICES, poll='modelV2')
+  RD = RadarD(radar_delay)
+  digest = hashlib.sha256()
+
+  ets, num_tracks = [], []
+  for msg in msgs:
+    sm.update_msgs(msg.logMonoTime * 1e-9, [msg])
+    if not sm.updated['modelV2']:
+      continue
+
+    start_t = time.process_time_ns()
+    RD.update(sm, sm['liveTracks'])
+    ets.append((time.process_time_ns() - start_t) * 1e-3)
+    num_tracks.append(len(RD.tracks))
+    digest.update(RD.radar_state.to_bytes())
+  return ets, digest.hexdigest()[:16], float(np.mean(num_tracks))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per frame cost of radard over recorded liveTracks, scaled to more tracks')
+  parser.add_argument('route', nargs='?', default=DEMO_ROUTE)
+  parser.add_argument('--tracks', type=int, nargs='*', default=[16, 32, 64], help='Track counts to scale liveTracks to')
+  args = parser.parse_args()
+
+  lr = list(LogReader(args.route))
+  CP = next(m.carParams for m in lr if m.which() == 'carParams')
+  msgs = sorted((m for m in lr if m.which() in SERVICES), key=lambda m: m.logMonoTime)
+
+  # the radarState digest only depends on the inputs, compare it between commits to check the output didn't change
+  print(f"{'tracks':>8} {'mean us':>9} {'p99 us':>9} {'max us':>9}  radarState digest")
+  for num_tracks in [None, *args.tracks]:
+    scaled = msgs if num_tracks is None else [scale_tracks(m, num_tracks) if m.which() == 'liveTracks' else m for m in msgs]
+    ets, digest, mean_tracks = run(scaled, CP.radarDelay)
+    print(f"{mean_tracks:>8.1f} {np.mean(ets):9.1f} {np.percentile(ets, 99):9.1f} {max(ets):9.1f}  {digest}")
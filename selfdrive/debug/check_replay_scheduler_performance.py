@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import time
+
+from openpilot.selfdrive.test.process_replay.process_replay import ReplayQueue
+
+SEGMENT_SIZES = [10_000, 100_000, 1_000_000]
+DT_NS = int(1e7)  # 100 Hz of log messages
+PROCESSING_TIME_NS = int(4e6)
+OUTPUT_EVERY = 5  # replayed process publishes once every N input messages
+
+
+class FakeMsg:
+  __slots__ = ('logMonoTime',)
+
+  def __init__(self, log_mono_time: int):
+    self.logMonoTime = log_mono_time
+
+
+def run(n_msgs: int) -> tuple[float, int]:
+  queue = ReplayQueue(FakeMsg(i * DT_NS) for i in range(n_msgs))
+
+  popped = 0
+  start_t = time.process_time_ns()
+  while queue.has_external or queue.internal_count != 0:
+    msg, external = queue.pop()
+    if external and popped % OUTPUT_EVERY == 0:
+      queue.push(FakeMsg(msg.logMonoTime + PROCESSING_TIME_NS))
+    popped += 1
+  return (time.process_time_ns() - start_t) / popped, popped
+
+
+if __name__ == '__main__':
+  print("scheduling overhead of process_replay, independent of the replayed processes")
+  for n in SEGMENT_SIZES:
+    ns_per_msg, popped = run(n)
+    print(f'{n:>9} log msgs, {popped:>9} scheduled msgs: {ns_per_msg:.0f} ns / msg')
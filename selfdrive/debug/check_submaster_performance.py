@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import time
+
+import cereal.messaging as messaging
+from cereal.services import SERVICE_LIST
+
+SERVICE_COUNTS = [1, 5, 10, 20]
+N_UPDATES = 1000
+
+
+def get_services(n: int) -> list[str]:
+  services = []
+  for s in sorted(SERVICE_LIST):
+    try:
+      messaging.new_message(s)
+    except Exception:
+      continue
+    if SERVICE_LIST[s].frequency > 1:
+      services.append(s)
+  return services[:n]
+
+
+def run(services: list[str], lazy_decode: bool, access: bool) -> float:
+  pm = messaging.PubMaster(services)
+  sm = messaging.SubMaster(services, lazy_decode=lazy_decode)
+  dats = {s: messaging.new_message(s).to_bytes() for s in services}
+
+  total_ns = 0
+  for _ in range(N_UPDATES):
+    for s, dat in dats.items():
+      pm.send(s, dat)
+
+    start_t = time.process_time_ns()
+    sm.update(0)
+    if access:
+      for s in services:
+        sm[s]
+    total_ns += time.process_time_ns() - start_t
+  return total_ns / N_UPDATES
+
+
+if __name__ == '__main__':
+  print("cost of SubMaster.update() with every service updated, and optionally read")
+  print(f"{'services':>8} {'eager':>10} {'lazy':>10} {'eager+read':>12} {'lazy+read':>12}")
+  for n in SERVICE_COUNTS:
+    services = get_services(n)
+    times = [run(services, lazy_decode, access) for access in (False, True) for lazy_decode in (False, True)]
+    print(f"{len(services):>8}" + "".join(f" {t / 1e3:{w}.1f}us" for t, w in zip(times, (8, 8, 10, 10), strict=True)))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import numpy as np
+
+from openpilot.selfdrive.locationd.torqued import TorqueEstimator, STEER_BUCKET_BOUNDS, POINTS_PER_BUCKET
+from openpilot.tools.lib.logreader import LogReader
+from openpilot.tools.plotjuggler.juggle import DEMO_ROUTE
+
+SERVICES = ['carControl', 'carOutput', 'carState', 'liveCalibration', 'livePose', 'liveDelay']
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per livePose cost of torqued over a route')
+  parser.add_argument('route', nargs='?', default=DEMO_ROUTE)
+  parser.add_argument('--fill', action='store_true', help='Start with full point buckets')
+  args = parser.parse_args()
+
+  lr = list(LogReader(args.route))
+  CP = next(m.carParams for m in lr if m.which() == 'carParams')
+  msgs = sorted((m for m in lr if m.which() in SERVICES), key=lambda m: m.logMonoTime)
+
+  estimator = TorqueEstimator(CP)
+  if args.fill:
+    rng = np.random.default_rng(0)
+    for low, high in STEER_BUCKET_BOUNDS:
+      for x in rng.uniform(low, high, POINTS_PER_BUCKET):
+        estimator.filtered_points.add_point(x, x + rng.normal(0, 0.1))
+
+  handle_ets, msg_ets = [], []
+  for msg in msgs:
+    which = msg.which()
+    start_t = time.process_time_ns()
+    estimator.handle_log(msg.logMonoTime * 1e-9, which, getattr(msg, which))
+    if which == 'livePose':
+      handle_ets.append((time.process_time_ns() - start_t) * 1e-3)
+      # 4Hz driven by livePose
+      if len(handle_ets) % 5 == 0:
+        start_t = time.process_time_ns()
+        estimator.get_msg()
+        msg_ets.append((time.process_time_ns() - start_t) * 1e-3)
+
+  print(f'{len(handle_ets)} livePose msgs, {len(estimator.filtered_points)} points in buckets')
+  print(f'handle_log(livePose): {np.mean(handle_ets):.1f} mean us, {np.percentile(handle_ets, 99):.1f} p99 us')
+  print(f'get_msg: {np.mean(msg_ets):.1f} mean us, {np.percentile(msg_ets, 99):.1f} p99 us')
+  print(f'per livePose: {(sum(handle_ets) + sum(msg_ets)) / len(handle_ets):.1f} us')
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import numpy as np
+
+import openpilot.common.transformations.transformations as tf
+from openpilot.common.transformations.coordinates import LocalCoord
+from openpilot.common.transformations.orientation import numpy_wrap
+
+
+def timed(f, *args) -> float:
+  start_t = time.process_time_ns()
+  f(*args)
+  return time.process_time_ns() - start_t
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Per row cost of the vectorised transformations, against looping the single versions')
+  parser.add_argument('--rows', type=int, default=1_000_000)
+  parser.add_argument('--loop-rows', type=int, default=20_000, help='Rows to time the looped single versions on, they are slow')
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(0)
+  eulers = rng.uniform(-np.pi, np.pi, (args.rows, 3))
+  quats = tf.euler2quat(eulers)
+  rots = tf.euler2rot(eulers)
+  geodetics = np.column_stack([rng.uniform(-80, 80, args.rows), rng.uniform(-180, 180, args.rows), rng.uniform(-100, 3000, args.rows)])
+  ecefs = tf.geodetic2ecef(geodetics)
+  ned = rng.normal(0, 100, (args.rows, 3))
+  local_coord = LocalCoord.from_ecef(ecefs[0])
+
+  # name, vectorised, single, inputs (the last one is batched)
+  cases = [
+    ('euler2quat', tf.euler2quat, tf.euler2quat_single, (3,), (4,), [eulers]),
+    ('quat2euler', tf.quat2euler, tf.quat2euler_single, (4,), (3,), [quats]),
+    ('quat2rot', tf.quat2rot, tf.quat2rot_single, (4,), (3, 3), [quats]),
+    ('rot2quat', tf.rot2quat, tf.rot2quat_single, (3, 3), (4,), [rots]),
+    ('euler2rot', tf.euler2rot, tf.euler2rot_single, (3,), (3, 3), [eulers]),
+    ('rot2euler', tf.rot2euler, tf.rot2euler_single, (3, 3), (3,), [rots]),
+    ('geodetic2ecef', tf.geodetic2ecef, tf.geodetic2ecef_single, (3,), (3,), [geodetics]),
+    ('ecef2geodetic', tf.ecef2geodetic, tf.ecef2geodetic_single, (3,), (3,), [ecefs]),
+    ('ecef_euler_from_ned', tf.ecef_euler_from_ned, tf.ecef_euler_from_ned_single, (3,), (3,), [ecefs[0], eulers]),
+    ('ned_euler_from_ecef', tf.ned_euler_from_ecef, tf.ned_euler_from_ecef_single, (3,), (3,), [ecefs[0], eulers]),
+    ('ecef2ned', local_coord.ecef2ned, tf.LocalCoord.ecef2ned_single, (3,), (3,), [local_coord, ecefs]),
+    ('ned2ecef', local_coord.ned2ecef, tf.LocalCoord.ned2ecef_single, (3,), (3,), [local_coord, ned]),
+    ('geodetic2ned', local_coord.geodetic2ned, tf.LocalCoord.geodetic2ned_single, (3,), (3,), [local_coord, geodetics]),
+    ('ned2geodetic', local_coord.ned2geodetic, tf.LocalCoord.ned2geodetic_single, (3,), (3,), [local_coord, ned]),
+  ]
+
+  print(f"{'':>20} {'ns/row':>9} {'looped ns/row':>14} {'speedup':>8}  ({args.rows} rows, looped on {min(args.loop_rows, args.rows)})")
+  for name, vectorised, single, input_shape, output_shape, inputs in cases:
+    *const, batch = inputs
+    # LocalCoord methods are bound, the single ones take the instance first
+    vectorised_args = [batch] if name in ('ecef2ned', 'ned2ecef', 'geodetic2ned', 'ned2geodetic') else [*const, batch]
+    vectorised_ns = timed(vectorised, *vectorised_args) / args.rows
+    looped_ns = timed(numpy_wrap(single, input_shape, output_shape), *const, batch[:args.loop_rows]) / min(args.loop_rows, args.rows)
+    print(f"{name:>20} {vectorised_ns:9.1f} {looped_ns:14.1f} {looped_ns / vectorised_ns:7.0f}x")
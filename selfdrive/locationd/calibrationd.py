@@ -9,6 +9,7 @@ and the image input into the neural network is not corrected for roll.
 import os
 import capnp
 import numpy as np
+from collections.abc import Callable
 from typing import NoReturn
 
 from cereal import log, car
@@ -120,6 +121,7 @@ class Calibrator:
     self.idx = 0
     self.block_idx = 0
     self.v_ego = 0.0
+    self.status_window: tuple[int, int] | None = None
 
     if smooth_from is None:
       self.old_rpy = RPY_INIT
@@ -135,17 +137,22 @@ class Calibrator:
     return before_current + after_current
 
   def update_status(self) -> None:
-    valid_idxs = self.get_valid_idxs()
-    if valid_idxs:
-      self.wide_from_device_euler = np.mean(self.wide_from_device_eulers[valid_idxs], axis=0)
-      self.height = np.mean(self.heights[valid_idxs], axis=0)
-      rpys = self.rpys[valid_idxs]
-      self.rpy = np.mean(rpys, axis=0)
-      max_rpy_calib = np.array(np.max(rpys, axis=0))
-      min_rpy_calib = np.array(np.min(rpys, axis=0))
-      self.calib_spread = np.abs(max_rpy_calib - min_rpy_calib)
-    else:
-      self.calib_spread = np.zeros(3)
+    # Only the current block gets new inputs, and it's excluded from the validity window,
+    # so the block statistics only change when a block is completed or on reset
+    status_window = (self.block_idx, self.valid_blocks)
+    if status_window != self.status_window:
+      self.status_window = status_window
+      valid_idxs = self.get_valid_idxs()
+      if valid_idxs:
+        self.wide_from_device_euler = np.mean(self.wide_from_device_eulers[valid_idxs], axis=0)
+        self.height = np.mean(self.heights[valid_idxs], axis=0)
+        rpys = self.rpys[valid_idxs]
+        self.rpy = np.mean(rpys, axis=0)
+        max_rpy_calib = np.array(np.max(rpys, axis=0))
+        min_rpy_calib = np.array(np.min(rpys, axis=0))
+        self.calib_spread = np.abs(max_rpy_calib - min_rpy_calib)
+      else:
+        self.calib_spread = np.zeros(3)
 
     if self.valid_blocks < INPUTS_NEEDED:
       if self.cal_status == log.LiveCalibrationData.Status.recalibrating:
@@ -258,11 +265,9 @@ class Calibrator:
     pm.send('liveCalibration', self.get_msg(valid))
 
 
-def main() -> NoReturn:
-  config_realtime_process([0, 1, 2, 3], 5)
-
-  pm = messaging.PubMaster(['liveCalibration'])
-  sm = messaging.SubMaster(['cameraOdometry', 'carState'], poll='cameraOdometry')
+def setup(sub_master=messaging.SubMaster, pub_master=messaging.PubMaster) -> tuple[messaging.SubMaster, messaging.PubMaster, Callable[[], None]]:
+  pm = pub_master(['liveCalibration'])
+  sm = sub_master(['cameraOdometry', 'carState'], poll='cameraOdometry')
 
   params_reader = Params()
   CP = messaging.log_from_bytes(params_reader.get("CarParams", block=True), car.CarParams)
@@ -270,10 +275,7 @@ def main() -> NoReturn:
   calibrator = Calibrator(param_put=True)
   calibrator.not_car = CP.notCar
 
-  while 1:
-    timeout = 0 if sm.frame == -1 else 100
-    sm.update(timeout)
-
+  def step() -> None:
     if sm.updated['cameraOdometry']:
       calibrator.handle_v_ego(sm['carState'].vEgo)
       new_rpy = calibrator.handle_cam_odom(sm['cameraOdometry'].trans,
@@ -290,6 +292,18 @@ def main() -> NoReturn:
     if sm.frame % 5 == 0:
       calibrator.send_data(pm, sm.all_checks())
 
+  return sm, pm, step
+
+
+def main() -> NoReturn:
+  config_realtime_process([0, 1, 2, 3], 5)
+
+  sm, _, step = setup()
+  while 1:
+    timeout = 0 if sm.frame == -1 else 100
+    sm.update(timeout)
+    step()
+
 
 if __name__ == "__main__":
   main()
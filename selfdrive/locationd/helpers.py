@@ -48,34 +48,103 @@ def rotate_cov(rot_matrix, cov_in):
 
 
 def rotate_std(rot_matrix, std_in):
-  return np.sqrt(np.diag(rotate_cov(rot_matrix, np.diag(std_in**2))))
+  # diagonal of rot_matrix @ diag(std_in**2) @ rot_matrix.T, also for stds stacked in rows
+  return np.sqrt(std_in**2 @ (rot_matrix**2).T)
 
 
 class NPQueue:
-  def __init__(self, maxlen: int, rowsize: int) -> None:
+  """Queue of rows with a fixed capacity, in a preallocated ring buffer. Once full, new rows overwrite the oldest."""
+  def __init__(self, maxlen: int, rowsize: int, buffer: np.ndarray | None = None) -> None:
     self.maxlen = maxlen
-    self.arr = np.empty((0, rowsize))
+    self.buffer = np.empty((maxlen, rowsize)) if buffer is None else buffer
+    self.count = 0
+    self.head = 0  # slot of the next row
 
   def __len__(self) -> int:
-    return len(self.arr)
+    return self.count
 
   def append(self, pt: list[float]) -> None:
-    if len(self.arr) < self.maxlen:
-      self.arr = np.append(self.arr, [pt], axis=0)
-    else:
-      self.arr[:-1] = self.arr[1:]
-      self.arr[-1] = pt
+    self.buffer[self.head] = pt
+    self.head = self.head + 1 if self.head + 1 < self.maxlen else 0
+    if self.count < self.maxlen:
+      self.count += 1
+
+  @property
+  def arr(self) -> np.ndarray:
+    """Rows from oldest to newest, a view of the buffer until it wraps around"""
+    if self.count < self.maxlen or self.head == 0:
+      return self.buffer[:self.count]
+    return np.concatenate((self.buffer[self.head:], self.buffer[:self.head]))
+
+
+class TimeSeries:
+  """
+  Last maxlen samples of one or more signals and their timestamps. Timestamps are appended in order, as np.interp
+  expects. Every sample is written twice, maxlen slots apart, so the history is always a contiguous view.
+  """
+  def __init__(self, maxlen: int, num_signals: int = 1) -> None:
+    self.maxlen = maxlen
+    self.data = np.zeros((num_signals + 1, 2 * maxlen))
+    self.count = 0
+    self.head = 0  # slot of the next sample
+
+  def __len__(self) -> int:
+    return self.count
+
+  def append(self, t: float, *values: float) -> None:
+    sample = (t, *values)
+    self.data[:, self.head] = sample
+    self.data[:, self.head + self.maxlen] = sample
+    self.head = self.head + 1 if self.head + 1 < self.maxlen else 0
+    if self.count < self.maxlen:
+      self.count += 1
+
+  def extend(self, samples: np.ndarray) -> None:
+    """Appends samples from oldest to newest, one column of timestamp and values per sample"""
+    samples = samples[:, -self.maxlen:]
+    num_samples = samples.shape[1]
+    slots = (self.head + np.arange(num_samples)) % self.maxlen
+    self.data[:, slots] = samples
+    self.data[:, slots + self.maxlen] = samples
+    self.head = (self.head + num_samples) % self.maxlen
+    self.count = min(self.count + num_samples, self.maxlen)
+
+  def fill(self, t: float, *values: float) -> None:
+    """Replaces the whole history with maxlen copies of one sample"""
+    self.data[:] = np.array((t, *values))[:, None]
+    self.count = self.maxlen
+
+  def _window(self) -> slice:
+    end = self.head + self.maxlen
+    return slice(end - self.count, end)
+
+  @property
+  def t(self) -> np.ndarray:
+    """Timestamps from oldest to newest"""
+    return self.data[0, self._window()]
+
+  @property
+  def values(self) -> np.ndarray:
+    """Samples from oldest to newest, one row per signal"""
+    return self.data[1:, self._window()]
+
+  def interp(self, t: float | np.ndarray, signal: int = 0) -> Any:
+    window = self._window()
+    return np.interp(t, self.data[0, window], self.data[signal + 1, window])
 
 
 class PointBuckets:
   def __init__(self, x_bounds: list[tuple[float, float]], min_points: list[float], min_points_total: int, points_per_bucket: int, rowsize: int) -> None:
     self.x_bounds = x_bounds
-    self.buckets = {bounds: NPQueue(maxlen=points_per_bucket, rowsize=rowsize) for bounds in x_bounds}
+    # the buckets are slices of one array, so the points of all buckets can be used without stacking them
+    self.points = np.empty((len(x_bounds) * points_per_bucket, rowsize))
+    self.buckets = {bounds: NPQueue(maxlen=points_per_bucket, rowsize=rowsize, buffer=self.points[i * points_per_bucket:(i + 1) * points_per_bucket])
+                    for i, bounds in enumerate(x_bounds)}
     self.buckets_min_points = dict(zip(x_bounds, min_points, strict=True))
     self.min_points_total = min_points_total
 
   def __len__(self) -> int:
-    return sum([len(v) for v in self.buckets.values()])
+    return sum(v.count for v in self.buckets.values())
 
   def is_valid(self) -> bool:
     individual_buckets_valid = all(len(v) >= min_pts for v, min_pts in zip(self.buckets.values(), self.buckets_min_points.values(), strict=True))
@@ -95,10 +164,18 @@ class PointBuckets:
     raise NotImplementedError
 
   def get_points(self, num_points: int | None = None) -> Any:
-    points = np.vstack([x.arr for x in self.buckets.values()])
+    """
+    Points of all buckets, a view when all buckets are full. With num_points, a random sample of that many points,
+    only the sampled points are copied.
+    """
     if num_points is None:
-      return points
-    return points[np.random.choice(np.arange(len(points)), min(len(points), num_points), replace=False)]
+      if len(self) == len(self.points):
+        return self.points
+      return np.vstack([v.buffer[:v.count] for v in self.buckets.values()])
+
+    rows = np.concatenate([np.arange(i * v.maxlen, i * v.maxlen + v.count) for i, v in enumerate(self.buckets.values())])
+    rows = rows[np.random.choice(len(rows), min(len(rows), num_points), replace=False)]
+    return self.points[rows]
 
   def load_points(self, points: list[list[float]]) -> None:
     for point in points:
@@ -118,8 +195,10 @@ class ParameterEstimator:
 
 
 class Measurement:
-  x, y, z = (property(lambda self: self.xyz[0]), property(lambda self: self.xyz[1]), property(lambda self: self.xyz[2]))
-  x_std, y_std, z_std = (property(lambda self: self.xyz_std[0]), property(lambda self: self.xyz_std[1]), property(lambda self: self.xyz_std[2]))
+  """A 3-vector and its stds, or N of them stacked in (N, 3) arrays"""
+  x, y, z = (property(lambda self: self.xyz[..., 0]), property(lambda self: self.xyz[..., 1]), property(lambda self: self.xyz[..., 2]))
+  x_std, y_std, z_std = (property(lambda self: self.xyz_std[..., 0]), property(lambda self: self.xyz_std[..., 1]),
+                         property(lambda self: self.xyz_std[..., 2]))
   roll, pitch, yaw = x, y, z
   roll_std, pitch_std, yaw_std = x_std, y_std, z_std
 
@@ -135,6 +214,11 @@ class Measurement:
     )
 
 
+def _live_pose_values(live_pose: log.LivePose) -> list[list[list[float]]]:
+  return [[[m.x, m.y, m.z], [m.xStd, m.yStd, m.zStd]]
+          for m in (live_pose.orientationNED, live_pose.velocityDevice, live_pose.accelerationDevice, live_pose.angularVelocityDevice)]
+
+
 class Pose:
   def __init__(self, orientation: Measurement, velocity: Measurement, acceleration: Measurement, angular_velocity: Measurement):
     self.orientation = orientation
@@ -142,30 +226,40 @@ class Pose:
     self.acceleration = acceleration
     self.angular_velocity = angular_velocity
 
+  @classmethod
+  def from_values(cls, values: np.ndarray) -> 'Pose':
+    """values is (..., 4, 2, 3): orientation, velocity, acceleration and angular velocity, each value and std"""
+    return cls(*(Measurement(values[..., i, 0, :], values[..., i, 1, :]) for i in range(4)))
+
   @classmethod
   def from_live_pose(cls, live_pose: log.LivePose) -> 'Pose':
-    return Pose(
-      orientation=Measurement.from_measurement_xyz(live_pose.orientationNED),
-      velocity=Measurement.from_measurement_xyz(live_pose.velocityDevice),
-      acceleration=Measurement.from_measurement_xyz(live_pose.accelerationDevice),
-      angular_velocity=Measurement.from_measurement_xyz(live_pose.angularVelocityDevice)
-    )
+    return cls.from_values(np.array(_live_pose_values(live_pose)))
+
+  @classmethod
+  def from_live_poses(cls, live_poses: list[log.LivePose]) -> 'Pose':
+    """All the poses in one, every measurement is (N, 3)"""
+    return cls.from_values(np.array([_live_pose_values(live_pose) for live_pose in live_poses]).reshape(-1, 4, 2, 3))
 
 
 class PoseCalibrator:
+  """
+  Rotates device frame poses into the calibrated frame. Works for one pose as well as for N stacked ones, from
+  Pose.from_live_poses. The rotation is only rebuilt when the calibration changes.
+  """
   def __init__(self):
     self.calib_valid = False
+    self.calib_rpy = (0., 0., 0.)
     self.calib_from_device = np.eye(3)
 
   def _transform_calib_from_device(self, meas: Measurement):
-    new_xyz = self.calib_from_device @ meas.xyz
+    new_xyz = meas.xyz @ self.calib_from_device.T
     new_xyz_std = rotate_std(self.calib_from_device, meas.xyz_std)
     return Measurement(new_xyz, new_xyz_std)
 
   def _ned_from_calib(self, orientation: Measurement):
     ned_from_device = rot_from_euler(orientation.xyz)
     ned_from_calib = ned_from_device @ self.calib_from_device.T
-    ned_from_calib_euler_meas = Measurement(euler_from_rot(ned_from_calib), np.full(3, np.nan))
+    ned_from_calib_euler_meas = Measurement(euler_from_rot(ned_from_calib), np.full(orientation.xyz.shape, np.nan))
     return ned_from_calib_euler_meas
 
   def build_calibrated_pose(self, pose: Pose) -> Pose:
@@ -177,7 +271,9 @@ class PoseCalibrator:
     return Pose(ned_from_calib_euler, velocity_calib, acceleration_calib, angular_velocity_calib)
 
   def feed_live_calib(self, live_calib: log.LiveCalibrationData):
-    calib_rpy = np.array(live_calib.rpyCalib)
-    device_from_calib = rot_from_euler(calib_rpy)
-    self.calib_from_device = device_from_calib.T
+    calib_rpy = tuple(live_calib.rpyCalib)
+    if calib_rpy != self.calib_rpy:
+      device_from_calib = rot_from_euler(np.array(calib_rpy))
+      self.calib_from_device = device_from_calib.T
+      self.calib_rpy = calib_rpy
     self.calib_valid = live_calib.calStatus == log.LiveCalibrationData.Status.calibrated
@@ -2,7 +2,6 @@
 import os
 import numpy as np
 import capnp
-from collections import deque
 from functools import partial
 
 import cereal.messaging as messaging
@@ -11,7 +10,7 @@ from cereal.services import SERVICE_LIST
 from openpilot.common.params import Params
 from openpilot.common.realtime import config_realtime_process
 from openpilot.common.swaglog import cloudlog
-from openpilot.selfdrive.locationd.helpers import PoseCalibrator, Pose, fft_next_good_size, parabolic_peak_interp
+from openpilot.selfdrive.locationd.helpers import PoseCalibrator, Pose, TimeSeries, fft_next_good_size, parabolic_peak_interp
 
 BLOCK_SIZE = 100
 BLOCK_NUM = 50
@@ -89,29 +88,122 @@ def masked_normalized_cross_correlation(expected_sig: np.ndarray, actual_sig: np
   return ncc
 
 
+class SlidingMaskedCorrelation:
+  """
+  masked_normalized_cross_correlation of the last window_len samples, only at the given lags. Keeps the sums over
+  the overlapping samples of every lag, and updates them as samples enter and leave the window, so it costs
+  O(lags) per sample instead of FFTs of the whole window for every estimate.
+  Window rows are the mask, the masked actual signal and its square, the masked expected signal and its square.
+  """
+  # rows of the actual and expected sample of a pair that are multiplied for each sum:
+  # overlap, actual, expected, actual * expected, actual ** 2, expected ** 2
+  ACTUAL_ROWS = np.array([0, 1, 0, 1, 2, 0])
+  EXPECTED_ROWS = np.array([0, 0, 3, 3, 0, 4])
+
+  def __init__(self, window_len: int, lags: np.ndarray):
+    self.window_len = window_len
+    self.lags = lags
+    self.sums = np.zeros((6, len(lags)))
+    self.num_updates = 0
+    # window indices of the (actual, expected) samples paired at each lag, for the pairs with the oldest and the newest
+    # sample. After each step of a slide, the pairs with the oldest sample are removed and the new newest are added
+    self.oldest_pairs = (np.maximum(lags, 0), np.maximum(-lags, 0))
+    self.newest_pairs = (window_len - 1 - np.maximum(-lags, 0), window_len - 1 - np.maximum(lags, 0))
+    self.slide_pairs = tuple(np.concatenate([oldest, newest + 1])[:, None] for oldest, newest in zip(self.oldest_pairs, self.newest_pairs, strict=True))
+
+  @staticmethod
+  def window_rows(expected: np.ndarray, actual: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    actual, expected = actual * mask, expected * mask
+    return np.array([mask, actual, actual * actual, expected, expected * expected])
+
+  def recompute(self, window: np.ndarray):
+    for i, lag in enumerate(self.lags):
+      actual_idx, expected_idx = (np.s_[lag:], np.s_[:self.window_len - lag]) if lag >= 0 else (np.s_[:self.window_len + lag], np.s_[-lag:])
+      self.sums[:, i] = np.sum(window[self.ACTUAL_ROWS, actual_idx] * window[self.EXPECTED_ROWS, expected_idx], axis=1)
+
+  def slide(self, span: np.ndarray, num_new: int):
+    """
+    Slides the window over num_new samples at once. span is the window followed by the new samples, as expected,
+    actual and mask rows. The pairs of all steps are gathered, and removed or added, in one go.
+    """
+    rows = self.window_rows(*span)
+    steps = np.arange(num_new)
+    actual_idx, expected_idx = self.slide_pairs
+    actual = rows.take(actual_idx + steps, axis=1).take(self.ACTUAL_ROWS, axis=0)
+    expected = rows.take(expected_idx + steps, axis=1).take(self.EXPECTED_ROWS, axis=0)
+    pair_sums = np.sum(actual * expected, axis=2)
+    num_lags = len(self.lags)
+    self.sums += pair_sums[:, num_lags:] - pair_sums[:, :num_lags]
+
+    # recompute from scratch about once per window, so rounding errors of the running sums don't build up
+    self.num_updates += num_new
+    if self.num_updates >= self.window_len:
+      self.recompute(rows[:, num_new:])
+      self.num_updates = 0
+
+  def ncc(self) -> np.ndarray:
+    eps = np.finfo(np.float64).eps
+    overlap, actual, expected, actual_expected, actual_squared, expected_squared = self.sums
+    overlap = np.fmax(np.round(overlap), eps)
+
+    numerator = actual_expected - actual * expected / overlap
+    actual_denom = np.fmax(actual_squared - actual ** 2 / overlap, 0.0)
+    expected_denom = np.fmax(expected_squared - expected ** 2 / overlap, 0.0)
+    denom = np.sqrt(actual_denom * expected_denom)
+
+    # zero-out samples with very small denominators
+    tol = 1e3 * eps * np.max(denom)
+    nonzero_indices = denom > tol
+
+    ncc = np.zeros_like(denom)
+    ncc[nonzero_indices] = numerator[nonzero_indices] / denom[nonzero_indices]
+    np.clip(ncc, -1, 1, out=ncc)
+    return ncc
+
+
 class Points:
-  def __init__(self, num_points: int):
-    self.times = deque[float]([0.0] * num_points, maxlen=num_points)
-    self.okay = deque[bool]([False] * num_points, maxlen=num_points)
-    self.desired = deque[float]([0.0] * num_points, maxlen=num_points)
-    self.actual = deque[float]([0.0] * num_points, maxlen=num_points)
+  """
+  Last num_points samples, and the correlation of their desired and actual signals. update only queues the sample,
+  the queued samples are appended and the correlation slides over them at once when the points are read, or after
+  MAX_PENDING samples.
+  """
+  MAX_PENDING = 100
 
-  @property
-  def num_points(self):
-    return len(self.desired)
+  def __init__(self, num_points: int, lags: np.ndarray):
+    self.num_points = num_points
+    # desired, actual and okay, starting from a full window of zeros, not okay. The history is MAX_PENDING samples
+    # longer than the window, so it still has the samples the correlation slides past
+    self.series = TimeSeries(num_points + self.MAX_PENDING, num_signals=3)
+    self.series.fill(0.0, 0.0, 0.0, 0.0)
+    self.correlation = SlidingMaskedCorrelation(num_points, lags)
+    self.pending: list[tuple[float, float, float, bool]] = []
 
   @property
-  def num_okay(self):
-    return np.count_nonzero(self.okay)
+  def num_okay(self) -> int:
+    self._flush()
+    return int(np.count_nonzero(self.series.values[2, -self.num_points:]))
 
   def update(self, t: float, desired: float, actual: float, okay: bool):
-    self.times.append(t)
-    self.okay.append(okay)
-    self.desired.append(desired)
-    self.actual.append(actual)
+    self.pending.append((t, desired, actual, okay))
+    if len(self.pending) == self.MAX_PENDING:
+      self._flush()
+
+  def _flush(self):
+    num_new = len(self.pending)
+    if num_new == 0:
+      return
+    self.series.extend(np.array(self.pending, dtype=np.float64).T)
+    self.pending.clear()
+    self.correlation.slide(self.series.values[:, -(self.num_points + num_new):], num_new)
+
+  def ncc(self) -> np.ndarray:
+    self._flush()
+    return self.correlation.ncc()
 
   def get(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
-    return np.array(self.times), np.array(self.desired), np.array(self.actual), np.array(self.okay)
+    self._flush()
+    desired, actual, okay = self.series.values[:, -self.num_points:]
+    return self.series.t[-self.num_points:], desired, actual, okay.astype(bool)
 
 
 class BlockAverage:
@@ -195,7 +287,9 @@ class LateralLagEstimator:
 
   def reset(self, initial_lag: float, valid_blocks: int):
     window_len = int(self.window_sec / self.dt)
-    self.points = Points(window_len)
+    # lags from 0 to max_lag, and a border on either side to estimate the confidence
+    lags = np.arange(-CORR_BORDER_OFFSET, int(MAX_LAG / self.dt) + CORR_BORDER_OFFSET)
+    self.points = Points(window_len, lags)
     self.block_avg = BlockAverage(self.block_count, self.block_size, valid_blocks, initial_lag)
 
   def get_msg(self, valid: bool, debug: bool = False) -> capnp._DynamicStructBuilder:
@@ -291,14 +385,14 @@ class LateralLagEstimator:
     if not self.points_enough():
       return
 
-    times, desired, actual, okay = self.points.get()
+    times, _, _, okay = self.points.get()
     # check if there are any new valid data points since the last update
     is_valid = self.points_valid()
     if self.last_estimate_t != 0 and times[0] <= self.last_estimate_t:
-      new_values_start_idx = next(-i for i, t in enumerate(reversed(times)) if t <= self.last_estimate_t)
-      is_valid = is_valid and not (new_values_start_idx == 0 or not np.any(okay[new_values_start_idx:]))
+      num_new_values = len(times) - np.searchsorted(times, self.last_estimate_t, side='right')
+      is_valid = is_valid and not (num_new_values == 0 or not np.any(okay[-num_new_values:]))
 
-    delay, corr, confidence = self.actuator_delay(desired, actual, okay, self.dt, MAX_LAG)
+    delay, corr, confidence = self.lag_from_ncc(self.points.ncc(), self.dt)
     if corr < self.min_ncc or confidence < self.min_confidence or not is_valid:
       return
 
@@ -313,11 +407,14 @@ class LateralLagEstimator:
 
     ncc = masked_normalized_cross_correlation(expected_sig, actual_sig, mask, padded_size)
 
-    # only consider lags from 0 to max_lag
-    roi = np.s_[len(expected_sig) - 1: len(expected_sig) - 1 + max_lag_samples]
-    extended_roi = np.s_[roi.start - CORR_BORDER_OFFSET: roi.stop + CORR_BORDER_OFFSET]
-    roi_ncc = ncc[roi]
-    extended_roi_ncc = ncc[extended_roi]
+    # only consider lags from 0 to max_lag, and a border on either side
+    extended_roi = np.s_[len(expected_sig) - 1 - CORR_BORDER_OFFSET: len(expected_sig) - 1 + max_lag_samples + CORR_BORDER_OFFSET]
+    return LateralLagEstimator.lag_from_ncc(ncc[extended_roi], dt)
+
+  @staticmethod
+  def lag_from_ncc(extended_roi_ncc: np.ndarray, dt: float) -> tuple[float, float, float]:
+    """lag, correlation and confidence from the ncc at lags from -CORR_BORDER_OFFSET to max_lag + CORR_BORDER_OFFSET samples"""
+    roi_ncc = extended_roi_ncc[CORR_BORDER_OFFSET:-CORR_BORDER_OFFSET]
 
     max_corr_index = np.argmax(roi_ncc)
     corr = roi_ncc[max_corr_index]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import partial
+from typing import Any
+
+import capnp
+import numpy as np
+from tqdm import tqdm
+
+from cereal import car
+from cereal.services import SERVICE_LIST
+from openpilot.common.prefix import OpenpilotPrefix
+from openpilot.selfdrive.locationd.calibrationd import Calibrator
+from openpilot.selfdrive.locationd.lagd import LateralLagEstimator
+from openpilot.selfdrive.locationd.locationd import INPUT_INVALID_LIMIT, INPUT_INVALID_RECOVERY, HandleLogResult, LocationEstimator, \
+                                                    calculate_invalid_input_decay
+from openpilot.selfdrive.locationd.paramsd import VehicleParamsLearner
+from openpilot.selfdrive.locationd.torqued import TorqueEstimator
+from openpilot.selfdrive.test.process_replay.migration import migrate_all
+from openpilot.tools.lib.logreader import LogReader
+
+
+@dataclass(frozen=True)
+class OfflineEstimator:
+  """
+  How a daemon drives its estimator. Every input message goes to handle_log, and every message of the poll service
+  ends a cycle, like it wakes the daemon up. cycle does the rest of the daemon's loop and gets the cycle count and
+  whether an output message is wanted. It returns the output message if it built one. Invalid input messages are
+  only passed on to handle_invalid, estimators without it never see them.
+  """
+  service: str
+  inputs: tuple[str, ...]
+  poll: str
+  create: Callable[[car.CarParams], Any]
+  cycle: Callable[[Any, int, bool], capnp._DynamicStructBuilder | None]
+  handle_log: Callable[[Any, float, str, capnp._DynamicStructReader], Any] = lambda estimator, t, which, msg: estimator.handle_log(t, which, msg)
+  handle_invalid: Callable[[Any, float, str], Any] | None = None
+
+
+class OfflineLocationd:
+  """
+  locationd's main loop around LocationEstimator, deriving the same sensorsOK, inputsOK and filter valid flags.
+  Without sockets, a sensor is alive if it was received within 0.1s of log time, and the other inputs are alive
+  once they were received.
+  """
+  critical_services = ('accelerometer', 'gyroscope', 'cameraOdometry')
+  sensors = ('accelerometer', 'gyroscope')
+  services = ('carState', 'liveCalibration', 'cameraOdometry')
+
+  def __init__(self):
+    self.estimator = LocationEstimator(False)
+    self.filter_initialized = False
+    self.valid: dict[str, bool] = {}
+    self.recv_time: dict[str, float] = {}
+
+    self.observation_input_invalid = dict.fromkeys(self.critical_services, 0.)
+    input_invalid_limit = {s: round(INPUT_INVALID_LIMIT * (SERVICE_LIST[s].frequency / 20.)) for s in self.critical_services}
+    self.input_invalid_threshold = {s: input_invalid_limit[s] - 0.5 for s in self.critical_services}
+    self.input_invalid_decay = {s: calculate_invalid_input_decay(input_invalid_limit[s], INPUT_INVALID_RECOVERY, SERVICE_LIST[s].frequency)
+                                for s in self.critical_services}
+
+  def handle_log(self, t: float, which: str, msg: capnp._DynamicStructReader) -> None:
+    self.valid[which] = True
+    self.recv_time[which] = t
+    if not self.filter_initialized:
+      return
+
+    res = self.estimator.handle_log(t, which, msg)
+    if which not in self.critical_services:
+      return
+    if res in (HandleLogResult.TIMING_INVALID, HandleLogResult.INPUT_INVALID):
+      self.observation_input_invalid[which] += 1
+    elif res == HandleLogResult.SUCCESS:
+      self.observation_input_invalid[which] *= self.input_invalid_decay[which]
+
+  def handle_invalid(self, t: float, which: str) -> None:
+    self.valid[which] = False
+    self.recv_time[which] = t
+
+  def update(self, output: bool) -> capnp._DynamicStructBuilder | None:
+    t = self.recv_time['cameraOdometry']
+    sensors_valid = all(t - self.recv_time.get(s, -np.inf) < 0.1 and self.valid[s] for s in self.sensors)
+    if not self.filter_initialized:
+      self.filter_initialized = sensors_valid and all(self.valid.get(s, False) for s in self.services)
+    if not output:
+      return None
+
+    critical_service_inputs_valid = all(self.observation_input_invalid[s] < self.input_invalid_threshold[s] for s in self.critical_services)
+    inputs_valid = all(self.valid.get(s, True) for s in self.services) and critical_service_inputs_valid
+    return self.estimator.get_msg(sensors_valid, inputs_valid, self.filter_initialized)
+
+
+def create_calibrator(CP: car.CarParams) -> Calibrator:
+  calibrator = Calibrator(param_put=False)
+  calibrator.not_car = CP.notCar
+  return calibrator
+
+
+def calibrator_handle_log(calibrator: Calibrator, t: float, which: str, msg: capnp._DynamicStructReader) -> None:
+  if which == 'carState':
+    calibrator.handle_v_ego(msg.vEgo)
+  elif which == 'cameraOdometry':
+    calibrator.handle_cam_odom(msg.trans, msg.rot, msg.wideFromDeviceEuler, msg.transStd, msg.roadTransformTrans, msg.roadTransformTransStd)
+
+
+def lag_estimator_cycle(estimator: LateralLagEstimator, frame: int, output: bool) -> capnp._DynamicStructBuilder | None:
+  estimator.update_points()
+  # 4Hz driven by livePose
+  if frame % 5 == 0:
+    estimator.update_estimate()
+  return estimator.get_msg(True) if output else None
+
+
+# paramsd and torqued update their filters in get_msg, so they build their message every time the daemon does
+ESTIMATORS = {
+  'locationd': OfflineEstimator(
+    service='livePose',
+    inputs=('cameraOdometry', 'accelerometer', 'gyroscope', 'liveCalibration', 'carState'),
+    poll='cameraOdometry',
+    create=lambda CP: OfflineLocationd(),
+    cycle=lambda locationd, frame, output: locationd.update(output),
+    handle_invalid=lambda locationd, t, which: locationd.handle_invalid(t, which),
+  ),
+  'paramsd': OfflineEstimator(
+    service='liveParameters',
+    inputs=('livePose', 'liveCalibration', 'carState'),
+    poll='livePose',
+    create=lambda CP: VehicleParamsLearner(CP, CP.steerRatio, 1.0, 0.0),
+    cycle=lambda estimator, frame, output: estimator.get_msg(True),
+  ),
+  'torqued': OfflineEstimator(
+    service='liveTorqueParameters',
+    inputs=('carControl', 'carOutput', 'carState', 'liveCalibration', 'livePose', 'liveDelay'),
+    poll='livePose',
+    create=TorqueEstimator,
+    # 4Hz driven by livePose
+    cycle=lambda estimator, frame, output: estimator.get_msg() if frame % 5 == 0 else None,
+  ),
+  'lagd': OfflineEstimator(
+    service='liveDelay',
+    inputs=tuple(LateralLagEstimator.inputs),
+    poll='livePose',
+    create=lambda CP: LateralLagEstimator(CP, 1. / SERVICE_LIST['livePose'].frequency),
+    cycle=lag_estimator_cycle,
+  ),
+  'calibrationd': OfflineEstimator(
+    service='liveCalibration',
+    inputs=('cameraOdometry', 'carState'),
+    poll='cameraOdometry',
+    create=create_calibrator,
+    cycle=lambda calibrator, frame, output: calibrator.get_msg(True) if output else None,
+    handle_log=calibrator_handle_log,
+  ),
+}
+
+
+def run_route(route: str, names: list[str], output_interval: float | None = None) -> dict[str, Any]:
+  """
+  Runs the estimators over a route, and returns the last output of each. With output_interval, also returns their
+  output every output_interval seconds of the route. Unlike in process replay, every input message is handled in
+  log order, there's no SubMaster and no waiting for all services to be alive.
+  """
+  start_time = time.monotonic()
+  try:
+    with OpenpilotPrefix(shared_download_cache=True):
+      msgs = migrate_all(LogReader(route))
+      CP = next(m.carParams for m in msgs if m.which() == 'carParams')
+
+      estimators = {name: ESTIMATORS[name].create(CP) for name in names}
+      subscribers: dict[str, list[str]] = {}
+      for name in names:
+        for service in ESTIMATORS[name].inputs:
+          subscribers.setdefault(service, []).append(name)
+
+      # the last cycle always builds an output, for the summary
+      last_time, last_valid_time = {}, {}
+      for m in msgs:
+        last_time[m.which()] = m.logMonoTime
+        if m.valid:
+          last_valid_time[m.which()] = m.logMonoTime
+      last_poll_time = {name: (last_valid_time if ESTIMATORS[name].handle_invalid is None else last_time).get(ESTIMATORS[name].poll)
+                        for name in names}
+      route_start = msgs[0].logMonoTime
+
+      frames = dict.fromkeys(names, 0)
+      next_output = dict.fromkeys(names, 0.)
+      last_msgs: dict[str, capnp._DynamicStructBuilder] = {}
+      outputs: dict[str, list[dict[str, Any]]] = {name: [] for name in names}
+      for m in msgs:
+        which = m.which()
+        if which not in subscribers:
+          continue
+
+        t = m.logMonoTime * 1e-9
+        msg = getattr(m, which)
+        for name in subscribers[which]:
+          cfg, estimator = ESTIMATORS[name], estimators[name]
+          if m.valid:
+            cfg.handle_log(estimator, t, which, msg)
+          elif cfg.handle_invalid is not None:
+            cfg.handle_invalid(estimator, t, which)
+          else:
+            continue
+          if which != cfg.poll:
+            continue
+
+          route_t = (m.logMonoTime - route_start) * 1e-9
+          output_due = output_interval is not None and route_t >= next_output[name]
+          out_msg = cfg.cycle(estimator, frames[name], output_due or m.logMonoTime == last_poll_time[name])
+          frames[name] += 1
+          if out_msg is None:
+            continue
+
+          last_msgs[name] = out_msg
+          if output_due:
+            outputs[name].append({'t': route_t, **getattr(out_msg, cfg.service).to_dict()})
+            next_output[name] = route_t + output_interval
+
+    result: dict[str, Any] = {name: {'summary': getattr(last_msgs[name], ESTIMATORS[name].service).to_dict() if name in last_msgs else None,
+                                     'cycles': frames[name]} for name in names}
+    if output_interval is not None:
+      for name in names:
+        result[name]['outputs'] = outputs[name]
+    return {'route': route, 'estimators': result, 'time_s': time.monotonic() - start_time}
+  except Exception as e:
+    return {'route': route, 'error': repr(e), 'time_s': time.monotonic() - start_time}
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Run the live parameter estimators over routes in-process, and summarize their outputs',
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('routes', nargs='*', help='Routes or segments, anything LogReader takes')
+  parser.add_argument('--routes-file', help='File with one route per line, in addition to the routes given')
+  parser.add_argument('--estimators', nargs='+', choices=list(ESTIMATORS), default=list(ESTIMATORS))
+  parser.add_argument('--output-interval', type=float, help='Also output the estimates every this many seconds of route')
+  parser.add_argument('-j', '--workers', type=int, default=multiprocessing.cpu_count(), help='Routes run in parallel')
+  parser.add_argument('-o', '--output', help='JSON lines file for the results, one line per route (default: stdout)')
+  args = parser.parse_args()
+
+  routes = list(args.routes)
+  if args.routes_file is not None:
+    with open(args.routes_file) as f:
+      routes += [line.strip() for line in f if line.strip()]
+  if len(routes) == 0:
+    parser.error('no routes given')
+
+  run = partial(run_route, names=args.estimators, output_interval=args.output_interval)
+  out = open(args.output, 'w') if args.output is not None else sys.stdout
+  num_failed = 0
+  try:
+    with multiprocessing.Pool(min(args.workers, len(routes))) as pool:
+      for result in tqdm(pool.imap_unordered(run, routes), total=len(routes), disable=out is sys.stdout):
+        num_failed += 'error' in result
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+  finally:
+    if out is not sys.stdout:
+      out.close()
+
+  if num_failed > 0:
+    print(f'{num_failed}/{len(routes)} routes failed', file=sys.stderr)
+    sys.exit(1)
@@ -0,0 +1,83 @@
+import numpy as np
+
+from cereal import log
+from openpilot.common.transformations.orientation import rot_from_euler
+from openpilot.selfdrive.locationd.helpers import Pose, PoseCalibrator, TimeSeries
+
+MEASUREMENTS = ["orientationNED", "velocityDevice", "accelerationDevice", "angularVelocityDevice"]
+
+
+def live_pose_msg(rng):
+  live_pose = log.LivePose.new_message()
+  for name in MEASUREMENTS:
+    meas = getattr(live_pose, name)
+    meas.x, meas.y, meas.z = rng.uniform(-np.pi, np.pi, 3).tolist()
+    meas.xStd, meas.yStd, meas.zStd = rng.uniform(0, 1, 3).tolist()
+  return live_pose
+
+
+def live_calib_msg(rpy, status=log.LiveCalibrationData.Status.calibrated):
+  live_calib = log.LiveCalibrationData.new_message()
+  live_calib.rpyCalib = [float(v) for v in rpy]
+  live_calib.calStatus = status
+  return live_calib
+
+
+class TestPoseCalibrator:
+  def test_batch_equals_single(self):
+    rng = np.random.default_rng(0)
+    live_poses = [live_pose_msg(rng) for _ in range(100)]
+    calibrator = PoseCalibrator()
+    calibrator.feed_live_calib(live_calib_msg(rng.uniform(-0.1, 0.1, 3)))
+
+    batch = calibrator.build_calibrated_pose(Pose.from_live_poses(live_poses))
+    singles = [calibrator.build_calibrated_pose(Pose.from_live_pose(live_pose)) for live_pose in live_poses]
+    for field in ("orientation", "velocity", "acceleration", "angular_velocity"):
+      batch_meas = getattr(batch, field)
+      assert batch_meas.xyz.shape == batch_meas.xyz_std.shape == (len(live_poses), 3)
+      np.testing.assert_allclose(batch_meas.xyz, [getattr(p, field).xyz for p in singles], rtol=1e-12, atol=1e-12)
+      np.testing.assert_allclose(batch_meas.xyz_std, [getattr(p, field).xyz_std for p in singles], rtol=1e-12, atol=1e-12)
+
+  def test_feed_live_calib(self):
+    calibrator = PoseCalibrator()
+    rpy = [0.01, -0.02, 0.03]
+    calibrator.feed_live_calib(live_calib_msg(rpy))
+    calib_from_device = calibrator.calib_from_device
+    np.testing.assert_allclose(calib_from_device, rot_from_euler(np.array(rpy)).T)
+    assert calibrator.calib_valid
+
+    # the rotation is only rebuilt when rpyCalib changes
+    calibrator.feed_live_calib(live_calib_msg(rpy, log.LiveCalibrationData.Status.uncalibrated))
+    assert calibrator.calib_from_device is calib_from_device
+    assert not calibrator.calib_valid
+
+    rpy = [0.01, -0.02, 0.04]
+    calibrator.feed_live_calib(live_calib_msg(rpy))
+    assert calibrator.calib_from_device is not calib_from_device
+    np.testing.assert_allclose(calibrator.calib_from_device, rot_from_euler(np.array(rpy)).T)
+
+
+class TestTimeSeries:
+  def test_extend_equals_append(self):
+    rng = np.random.default_rng(0)
+    appended, extended = TimeSeries(50, num_signals=2), TimeSeries(50, num_signals=2)
+    t = 0
+    for num_samples in (3, 40, 1, 70, 0, 25):
+      samples = np.vstack([t + np.arange(num_samples), rng.normal(size=(2, num_samples))])
+      t += num_samples
+      for sample in samples.T:
+        appended.append(*sample)
+      extended.extend(samples)
+      assert len(extended) == len(appended)
+      np.testing.assert_array_equal(extended.t, appended.t)
+      np.testing.assert_array_equal(extended.values, appended.values)
+
+  def test_fill(self):
+    series = TimeSeries(10, num_signals=2)
+    series.append(1.0, 2.0, 3.0)
+    series.fill(0.0, 4.0, 5.0)
+    assert len(series) == 10
+    np.testing.assert_array_equal(series.values, np.tile([[4.0], [5.0]], 10))
+    series.append(1.0, 6.0, 7.0)
+    assert len(series) == 10
+    np.testing.assert_array_equal(series.t[-2:], [0.0, 1.0])
@@ -4,7 +4,7 @@ import time
 import pytest
 
 from cereal import messaging, log, car
-from openpilot.selfdrive.locationd.lagd import LateralLagEstimator, retrieve_initial_lag, masked_normalized_cross_correlation, \
+from openpilot.selfdrive.locationd.lagd import LateralLagEstimator, Points, retrieve_initial_lag, masked_normalized_cross_correlation, \
                                                BLOCK_NUM_NEEDED, BLOCK_SIZE, MIN_OKAY_WINDOW_SEC
 from openpilot.selfdrive.test.process_replay.migration import migrate, migrate_carParams
 from openpilot.selfdrive.locationd.test.test_locationd_scenarios import TEST_ROUTE
@@ -86,6 +86,20 @@ class TestLagd:
     corr = masked_normalized_cross_correlation(desired_sig, actual_sig, mask, 200)[len(desired_sig) - 1:len(desired_sig) + 20]
     assert np.argmax(corr) in range(lag_frames - MAX_ERR_FRAMES, lag_frames + MAX_ERR_FRAMES + 1)
 
+  def test_sliding_ncc(self):
+    window_len, lags = 200, np.arange(-5, 25)
+    points = Points(window_len, lags)
+    rng = np.random.default_rng(0)
+    for i in range(3 * window_len):
+      desired = np.sin(0.3 * i) + rng.normal(0, 0.1)
+      points.update(i * DT, desired, np.sin(0.3 * (i - 7)) + rng.normal(0, 0.1), rng.uniform() < 0.7)
+
+      if i >= window_len and i % 37 == 0:
+        _, desired_sig, actual_sig, mask = points.get()
+        corr = masked_normalized_cross_correlation(desired_sig.copy(), actual_sig.copy(), mask, 2 * window_len)
+        np.testing.assert_allclose(points.ncc(), corr[window_len - 1 + lags], atol=1e-9)
+        assert points.num_okay == np.count_nonzero(mask)
+
   def test_empty_estimator(self):
     mocked_CP = car.CarParams(steerActuatorDelay=0.8)
     estimator = LateralLagEstimator(mocked_CP, DT)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from cereal import log, messaging
+from openpilot.selfdrive.locationd.locationd import LocationEstimator, HandleLogResult, ACCEL_SANITY_CHECK, ROTATION_SANITY_CHECK
+from openpilot.selfdrive.locationd.models.constants import ObservationKind
+
+T = 100.0
+
+
+def imu_msg(which, v, t=T, source=log.SensorEventData.SensorSource.lsm6ds3):
+  msg = messaging.new_message(which)
+  event = getattr(msg, which)
+  event.timestamp = int(t * 1e9)
+  event.source = source
+  event.init("acceleration" if which == "accelerometer" else "gyroUncalibrated").v = v
+  return event
+
+
+class TestLocationEstimator:
+  def setup_method(self):
+    self.estimator = LocationEstimator(debug=False)
+    self.estimator.reset(T)
+
+  def test_imu(self):
+    for which, kind in [("accelerometer", ObservationKind.PHONE_ACCEL), ("gyroscope", ObservationKind.PHONE_GYRO)]:
+      assert self.estimator.handle_log(T, which, imu_msg(which, [0.1, 0.2, 0.3])) == HandleLogResult.SUCCESS
+      np.testing.assert_allclose(self.estimator.observations[kind], [-0.3, -0.2, -0.1])
+
+  def test_imu_timing_invalid(self):
+    for which in ["accelerometer", "gyroscope"]:
+      assert self.estimator.handle_log(T, which, imu_msg(which, [0.1, 0.2, 0.3], t=0)) == HandleLogResult.TIMING_INVALID
+      assert self.estimator.handle_log(T, which, imu_msg(which, [0.1, 0.2, 0.3], t=T - 0.15)) == HandleLogResult.TIMING_INVALID
+
+  def test_imu_source_invalid(self):
+    for which in ["accelerometer", "gyroscope"]:
+      msg = imu_msg(which, [0.1, 0.2, 0.3], source=log.SensorEventData.SensorSource.bmx055)
+      assert self.estimator.handle_log(T, which, msg) == HandleLogResult.SENSOR_SOURCE_INVALID
+
+  def test_imu_input_invalid(self):
+    assert self.estimator.handle_log(T, "accelerometer", imu_msg("accelerometer", [ACCEL_SANITY_CHECK, 0, 0])) == HandleLogResult.INPUT_INVALID
+    assert self.estimator.handle_log(T, "gyroscope", imu_msg("gyroscope", [ROTATION_SANITY_CHECK, 0, 0])) == HandleLogResult.INPUT_INVALID
+
+  def test_imu_non_finite(self):
+    # a non-finite accelerometer reading passes the sanity check and resets the filter, a gyroscope one fails the camodo check
+    assert self.estimator.handle_log(T, "accelerometer", imu_msg("accelerometer", [np.nan, 0, 0])) == HandleLogResult.SUCCESS
+    assert np.isfinite(self.estimator.kf.x).all() and np.isfinite(self.estimator.kf.P).all()
+    assert self.estimator.handle_log(T, "gyroscope", imu_msg("gyroscope", [np.nan, 0, 0])) == HandleLogResult.INPUT_INVALID
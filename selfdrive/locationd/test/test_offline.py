@@ -0,0 +1,46 @@
+import pytest
+
+from openpilot.selfdrive.locationd.offline import ESTIMATORS, run_route
+from openpilot.selfdrive.locationd.test.test_locationd_scenarios import TEST_ROUTE
+from openpilot.selfdrive.test.process_replay.migration import migrate_all
+from openpilot.selfdrive.test.process_replay.process_replay import replay_process_with_name
+from openpilot.tools.lib.logreader import LogReader
+
+# status fields of each summary, they have to be the same as process replay's. Offline, every input is handled in
+# log order without a SubMaster, so the estimates themselves aren't expected to match exactly, and they aren't compared
+STATUS_FIELDS = {
+  'locationd': ('inputsOK', 'sensorsOK', 'orientationNED.valid'),
+  'paramsd': ('valid',),
+  'torqued': ('liveValid',),
+  'lagd': ('status',),
+  'calibrationd': ('calStatus',),
+}
+
+
+def get_field(summary, field):
+  for key in field.split('.'):
+    summary = summary[key]
+  return summary
+
+
+class TestOffline:
+  @classmethod
+  def setup_class(cls):
+    cls.result = run_route(TEST_ROUTE, list(ESTIMATORS))
+    cls.logs = migrate_all(LogReader(TEST_ROUTE))
+
+  def test_no_error(self):
+    assert 'error' not in self.result, self.result.get('error')
+    assert set(self.result['estimators']) == set(ESTIMATORS)
+
+  @pytest.mark.parametrize("name", list(ESTIMATORS))
+  def test_status_matches_process_replay(self, name):
+    estimator = self.result['estimators'][name]
+    assert estimator['cycles'] > 0
+    assert estimator['summary'] is not None
+
+    service = ESTIMATORS[name].service
+    replayed = [m for m in replay_process_with_name(name, self.logs) if m.which() == service]
+    expected = getattr(replayed[-1], service).to_dict()
+    for field in STATUS_FIELDS[name]:
+      assert get_field(estimator['summary'], field) == get_field(expected, field), field
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any
+
+import numpy as np
+
+from openpilot.common.git import get_commit
+from openpilot.selfdrive.test.process_replay.migration import migrate_all
+from openpilot.selfdrive.test.process_replay.process_replay import CONFIGS, PROC_REPLAY_DIR, get_migration_flags, replay_process
+from openpilot.selfdrive.test.process_replay.segment_profile import get_segment_profile
+from openpilot.selfdrive.test.process_replay.test_processes import EXCLUDED_PROCS, segments
+from openpilot.tools.lib.logreader import LogReader
+from openpilot.tools.lib.openpilotci import get_url
+
+# 5 bins per decade, from 1us to 10s
+HISTOGRAM_EDGES = np.logspace(-6, 1, 36)
+
+
+def latency_stats(latencies: list[float]) -> dict[str, Any]:
+  lat = np.array(latencies, dtype=np.float64)
+  if len(lat) == 0:
+    return {"count": 0}
+
+  counts, _ = np.histogram(np.clip(lat, HISTOGRAM_EDGES[0], HISTOGRAM_EDGES[-1]), bins=HISTOGRAM_EDGES)
+  p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+  return {
+    "count": len(lat),
+    "total_s": float(lat.sum()),
+    "mean_s": float(lat.mean()),
+    "p50_s": float(p50),
+    "p90_s": float(p90),
+    "p99_s": float(p99),
+    "max_s": float(lat.max()),
+    "histogram": {"edges_s": HISTOGRAM_EDGES.tolist(), "counts": counts.tolist()},
+  }
+
+
+def bench(segment: str, proc_names: list[str], in_process: bool) -> dict[str, Any]:
+  report: dict[str, Any] = {"commit": get_commit(), "segment": segment, "in_process": in_process, "log_io": {}, "processes": {}}
+
+  st = time.perf_counter()
+  if os.path.exists(segment):
+    lr = LogReader(segment)
+  else:
+    lr = LogReader(get_url(*segment.rsplit("--", 1), "rlog.zst"))
+  profile = get_segment_profile(lr)
+  report["log_io"]["load_s"] = time.perf_counter() - st
+
+  cfgs = [cfg for cfg in CONFIGS if cfg.proc_name in proc_names]
+  migrated = {}
+  for cfg in cfgs:
+    flags = get_migration_flags([cfg])
+    key = "_".join(k for k, v in sorted(flags.items()) if v)
+    if key not in migrated:
+      st = time.perf_counter()
+      migrated_msgs = migrate_all(profile, **flags)
+      migrated[key] = profile if migrated_msgs is profile.msgs else get_segment_profile(migrated_msgs)
+      report["log_io"][f"migrate_{key}_s"] = time.perf_counter() - st
+
+    msgs = migrated[key]
+    input_msgs = sum(msgs.counts.get(pub, 0) for pub in set(cfg.pubs) - set(cfg.subs))
+    step_timings: dict[str, list[tuple[float, float]]] = {}
+    st = time.perf_counter()
+    output_msgs = replay_process(cfg, msgs, disable_progress=True, migrate=False, in_process=in_process, step_timings_store=step_timings)
+    wall_time = time.perf_counter() - st
+
+    timings = step_timings.get(cfg.proc_name, [])
+    report["processes"][cfg.proc_name] = {
+      "wall_s": wall_time,
+      "input_msgs": input_msgs,
+      "output_msgs": len(output_msgs),
+      "msgs_per_s": input_msgs / wall_time,
+      "harness": latency_stats([h for h, _ in timings]),
+      "process": latency_stats([p for _, p in timings]),
+    }
+  return report
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], max_regression: float) -> bool:
+  print(f"\nthroughput compared to {baseline['commit']}:")
+  ok = True
+  for proc, res in report["processes"].items():
+    if proc not in baseline["processes"]:
+      continue
+    ratio = res["msgs_per_s"] / baseline["processes"][proc]["msgs_per_s"]
+    regressed = ratio < 1. - max_regression
+    ok &= not regressed
+    print(f"  {proc:<18} {ratio:6.2f}x{'  REGRESSED' if regressed else ''}")
+  return ok
+
+
+if __name__ == "__main__":
+  all_procs = [cfg.proc_name for cfg in CONFIGS if cfg.proc_name not in EXCLUDED_PROCS]
+  parser = argparse.ArgumentParser(description="Measure the replay throughput of each process config, and where the time goes")
+  parser.add_argument("--segment", default=segments[0][1], help="Local rlog, or name of a CI segment (default: %(default)s)")
+  parser.add_argument("--whitelist-procs", type=str, nargs="*", default=all_procs, help="Processes to benchmark")
+  parser.add_argument("--in-process", action="store_true", help="Step processes that support it inside the benchmark")
+  parser.add_argument("--output", help="Path of the JSON report (default: bench_<commit>.json in the process replay dir)")
+  parser.add_argument("--baseline", help="JSON report of another commit to compare to")
+  parser.add_argument("--max-regression", type=float, default=0.2, help="Fail if throughput drops by more than this fraction")
+  args = parser.parse_args()
+
+  report = bench(args.segment, args.whitelist_procs, args.in_process)
+
+  print(f"{'process':<18} {'msgs/s':>10} {'harness p50':>12} {'harness p99':>12} {'process p50':>12} {'process p99':>12}")
+  for proc, res in report["processes"].items():
+    latencies = [res[part].get(k, 0.) * 1e3 for part in ("harness", "process") for k in ("p50_s", "p99_s")]
+    print(f"{proc:<18} {res['msgs_per_s']:10.0f}" + "".join(f" {lat:10.3f}ms" for lat in latencies))
+  print("log I/O: " + ", ".join(f"{k} {v:.2f}s" for k, v in report["log_io"].items()))
+
+  output = args.output or os.path.join(PROC_REPLAY_DIR, f"bench_{report['commit']}.json")
+  with open(output, "w") as f:
+    json.dump(report, f, indent=2)
+  print(f"\nreport written to {output}")
+
+  if args.baseline is not None:
+    with open(args.baseline) as f:
+      if not compare(report, json.load(f), args.max_regression):
+        sys.exit(1)
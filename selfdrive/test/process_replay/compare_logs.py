@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
+import argparse
 import sys
 import math
 import capnp
 import numbers
 import dictdiffer
-from collections import Counter
+import multiprocessing
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 from openpilot.tools.lib.logreader import LogReader
 
 EPSILON = sys.float_info.epsilon
 
+# schema node id -> (non-union field names, has union)
+_struct_fields_cache: dict[int, tuple[tuple[str, ...], bool]] = {}
+
 
 def remove_ignored_fields(msg, ignore):
   msg = msg.as_builder()
@@ -39,7 +46,137 @@ def remove_ignored_fields(msg, ignore):
   return msg
 
 
-def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=None,):
+def _struct_fields(schema) -> tuple[tuple[str, ...], bool]:
+  node_id = schema.node.id
+  if node_id not in _struct_fields_cache:
+    _struct_fields_cache[node_id] = (tuple(schema.non_union_fields), len(schema.union_fields) != 0)
+  return _struct_fields_cache[node_id]
+
+
+def _numbers_close(a, b, tolerance: float) -> bool:
+  if a == b or (a != a and b != b):  # NaNs are equal
+    return True
+  return math.isfinite(a) and math.isfinite(b) and abs(a - b) <= max(tolerance, tolerance * max(abs(a), abs(b)))
+
+
+def _number_lists_close(l1, l2, tolerance: float) -> bool:
+  a, b = np.asarray(list(l1)), np.asarray(list(l2))
+  if np.array_equal(a, b):
+    return True
+
+  a, b = a.astype(np.float64), b.astype(np.float64)
+  with np.errstate(invalid='ignore', over='ignore'):
+    close = (a == b) | (np.isnan(a) & np.isnan(b))
+    close |= np.isfinite(a) & np.isfinite(b) & (np.abs(a - b) <= np.maximum(tolerance, tolerance * np.maximum(np.abs(a), np.abs(b))))
+  return bool(close.all())
+
+
+def _same_bytes(v1, v2) -> bool:
+  # only structs can be copied into their own message, lists (can, sendcan, ...) are walked
+  if not isinstance(v1, capnp.lib.capnp._DynamicStructReader):
+    return False
+  return bool(v1.as_builder().to_bytes() == v2.as_builder().to_bytes())
+
+
+def _values_close(v1, v2, path: tuple[str, ...], ignore: set[tuple[str, ...]], tolerance: float) -> bool:
+  if isinstance(v1, capnp.lib.capnp._DynamicStructReader):
+    non_union_fields, has_union = _struct_fields(v1.schema)
+    fields = non_union_fields
+    if has_union:
+      which = v1.which()
+      if which != v2.which():
+        return False
+      fields = (*non_union_fields, which)
+
+    for field in fields:
+      field_path = (*path, field)
+      if field_path not in ignore and not _values_close(getattr(v1, field), getattr(v2, field), field_path, ignore, tolerance):
+        return False
+    return True
+
+  elif isinstance(v1, capnp.lib.capnp._DynamicListReader):
+    if len(v1) != len(v2):
+      return False
+    if len(v1) == 0:
+      return True
+    if isinstance(v1[0], numbers.Number):
+      return _number_lists_close(v1, v2, tolerance)
+    return all(_values_close(e1, e2, (*path, str(i)), ignore, tolerance) for i, (e1, e2) in enumerate(zip(v1, v2, strict=True)))
+
+  elif isinstance(v1, numbers.Number) and isinstance(v2, numbers.Number):
+    return _numbers_close(v1, v2, tolerance)
+
+  return bool(v1 == v2)
+
+
+def compare_msgs(msg1, msg2, ignore_fields: list[str], tolerance: float) -> list:
+  msg1 = remove_ignored_fields(msg1, ignore_fields)
+  msg2 = remove_ignored_fields(msg2, ignore_fields)
+
+  if msg1.to_bytes() == msg2.to_bytes():
+    return []
+
+  msg1_dict = msg1.as_reader().to_dict(verbose=True)
+  msg2_dict = msg2.as_reader().to_dict(verbose=True)
+
+  dd = dictdiffer.diff(msg1_dict, msg2_dict, ignore=ignore_fields)
+
+  # Dictdiffer only supports relative tolerance, we also want to check for absolute
+  # TODO: add this to dictdiffer
+  def outside_tolerance(diff):
+    try:
+      if diff[0] == "change":
+        a, b = diff[2]
+        finite = math.isfinite(a) and math.isfinite(b)
+        if finite and isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
+          return abs(a - b) > max(tolerance, tolerance * max(abs(a), abs(b)))
+    except TypeError:
+      pass
+    return True
+
+  return list(filter(outside_tolerance, dd))
+
+
+def _compare_indices(log1, log2, indices, ignore_fields, tolerance) -> list[tuple[int, list]]:
+  """
+  Compares the bytes of each message's payload first, most messages are identical. Only payloads that differ,
+  or have ignored fields in them, are walked with their schema, skipping ignored fields and checking numeric lists
+  within tolerance in one vectorised operation. Only messages that differ pay for the builder copies and the
+  dict diff in compare_msgs.
+  """
+  diffs = []
+  ignore_keys = [tuple(key.split(".")) for key in ignore_fields]
+  # same as remove_ignored_fields, nested keys only apply to their message type. When no key is nested in the
+  # payload, identical payloads only leave the top level fields (logMonoTime, valid, ...) to walk
+  ignore_by_type: dict[str, tuple[set[tuple[str, ...]], set[tuple[str, ...]] | None]] = {}
+  for i in indices:
+    msg1, msg2 = log1[i], log2[i]
+    which = msg1.which()
+    if which not in ignore_by_type:
+      ignore = {k for k in ignore_keys if len(k) == 1 or k[0] == which}
+      ignore_by_type[which] = (ignore, None if any(k[0] == which for k in ignore) else ignore | {(which,)})
+    ignore, same_payload_ignore = ignore_by_type[which]
+    if same_payload_ignore is not None and _same_bytes(getattr(msg1, which), getattr(msg2, which)):
+      ignore = same_payload_ignore
+    if not _values_close(msg1, msg2, (), ignore, tolerance):
+      diffs.append((i, compare_msgs(msg1, msg2, ignore_fields, tolerance)))
+  return diffs
+
+
+_worker_logs: tuple[list, list] | None = None
+
+
+def _init_worker(log1, log2):
+  global _worker_logs
+  _worker_logs = (log1, log2)
+
+
+def _compare_indices_worker(indices, ignore_fields, tolerance):
+  assert _worker_logs is not None
+  return _compare_indices(*_worker_logs, indices, ignore_fields, tolerance)
+
+
+def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=None, num_workers=1):
   if ignore_fields is None:
     ignore_fields = []
   if ignore_msgs is None:
@@ -56,36 +193,24 @@ def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=Non
     cnt2 = Counter(m.which() for m in log2)
     raise Exception(f"logs are not same length: {len(log1)} VS {len(log2)}\n\t\t{cnt1}\n\t\t{cnt2}")
 
-  diff = []
-  for msg1, msg2 in zip(log1, log2, strict=True):
+  indices_by_type = defaultdict(list)
+  for i, (msg1, msg2) in enumerate(zip(log1, log2, strict=True)):
     if msg1.which() != msg2.which():
       raise Exception("msgs not aligned between logs")
+    indices_by_type[msg1.which()].append(i)
+
+  if num_workers > 1 and len(indices_by_type) > 1:
+    # forked workers inherit both logs, only the indices to compare are sent to them
+    ctx = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(num_workers, mp_context=ctx, initializer=_init_worker, initargs=(log1, log2)) as pool:
+      futures = [pool.submit(_compare_indices_worker, indices, ignore_fields, tolerance) for indices in indices_by_type.values()]
+      msg_diffs = [d for f in futures for d in f.result()]
+  else:
+    msg_diffs = _compare_indices(log1, log2, range(len(log1)), ignore_fields, tolerance)
 
-    msg1 = remove_ignored_fields(msg1, ignore_fields)
-    msg2 = remove_ignored_fields(msg2, ignore_fields)
-
-    if msg1.to_bytes() != msg2.to_bytes():
-      msg1_dict = msg1.as_reader().to_dict(verbose=True)
-      msg2_dict = msg2.as_reader().to_dict(verbose=True)
-
-      dd = dictdiffer.diff(msg1_dict, msg2_dict, ignore=ignore_fields)
-
-      # Dictdiffer only supports relative tolerance, we also want to check for absolute
-      # TODO: add this to dictdiffer
-      def outside_tolerance(diff):
-        try:
-          if diff[0] == "change":
-            a, b = diff[2]
-            finite = math.isfinite(a) and math.isfinite(b)
-            if finite and isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
-              return abs(a - b) > max(tolerance, tolerance * max(abs(a), abs(b)))
-        except TypeError:
-          pass
-        return True
-
-      dd = list(filter(outside_tolerance, dd))
-
-      diff.extend(dd)
+  diff = []
+  for _, dd in sorted(msg_diffs, key=lambda d: d[0]):
+    diff.extend(dd)
   return diff
 
 
@@ -139,11 +264,17 @@ def format_diff(results, log_paths, ref_commit):
 
 
 if __name__ == "__main__":
-  log1 = list(LogReader(sys.argv[1]))
-  log2 = list(LogReader(sys.argv[2]))
-  ignore_fields = sys.argv[3:] or ["logMonoTime"]
-  results = {"segment": {"proc": compare_logs(log1, log2, ignore_fields)}}
-  log_paths = {"segment": {"proc": {"ref": sys.argv[1], "new": sys.argv[2]}}}
+  parser = argparse.ArgumentParser(description="Compare two logs message by message")
+  parser.add_argument("log1")
+  parser.add_argument("log2")
+  parser.add_argument("ignore_fields", nargs="*", default=["logMonoTime"])
+  parser.add_argument("-j", "--jobs", type=int, default=1, help="Compare message types in parallel")
+  args = parser.parse_args()
+
+  log1 = list(LogReader(args.log1))
+  log2 = list(LogReader(args.log2))
+  results = {"segment": {"proc": compare_logs(log1, log2, args.ignore_fields, num_workers=args.jobs)}}
+  log_paths = {"segment": {"proc": {"ref": args.log1, "new": args.log2}}}
   diff_short, diff_long, failed = format_diff(results, log_paths, None)
 
   print(diff_long)
@@ -3,6 +3,7 @@ from collections.abc import Callable
 from typing import cast
 import capnp
 import functools
+import heapq
 import traceback
 
 from cereal import messaging, car, log
@@ -13,6 +14,7 @@ from opendbc.car.hyundai.values import HyundaiSafetyFlags
 from opendbc.car.gm.values import GMSafetyFlags
 from openpilot.selfdrive.modeld.constants import ModelConstants
 from openpilot.selfdrive.modeld.fill_model_msg import fill_xyz_poly, fill_lane_line_meta
+from openpilot.selfdrive.test.process_replay.segment_profile import SegmentProfile
 from openpilot.selfdrive.test.process_replay.vision_meta import meta_from_encode_index
 from openpilot.selfdrive.controls.lib.longitudinal_planner import get_accel_from_plan, CONTROL_N_T_IDX
 from openpilot.system.manager.process_config import managed_processes
@@ -29,6 +31,8 @@ MigrationFunc = Callable[[list[MessageWithIndex]], MigrationOps]
 # 3. product is the message type created by the migration function, and the function will be skipped if product type already exists in lr
 # 4. it must return a list of operations to be applied to the logreader (replace, add, delete)
 # 5. all migration functions must be independent of each other
+# 6. replaced messages must keep the logMonoTime of the original message
+# 7. messages that are already up to date should not be replaced
 def migrate_all(lr: LogIterable, manager_states: bool = False, panda_states: bool = False, camera_states: bool = False):
   migrations = [
     migrate_sensorEvents,
@@ -57,31 +61,49 @@ def migrate_all(lr: LogIterable, manager_states: bool = False, panda_states: boo
 
 
 def migrate(lr: LogIterable, migration_funcs: list[MigrationFunc]):
-  lr = list(lr)
-  grouped = defaultdict(list)
-  for i, msg in enumerate(lr):
-    grouped[msg.which()].append(i)
+  """
+  Applies migration_funcs to lr and returns the messages sorted by logMonoTime. If nothing had to be migrated,
+  the returned list is the list of messages that was passed (or profiled) itself.
+  """
+  profile = lr if isinstance(lr, SegmentProfile) else None
+  msgs = profile.msgs if profile is not None else (lr if isinstance(lr, list) else list(lr))
+
+  if profile is None:
+    profile = SegmentProfile.from_msgs(msgs)
+  grouped = profile.grouped_indices()
+  is_sorted = profile.is_sorted
 
   replace_ops, add_ops, del_ops = [], [], []
   for migration in migration_funcs:
     assert hasattr(migration, "inputs") and hasattr(migration, "product"), "Migration functions must use @migration decorator"
     if migration.product in grouped: # skip if product already exists
       continue
+    if not any(i in grouped for i in cast(list[str], migration.inputs)):
+      continue
 
-    sorted_indices = sorted(ii for i in cast(list[str], migration.inputs) for ii in grouped.get(i, []))
-    msg_gen = [(i, lr[i]) for i in sorted_indices]
+    sorted_indices = heapq.merge(*(grouped.get(i, []) for i in cast(list[str], migration.inputs)))
+    msg_gen = [(i, msgs[i]) for i in sorted_indices]
     r_ops, a_ops, d_ops = migration(msg_gen)
     replace_ops.extend(r_ops)
     add_ops.extend(a_ops)
     del_ops.extend(d_ops)
 
+  if not (replace_ops or add_ops or del_ops):
+    return msgs if is_sorted else sorted(msgs, key=lambda x: x.logMonoTime)
+
+  lr = list(msgs)
   for index, msg in replace_ops:
     lr[index] = msg
   for index in sorted(del_ops, reverse=True):
     del lr[index]
-  for msg in add_ops:
-    lr.append(msg)
-  lr = sorted(lr, key=lambda x: x.logMonoTime)
+
+  if not is_sorted:
+    lr.extend(add_ops)
+    lr.sort(key=lambda x: x.logMonoTime)
+  elif add_ops:
+    # replaced messages keep their time, so only the added messages need sorting
+    add_ops.sort(key=lambda x: x.logMonoTime)
+    lr = list(heapq.merge(lr, add_ops, key=lambda x: x.logMonoTime))
 
   return lr
 
@@ -221,7 +243,11 @@ def migrate_carState(msgs):
 @migration(inputs=["managerState"])
 def migrate_managerState(msgs):
   ops = []
+  migrated_processes = [(name, True, 0, False, 0) for name in managed_processes]
   for index, msg in msgs:
+    processes = msg.managerState.processes
+    if [(p.name, p.running, p.pid, p.shouldBeRunning, p.exitCode) for p in processes] == migrated_processes:
+      continue
     new_msg = msg.as_builder()
     new_msg.managerState.processes = [{'name': name, 'running': True} for name in managed_processes]
     ops.append((index, new_msg.as_reader()))
@@ -232,11 +258,12 @@ def migrate_managerState(msgs):
 def migrate_gpsLocation(msgs):
   ops = []
   for index, msg in msgs:
-    new_msg = msg.as_builder()
-    g = getattr(new_msg, new_msg.which())
+    g = getattr(msg, msg.which())
     # hasFix is a newer field
-    if not g.hasFix and g.flags == 1:
-      g.hasFix = True
+    if g.hasFix or g.flags != 1:
+      continue
+    new_msg = msg.as_builder()
+    getattr(new_msg, new_msg.which()).hasFix = True
     ops.append((index, new_msg.as_reader()))
   return ops, [], []
 
@@ -250,7 +277,7 @@ def migrate_deviceState(msgs):
 
   ops = []
   for i, msg in msgs:
-    if msg.which() == 'deviceState':
+    if msg.which() == 'deviceState' and msg.deviceState.deviceType != init_data.deviceType:
       n = msg.as_builder()
       n.deviceState.deviceType = init_data.deviceType
       ops.append((i, n.as_reader()))
@@ -305,6 +332,11 @@ def migrate_pandaStates(msgs):
       new_msg.pandaStates[0].safetyParam = safety_param
       ops.append((index, new_msg.as_reader()))
     elif msg.which() == 'pandaStates':
+      if not len(msg.pandaStates):
+        continue
+      panda_state = msg.pandaStates[-1]
+      if panda_state.safetyParam == safety_param and not (panda_state.alternativeExperience & 1):
+        continue
       new_msg = msg.as_builder()
       new_msg.pandaStates[-1].safetyParam = safety_param
       # Clear DISABLE_DISENGAGE_ON_GAS bit to fix controls mismatch
@@ -387,6 +419,9 @@ def migrate_cameraStates(msgs):
 def migrate_carParams(msgs):
   ops = []
   for index, msg in msgs:
+    fingerprint, brand = msg.carParams.carFingerprint, msg.carParams.brand
+    if MIGRATION.get(fingerprint, fingerprint) == fingerprint and all(car_fw.brand == brand for car_fw in msg.carParams.carFw):
+      continue
     CP = msg.as_builder()
     CP.carParams.carFingerprint = MIGRATION.get(CP.carParams.carFingerprint, CP.carParams.carFingerprint)
     for car_fw in CP.carParams.carFw:
@@ -457,6 +492,9 @@ def migrate_onroadEvents(msgs):
 def migrate_driverMonitoringState(msgs):
   ops = []
   for index, msg in msgs:
+    # events is always rebuilt from eventsDEPRECATED, clearing it on newer logs too, so the replay refs stay the same
+    if not len(msg.driverMonitoringState.eventsDEPRECATED) and not len(msg.driverMonitoringState.events):
+      continue
     msg = msg.as_builder()
     events = []
     for event in msg.driverMonitoringState.eventsDEPRECATED:
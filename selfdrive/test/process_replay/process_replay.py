@@ -3,6 +3,7 @@ import os
 import time
 import copy
 import heapq
+import importlib
 import signal
 from collections import Counter
 from dataclasses import dataclass, field
@@ -26,6 +27,7 @@ from openpilot.common.realtime import DT_CTRL
 from openpilot.system.manager.process_config import managed_processes
 from openpilot.selfdrive.test.process_replay.vision_meta import meta_from_camera_state, available_streams
 from openpilot.selfdrive.test.process_replay.migration import migrate_all
+from openpilot.selfdrive.test.process_replay.segment_profile import SegmentProfile
 from openpilot.selfdrive.test.process_replay.capture import ProcessOutputCapture
 from openpilot.tools.lib.logreader import LogIterable
 from openpilot.tools.lib.framereader import FrameReader
@@ -130,6 +132,8 @@ class ProcessConfig:
   main_pub_drained: bool = False
   vision_pubs: list[str] = field(default_factory=list)
   ignore_alive_pubs: list[str] = field(default_factory=list)
+  # Set if the process module exposes setup(sub_master, pub_master) -> (sm, pm, step), so it can be stepped in-process
+  in_process: bool = False
 
   def __post_init__(self):
     # If the process is polling a service, we can just lock that one to speed up replay
@@ -150,6 +154,8 @@ class ProcessContainer:
     self.vipc_server: VisionIpcServer | None = None
     self.environ_config: dict[str, Any] | None = None
     self.capture: ProcessOutputCapture | None = None
+    # (harness, process) seconds of each cycle
+    self.step_timings: list[tuple[float, float]] = []
 
   @property
   def has_empty_queue(self) -> bool:
@@ -289,7 +295,10 @@ class ProcessContainer:
         if self.cfg.main_pub and self.cfg.main_pub_drained:
           trigger_empty_recv = any(m.which() == self.cfg.main_pub for m in self.msg_queue)
 
-        # get output msgs from previous inputs
+        # wait for the process to finish the previous cycle, then get output msgs from previous inputs
+        cycle_start = time.perf_counter()
+        self.rc.wait_for_recv_called()
+        process_time = time.perf_counter() - cycle_start
         output_msgs = self.get_output_msgs(msg.logMonoTime)
 
         for m in self.msg_queue:
@@ -300,7 +309,8 @@ class ProcessContainer:
             camera_meta = meta_from_camera_state(m.which())
             assert frs is not None
             img = frs[m.which()].get(camera_state.frameId)
-            self.vipc_server.send(camera_meta.stream, img.flatten().tobytes(),
+            # frames are contiguous, so the server copies straight from the decoded frame
+            self.vipc_server.send(camera_meta.stream, img.reshape(-1),
                                   camera_state.frameId, camera_state.timestampSof, camera_state.timestampEof)
         self.msg_queue = []
 
@@ -308,11 +318,148 @@ class ProcessContainer:
         if trigger_empty_recv:
           self.rc.unlock_sockets()
         self.cnt += 1
+        self.step_timings.append((time.perf_counter() - cycle_start - process_time, process_time))
     assert self.process.proc.is_alive()
 
     return output_msgs
 
 
+class ReplaySubMaster(messaging.SubMaster):
+  """SubMaster without sockets, updated by the replay harness through update_msgs"""
+  def _create_socket(self, s, poller, addr):
+    return None
+
+  def update(self, timeout: int = 100) -> None:
+    raise RuntimeError("ReplaySubMaster is updated by the replay harness")
+
+
+class ReplayPubMaster(messaging.PubMaster):
+  """PubMaster without sockets, collecting sent messages for the replay harness"""
+  def __init__(self, services: list[str]):
+    self.services = services
+    self.message_words: dict[str, int] = {}
+    self.sent: list[capnp._DynamicStructReader] = []
+
+  def send(self, s: str, dat: bytes | capnp._DynamicStructBuilder) -> None:
+    if not isinstance(dat, bytes):
+      dat = dat.to_bytes()
+    self.sent.append(messaging.log_from_bytes(dat))
+
+
+class InProcessContainer(ProcessContainer):
+  """
+  Runs the process in lock-step inside the replay process: each cycle the latest message of each service is passed
+  to the process's SubMaster (like the conflated sockets would), and its step function is called directly.
+  Outputs are timestamped like the ones of ProcessContainer, so both produce the same logs.
+  """
+  def __init__(self, cfg: ProcessConfig):
+    super().__init__(cfg)
+    self.process_sm: ReplaySubMaster | None = None
+    self.process_pm: ReplayPubMaster | None = None
+    self.step: Callable[[], None] | None = None
+
+  def start(
+    self, params_config: dict[str, Any], environ_config: dict[str, Any],
+    all_msgs: LogIterable, frs: dict[str, FrameReader] | None,
+    fingerprint: str | None, capture_output: bool
+  ):
+    assert len(self.cfg.vision_pubs) == 0, "vision processes can't be replayed in-process"
+    with self.prefix:
+      self.prefix.create_dirs()
+      self._setup_env(params_config, environ_config)
+
+      if self.cfg.config_callback is not None:
+        params = Params()
+        self.cfg.config_callback(params, self.cfg, all_msgs)
+
+      if self.cfg.init_callback is not None:
+        self.cfg.init_callback(None, None, all_msgs, fingerprint)
+
+      module = importlib.import_module(f"openpilot.{self.process.module}")
+      self.process_sm, self.process_pm, self.step = module.setup(ReplaySubMaster, ReplayPubMaster)
+
+  def stop(self):
+    with self.prefix:
+      self.prefix.clean_dirs()
+      self._clean_env()
+
+  def get_output_msgs(self, start_time: int):
+    assert self.process_pm is not None
+
+    output_msgs = []
+    for m in self.process_pm.sent:
+      m = m.as_builder()
+      m.logMonoTime = start_time + int(self.cfg.processing_time * 1e9)
+      output_msgs.append(m.as_reader())
+    self.process_pm.sent = []
+    return output_msgs
+
+  def run_step(self, msg: capnp._DynamicStructReader, frs: dict[str, FrameReader] | None) -> list[capnp._DynamicStructReader]:
+    assert self.process_sm is not None and self.step is not None
+
+    output_msgs = []
+    end_of_cycle = True
+    if self.cfg.should_recv_callback is not None:
+      end_of_cycle = self.cfg.should_recv_callback(msg, self.cfg, self.cnt)
+
+    self.msg_queue.append(msg)
+    if end_of_cycle:
+      with self.prefix:
+        cycle_start = time.perf_counter()
+        # get output msgs from previous inputs
+        output_msgs = self.get_output_msgs(msg.logMonoTime)
+
+        latest_msgs = {m.which(): m for m in self.msg_queue}
+        self.msg_queue = []
+
+        self.process_sm.update_msgs(time.monotonic(), list(latest_msgs.values()))
+        step_start = time.perf_counter()
+        self.step()
+        process_time = time.perf_counter() - step_start
+        self.cnt += 1
+        self.step_timings.append((time.perf_counter() - cycle_start - process_time, process_time))
+
+    return output_msgs
+
+
+class ReplayQueue:
+  """
+  Merges messages taken from logs (external, already sorted by logMonoTime) with messages generated by
+  replayed processes (internal) in a single heap. Messages are popped in logMonoTime order, internal messages
+  before external ones with the same logMonoTime, and internal messages with equal logMonoTime in publish order.
+  Only the next external message is kept in the heap, so each push/pop is O(log(internal messages)).
+  """
+  def __init__(self, external_msgs: Iterable[capnp._DynamicStructReader]):
+    self._external = iter(external_msgs)
+    # each element: (logMonoTime, 0 for internal or 1 for external, insertion counter, message)
+    self._heap: list[tuple[int, int, int, capnp._DynamicStructReader]] = []
+    self._counter = 0
+    self.has_external = True
+    self.internal_count = 0
+    self._push_next_external()
+
+  def _push_next_external(self):
+    msg = next(self._external, None)
+    if msg is None:
+      self.has_external = False
+      return
+    heapq.heappush(self._heap, (msg.logMonoTime, 1, self._counter, msg))
+    self._counter += 1
+
+  def push(self, msg: capnp._DynamicStructReader):
+    heapq.heappush(self._heap, (msg.logMonoTime, 0, self._counter, msg))
+    self._counter += 1
+    self.internal_count += 1
+
+  def pop(self) -> tuple[capnp._DynamicStructReader, bool]:
+    _, external, _, msg = heapq.heappop(self._heap)
+    if external:
+      self._push_next_external()
+    else:
+      self.internal_count -= 1
+    return msg, bool(external)
+
+
 def card_fingerprint_callback(rc, pm, msgs, fingerprint):
   print("start fingerprinting")
   params = Params()
@@ -461,6 +608,7 @@ CONFIGS = [
     ignore=["logMonoTime"],
     init_callback=get_car_params_callback,
     should_recv_callback=MessageBasedRcvCallback("modelV2"),
+    in_process=True,
   ),
   ProcessConfig(
     proc_name="plannerd",
@@ -470,6 +618,7 @@ CONFIGS = [
     init_callback=get_car_params_callback,
     should_recv_callback=MessageBasedRcvCallback("modelV2"),
     tolerance=NUMPY_TOLERANCE,
+    in_process=True,
   ),
   ProcessConfig(
     proc_name="calibrationd",
@@ -478,6 +627,7 @@ CONFIGS = [
     ignore=["logMonoTime"],
     init_callback=get_car_params_callback,
     should_recv_callback=MessageBasedRcvCallback("cameraOdometry", True),
+    in_process=True,
   ),
   ProcessConfig(
     proc_name="dmonitoringd",
@@ -573,31 +723,36 @@ def get_custom_params_from_lr(lr: LogIterable, initial_state: str = "first") ->
   The params may be based on first or last message of given type (carParams, liveCalibration, liveParameters, liveTorqueParameters) in the logs.
   """
 
-  car_params = [m for m in lr if m.which() == "carParams"]
-  live_calibration = [m for m in lr if m.which() == "liveCalibration"]
-  live_parameters = [m for m in lr if m.which() == "liveParameters"]
-  live_torque_parameters = [m for m in lr if m.which() == "liveTorqueParameters"]
-
   assert initial_state in ["first", "last"]
-  msg_index = 0 if initial_state == "first" else -1
+  profile = lr if isinstance(lr, SegmentProfile) else SegmentProfile.from_msgs(lr)
+  get_msg = profile.first if initial_state == "first" else profile.last
 
-  assert len(car_params) > 0, "carParams required for initial state of liveParameters and CarParamsPrevRoute"
-  CP = car_params[msg_index].carParams
+  car_params = get_msg("carParams")
+  assert car_params is not None, "carParams required for initial state of liveParameters and CarParamsPrevRoute"
+  CP = car_params.carParams
 
   custom_params = {
     "CarParamsPrevRoute": CP.as_builder().to_bytes()
   }
 
-  if len(live_calibration) > 0:
-    custom_params["CalibrationParams"] = live_calibration[msg_index].as_builder().to_bytes()
-  if len(live_parameters) > 0:
-    custom_params["LiveParametersV2"] = live_parameters[msg_index].as_builder().to_bytes()
-  if len(live_torque_parameters) > 0:
-    custom_params["LiveTorqueParameters"] = live_torque_parameters[msg_index].as_builder().to_bytes()
+  for msg_type, param in (("liveCalibration", "CalibrationParams"), ("liveParameters", "LiveParametersV2"),
+                          ("liveTorqueParameters", "LiveTorqueParameters")):
+    msg = get_msg(msg_type)
+    if msg is not None:
+      custom_params[param] = msg.as_builder().to_bytes()
 
   return custom_params
 
 
+def get_migration_flags(cfgs: Iterable[ProcessConfig]) -> dict[str, bool]:
+  cfgs = list(cfgs)
+  return {
+    "manager_states": True,
+    "panda_states": any("pandaStates" in cfg.pubs for cfg in cfgs),
+    "camera_states": any(len(cfg.vision_pubs) != 0 for cfg in cfgs),
+  }
+
+
 def replay_process_with_name(name: str | Iterable[str], lr: LogIterable, *args, **kwargs) -> list[capnp._DynamicStructReader]:
   if isinstance(name, str):
     cfgs = [get_process_config(name)]
@@ -612,22 +767,33 @@ def replay_process_with_name(name: str | Iterable[str], lr: LogIterable, *args,
 def replay_process(
   cfg: ProcessConfig | Iterable[ProcessConfig], lr: LogIterable, frs: dict[str, FrameReader] | None = None,
   fingerprint: str | None = None, return_all_logs: bool = False, custom_params: dict[str, Any] | None = None,
-  captured_output_store: dict[str, dict[str, str]] | None = None, disable_progress: bool = False
+  captured_output_store: dict[str, dict[str, str]] | None = None, disable_progress: bool = False, migrate: bool = True,
+  in_process: bool = False, step_timings_store: dict[str, list[tuple[float, float]]] | None = None
 ) -> list[capnp._DynamicStructReader]:
+  """
+  Pass migrate=False if lr was already migrated with migrate_all(lr, **get_migration_flags(cfgs))
+  Pass in_process=True to step processes that support it inside this process, instead of spawning them
+  lr may be a SegmentProfile, which is reused if the migration didn't change anything
+  Pass step_timings_store to get the (harness, process) seconds of every cycle of each process
+  """
   if isinstance(cfg, Iterable):
     cfgs = list(cfg)
   else:
     cfgs = [cfg]
 
-  all_msgs = migrate_all(lr,
-                         manager_states=True,
-                         panda_states=any("pandaStates" in cfg.pubs for cfg in cfgs),
-                         camera_states=any(len(cfg.vision_pubs) != 0 for cfg in cfgs))
-  process_logs = _replay_multi_process(cfgs, all_msgs, frs, fingerprint, custom_params, captured_output_store, disable_progress)
+  profile = lr if isinstance(lr, SegmentProfile) else None
+  if migrate:
+    all_msgs = migrate_all(lr, **get_migration_flags(cfgs))
+  else:
+    all_msgs = profile.msgs if profile is not None else list(lr)
+  if profile is None or all_msgs is not profile.msgs:
+    profile = SegmentProfile.from_msgs(all_msgs)
+  process_logs = _replay_multi_process(cfgs, profile, frs, fingerprint, custom_params, captured_output_store, disable_progress, in_process,
+                                      step_timings_store)
 
   if return_all_logs:
     keys = {m.which() for m in process_logs}
-    modified_logs = [m for m in all_msgs if m.which() not in keys]
+    modified_logs = [all_msgs[i] for i in profile.indices(set(profile.types) - keys)]
     modified_logs.extend(process_logs)
     modified_logs.sort(key=lambda m: int(m.logMonoTime))
     log_msgs = modified_logs
@@ -639,14 +805,20 @@ def replay_process(
 
 def _replay_multi_process(
   cfgs: list[ProcessConfig], lr: LogIterable, frs: dict[str, FrameReader] | None, fingerprint: str | None,
-  custom_params: dict[str, Any] | None, captured_output_store: dict[str, dict[str, str]] | None, disable_progress: bool
+  custom_params: dict[str, Any] | None, captured_output_store: dict[str, dict[str, str]] | None, disable_progress: bool,
+  in_process: bool = False, step_timings_store: dict[str, list[tuple[float, float]]] | None = None
 ) -> list[capnp._DynamicStructReader]:
+  profile = lr if isinstance(lr, SegmentProfile) else SegmentProfile.from_msgs(lr)
+  if not profile.is_sorted:
+    profile = SegmentProfile.from_msgs(sorted(profile, key=lambda msg: msg.logMonoTime))
+
   if fingerprint is not None:
-    params_config = generate_params_config(lr=lr, fingerprint=fingerprint, custom_params=custom_params)
+    params_config = generate_params_config(lr=profile, fingerprint=fingerprint, custom_params=custom_params)
     env_config = generate_environ_config(fingerprint=fingerprint)
   else:
-    CP = next((m.carParams for m in lr if m.which() == "carParams"), None)
-    params_config = generate_params_config(lr=lr, CP=CP, custom_params=custom_params)
+    car_params = profile.first("carParams")
+    CP = car_params.carParams if car_params is not None else None
+    params_config = generate_params_config(lr=profile, CP=CP, custom_params=custom_params)
     env_config = generate_environ_config(CP=CP)
 
   # validate frs and vision pubs
@@ -655,46 +827,38 @@ def _replay_multi_process(
     assert frs is not None, "frs must be provided when replaying process using vision streams"
     assert all(meta_from_camera_state(st) is not None for st in all_vision_pubs), \
                                                           f"undefined vision stream spotted, probably misconfigured process: (vision pubs: {all_vision_pubs})"
-    required_vision_pubs = {m.camera_state for m in available_streams(lr)} & set(all_vision_pubs)
+    required_vision_pubs = {m.camera_state for m in available_streams(profile)} & set(all_vision_pubs)
     assert all(st in frs for st in required_vision_pubs), f"frs for this process must contain following vision streams: {required_vision_pubs}"
 
-  all_msgs = sorted(lr, key=lambda msg: msg.logMonoTime)
   log_msgs = []
   containers = []
   try:
     for cfg in cfgs:
-      container = ProcessContainer(cfg)
+      container = InProcessContainer(cfg) if in_process and cfg.in_process else ProcessContainer(cfg)
       containers.append(container)
-      container.start(params_config, env_config, all_msgs, frs, fingerprint, captured_output_store is not None)
+      container.start(params_config, env_config, profile, frs, fingerprint, captured_output_store is not None)
 
     all_pubs = {pub for container in containers for pub in container.pubs}
     all_subs = {sub for container in containers for sub in container.subs}
     lr_pubs = all_pubs - all_subs
     pubs_to_containers = {pub: [container for container in containers if pub in container.pubs] for pub in all_pubs}
 
-    pub_msgs = [msg for msg in all_msgs if msg.which() in lr_pubs]
-    # external queue for messages taken from logs; internal queue for messages generated by processes, which will be republished
-    external_pub_queue: list[capnp._DynamicStructReader] = pub_msgs.copy()
-    internal_pub_queue: list[capnp._DynamicStructReader] = []
-    # heap for maintaining the order of messages generated by processes, where each element: (logMonoTime, index in internal_pub_queue)
-    internal_pub_index_heap: list[tuple[int, int]] = []
-
-    pbar = tqdm(total=len(external_pub_queue), disable=disable_progress)
-    while len(external_pub_queue) != 0 or (len(internal_pub_index_heap) != 0 and not all(c.has_empty_queue for c in containers)):
-      if len(internal_pub_index_heap) == 0 or (len(external_pub_queue) != 0 and external_pub_queue[0].logMonoTime < internal_pub_index_heap[0][0]):
-        msg = external_pub_queue.pop(0)
+    # external messages are taken from logs; internal messages are generated by processes, and will be republished
+    pub_msgs = [profile.msgs[i] for i in profile.indices(lr_pubs)]
+    pub_queue = ReplayQueue(pub_msgs)
+
+    pbar = tqdm(total=len(pub_msgs), disable=disable_progress)
+    while pub_queue.has_external or (pub_queue.internal_count != 0 and not all(c.has_empty_queue for c in containers)):
+      msg, external = pub_queue.pop()
+      if external:
         pbar.update(1)
-      else:
-        _, index = heapq.heappop(internal_pub_index_heap)
-        msg = internal_pub_queue[index]
 
       target_containers = pubs_to_containers[msg.which()]
       for container in target_containers:
         output_msgs = container.run_step(msg, frs)
         for m in output_msgs:
           if m.which() in all_pubs:
-            internal_pub_queue.append(m)
-            heapq.heappush(internal_pub_index_heap, (m.logMonoTime, len(internal_pub_queue) - 1))
+            pub_queue.push(m)
         log_msgs.extend(output_msgs)
 
     # flush last set of messages from each process
@@ -704,10 +868,12 @@ def _replay_multi_process(
   finally:
     for container in containers:
       container.stop()
-      if captured_output_store is not None:
+      if captured_output_store is not None and not isinstance(container, InProcessContainer):
         assert container.capture is not None
         out, err = container.capture.read_outerr()
         captured_output_store[container.cfg.proc_name] = {"out": out, "err": err}
+      if step_timings_store is not None:
+        step_timings_store[container.cfg.proc_name] = container.step_timings
 
   return log_msgs
 
@@ -722,10 +888,10 @@ def generate_params_config(lr=None, CP=None, fingerprint=None, custom_params=Non
   if custom_params is not None:
     params_dict.update(custom_params)
   if lr is not None:
-    has_ublox = any(msg.which() == "ubloxGnss" for msg in lr)
-    params_dict["UbloxAvailable"] = has_ublox
-    is_rhd = next((msg.driverMonitoringState.isRHD for msg in lr if msg.which() == "driverMonitoringState"), False)
-    params_dict["IsRhdDetected"] = is_rhd
+    profile = lr if isinstance(lr, SegmentProfile) else SegmentProfile.from_msgs(lr)
+    params_dict["UbloxAvailable"] = "ubloxGnss" in profile
+    driver_monitoring_state = profile.first("driverMonitoringState")
+    params_dict["IsRhdDetected"] = driver_monitoring_state.driverMonitoringState.isRHD if driver_monitoring_state is not None else False
 
   if CP is not None:
     if fingerprint is None:
@@ -9,6 +9,7 @@ from collections.abc import Iterable
 
 from openpilot.selfdrive.test.process_replay.process_replay import CONFIGS, FAKEDATA, ProcessConfig, replay_process, get_process_config, \
                                                                    check_openpilot_enabled, check_most_messages_valid, get_custom_params_from_lr
+from openpilot.selfdrive.test.process_replay.segment_profile import SegmentProfile, get_segment_profile
 from openpilot.selfdrive.test.update_ci_routes import upload_route
 from openpilot.tools.lib.framereader import FrameReader
 from openpilot.tools.lib.logreader import LogReader, LogIterable, save_log
@@ -19,33 +20,37 @@ def regen_segment(
   lr: LogIterable, frs: dict[str, Any] | None = None,
   processes: Iterable[ProcessConfig] = CONFIGS, disable_tqdm: bool = False
 ) -> list[capnp._DynamicStructReader]:
-  all_msgs = sorted(lr, key=lambda m: m.logMonoTime)
-  custom_params = get_custom_params_from_lr(all_msgs)
+  profile = lr if isinstance(lr, SegmentProfile) else SegmentProfile.from_msgs(lr)
+  if not profile.is_sorted:
+    profile = SegmentProfile.from_msgs(sorted(profile, key=lambda m: m.logMonoTime))
+  custom_params = get_custom_params_from_lr(profile)
 
   print("Replayed processes:", [p.proc_name for p in processes])
   print("\n\n", "*"*30, "\n\n", sep="")
 
-  output_logs = replay_process(processes, all_msgs, frs, return_all_logs=True, custom_params=custom_params, disable_progress=disable_tqdm)
+  output_logs = replay_process(processes, profile, frs, return_all_logs=True, custom_params=custom_params, disable_progress=disable_tqdm)
 
   return output_logs
 
 
 def setup_data_readers(
     route: str, sidx: int, needs_driver_cam: bool = True, needs_road_cam: bool = True, dummy_driver_cam: bool = False
-) -> tuple[LogReader, dict[str, Any]]:
-  lr = LogReader(f"{route}/{sidx}/r")
+) -> tuple[SegmentProfile, dict[str, Any]]:
+  lr = get_segment_profile(LogReader(f"{route}/{sidx}/r"), cache_key=f"{route}/{sidx}")
   frs = {}
   if needs_road_cam:
-    frs['roadCameraState'] = FrameReader(get_url(route, str(sidx), "fcamera.hevc"))
-    if next((True for m in lr if m.which() == "wideRoadCameraState"), False):
-      frs['wideRoadCameraState'] = FrameReader(get_url(route, str(sidx), "ecamera.hevc"))
+    frs['roadCameraState'] = FrameReader(get_url(route, str(sidx), "fcamera.hevc"), decode_ahead=True)
+    if "wideRoadCameraState" in lr:
+      frs['wideRoadCameraState'] = FrameReader(get_url(route, str(sidx), "ecamera.hevc"), decode_ahead=True)
   if needs_driver_cam:
     if dummy_driver_cam:
-      frs['driverCameraState'] = FrameReader(get_url(route, str(sidx), "fcamera.hevc")) # Use fcam as dummy
+      frs['driverCameraState'] = FrameReader(get_url(route, str(sidx), "fcamera.hevc"), decode_ahead=True) # Use fcam as dummy
     else:
-      device_type = next(str(msg.initData.deviceType) for msg in lr if msg.which() == "initData")
+      init_data = lr.first("initData")
+      assert init_data is not None, "initData is required to check the device type"
+      device_type = str(init_data.initData.deviceType)
       assert device_type != "neo", "Driver camera not supported on neo segments. Use dummy dcamera."
-      frs['driverCameraState'] = FrameReader(get_url(route, str(sidx), "dcamera.hevc"))
+      frs['driverCameraState'] = FrameReader(get_url(route, str(sidx), "dcamera.hevc"), decode_ahead=True)
 
   return lr, frs
 
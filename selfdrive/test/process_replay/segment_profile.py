@@ -0,0 +1,103 @@
+import os
+import tempfile
+from hashlib import sha256
+
+import capnp
+import numpy as np
+
+from openpilot.system.hardware.hw import Paths
+from openpilot.tools.lib.logreader import LogIterable
+
+
+class SegmentProfile:
+  """
+  Type and logMonoTime of every message of a segment, collected in a single pass over the log. It answers which
+  services are present, how many messages they have, their first and last messages and the time bounds without
+  going over the log again. It iterates over the messages, so it can be passed wherever a LogIterable is expected.
+  """
+  def __init__(self, msgs: list[capnp._DynamicStructReader], types: list[str], type_ids: np.ndarray, log_mono_times: np.ndarray):
+    assert len(msgs) == len(type_ids) == len(log_mono_times)
+    self.msgs = msgs
+    self.types = types
+    self.type_ids = type_ids
+    self.log_mono_times = log_mono_times
+
+    self._type_index = {t: i for i, t in enumerate(types)}
+    counts = np.bincount(type_ids, minlength=len(types))
+    self.counts = dict(zip(types, counts.tolist(), strict=True))
+    # index of the first and last message of each type
+    _, self._first = np.unique(type_ids, return_index=True)
+    _, last_reversed = np.unique(type_ids[::-1], return_index=True)
+    self._last = len(type_ids) - 1 - last_reversed
+    self.is_sorted = bool(np.all(log_mono_times[1:] >= log_mono_times[:-1]))
+    self.start_time = int(log_mono_times.min()) if len(msgs) else 0
+    self.end_time = int(log_mono_times.max()) if len(msgs) else 0
+
+  @classmethod
+  def from_msgs(cls, msgs: LogIterable) -> 'SegmentProfile':
+    msgs = msgs if isinstance(msgs, list) else list(msgs)
+    type_index: dict[str, int] = {}
+    type_ids, log_mono_times = [], []
+    for msg in msgs:
+      type_ids.append(type_index.setdefault(msg.which(), len(type_index)))
+      log_mono_times.append(msg.logMonoTime)
+    return cls(msgs, list(type_index), np.array(type_ids, dtype=np.uint16), np.array(log_mono_times, dtype=np.uint64))
+
+  def __iter__(self):
+    return iter(self.msgs)
+
+  def __len__(self) -> int:
+    return len(self.msgs)
+
+  def __contains__(self, which: str) -> bool:
+    return which in self._type_index
+
+  def first(self, which: str) -> capnp._DynamicStructReader | None:
+    if which not in self._type_index:
+      return None
+    return self.msgs[self._first[self._type_index[which]]]
+
+  def last(self, which: str) -> capnp._DynamicStructReader | None:
+    if which not in self._type_index:
+      return None
+    return self.msgs[self._last[self._type_index[which]]]
+
+  def indices(self, which: str | set[str]) -> np.ndarray:
+    """Sorted indices of the messages of one or more types"""
+    whiches = {which} if isinstance(which, str) else which
+    ids = [self._type_index[w] for w in whiches if w in self._type_index]
+    return np.flatnonzero(np.isin(self.type_ids, ids))
+
+  def grouped_indices(self) -> dict[str, list[int]]:
+    if len(self.types) == 0:
+      return {}
+    order = np.argsort(self.type_ids, kind="stable")
+    groups = np.split(order, np.cumsum([self.counts[t] for t in self.types])[:-1])
+    return {t: group.tolist() for t, group in zip(self.types, groups, strict=True)}
+
+
+def _cache_path(cache_key: str) -> str:
+  return os.path.join(Paths.download_cache_root(), "segment_profile", sha256(cache_key.encode()).hexdigest() + ".npz")
+
+
+def get_segment_profile(lr: LogIterable, cache_key: str | None = None) -> SegmentProfile:
+  """
+  Profiles the messages of lr. If cache_key identifies the (unmodified) segment, the profile is stored,
+  so later calls only read the messages instead of going over them again.
+  """
+  msgs = lr if isinstance(lr, list) else list(lr)
+  if cache_key is None:
+    return SegmentProfile.from_msgs(msgs)
+
+  cache_path = _cache_path(cache_key)
+  if os.path.exists(cache_path):
+    with np.load(cache_path) as data:
+      if len(data['type_ids']) == len(msgs):
+        return SegmentProfile(msgs, data['types'].tolist(), data['type_ids'], data['log_mono_times'])
+
+  profile = SegmentProfile.from_msgs(msgs)
+  os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+  with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path), suffix=".npz", delete=False) as f:
+    np.savez(f, types=np.array(profile.types, dtype=str), type_ids=profile.type_ids, log_mono_times=profile.log_mono_times)
+  os.replace(f.name, cache_path)
+  return profile
@@ -3,7 +3,9 @@ import argparse
 import concurrent.futures
 import os
 import sys
-from collections import defaultdict
+import time
+import zstandard as zstd
+from collections import Counter, defaultdict
 from tqdm import tqdm
 from typing import Any
 
@@ -11,9 +13,10 @@ from opendbc.car.car_helpers import interface_names
 from openpilot.common.git import get_commit
 from openpilot.tools.lib.openpilotci import get_url, upload_file
 from openpilot.selfdrive.test.process_replay.compare_logs import compare_logs, format_diff
+from openpilot.selfdrive.test.process_replay.migration import migrate_all
+from openpilot.selfdrive.test.process_replay.segment_profile import get_segment_profile
 from openpilot.selfdrive.test.process_replay.process_replay import CONFIGS, PROC_REPLAY_DIR, FAKEDATA, replay_process, \
-                                                                   check_most_messages_valid
-from openpilot.tools.lib.filereader import FileReader
+                                                                   check_most_messages_valid, get_migration_flags
 from openpilot.tools.lib.logreader import LogReader, save_log
 
 source_segments = [
@@ -72,9 +75,11 @@ EXCLUDED_PROCS = {"modeld", "dmonitoringmodeld"}
 def run_test_process(data):
   segment, cfg, args, cur_log_fn, ref_log_path, lr_dat = data
   res = None
+  st = time.monotonic()
   if not args.upload_only:
     lr = LogReader.from_bytes(lr_dat)
-    res, log_msgs = test_process(cfg, lr, segment, ref_log_path, cur_log_fn, args.ignore_fields, args.ignore_msgs)
+    res, log_msgs = test_process(cfg, lr, segment, ref_log_path, cur_log_fn, args.ignore_fields, args.ignore_msgs, migrate=False,
+                                 in_process=args.in_process)
     # save logs so we can upload when updating refs
     save_log(cur_log_fn, log_msgs)
 
@@ -83,16 +88,25 @@ def run_test_process(data):
     assert os.path.exists(cur_log_fn), f"Cannot find log to upload: {cur_log_fn}"
     upload_file(cur_log_fn, os.path.basename(cur_log_fn))
     os.remove(cur_log_fn)
-  return (segment, cfg.proc_name, res)
+  return (segment, cfg.proc_name, res, time.monotonic() - st)
 
 
-def get_log_data(segment):
+def prepare_log_data(data):
+  """
+  Downloads, decompresses and migrates a segment once for every distinct set of migration flags. The migrated
+  logs are kept in memory zstd compressed, so each process replayed on the segment only has to decompress them.
+  """
+  segment, all_migration_flags = data
   r, n = segment.rsplit("--", 1)
-  with FileReader(get_url(r, n, "rlog.zst")) as f:
-    return (segment, f.read())
+  profile = get_segment_profile(LogReader(get_url(r, n, "rlog.zst")), cache_key=segment)
+  migrated = []
+  for migration_flags in all_migration_flags:
+    dat = b"".join(msg.as_builder().to_bytes() for msg in migrate_all(profile, **migration_flags))
+    migrated.append((migration_flags, zstd.compress(dat)))
+  return segment, migrated, Counter(profile.counts)
 
 
-def test_process(cfg, lr, segment, ref_log_path, new_log_path, ignore_fields=None, ignore_msgs=None):
+def test_process(cfg, lr, segment, ref_log_path, new_log_path, ignore_fields=None, ignore_msgs=None, migrate=True, in_process=False):
   if ignore_fields is None:
     ignore_fields = []
   if ignore_msgs is None:
@@ -101,7 +115,7 @@ def test_process(cfg, lr, segment, ref_log_path, new_log_path, ignore_fields=Non
   ref_log_msgs = list(LogReader(ref_log_path))
 
   try:
-    log_msgs = replay_process(cfg, lr, disable_progress=True)
+    log_msgs = replay_process(cfg, lr, disable_progress=True, migrate=migrate, in_process=in_process)
   except Exception as e:
     raise Exception("failed on segment: " + segment) from e
 
@@ -146,6 +160,8 @@ if __name__ == "__main__":
                       help="Skips testing processes and uploads logs from previous test run")
   parser.add_argument("-j", "--jobs", type=int, default=max(cpu_count - 2, 1),
                       help="Max amount of parallel jobs")
+  parser.add_argument("--in-process", action="store_true",
+                      help="Step processes that support it inside the test worker, instead of spawning them")
   args = parser.parse_args()
 
   tested_procs = set(args.whitelist_procs) - set(args.blacklist_procs)
@@ -177,47 +193,66 @@ if __name__ == "__main__":
     untested = (set(interface_names) - set(excluded_interfaces)) - {c.lower() for c in tested_cars}
     assert len(untested) == 0, f"Cars missing routes: {str(untested)}"
 
+  jobs = []
+  for car_brand, segment in segments:
+    if car_brand not in tested_cars:
+      continue
+
+    for cfg in CONFIGS:
+      if cfg.proc_name not in tested_procs:
+        continue
+
+      # to speed things up, we only test all segments on card
+      if cfg.proc_name not in ('card', 'controlsd', 'lagd') and car_brand not in ('HYUNDAI', 'TOYOTA'):
+        continue
+
+      jobs.append((segment, cfg))
+
   log_paths: defaultdict[str, dict[str, dict[str, str]]] = defaultdict(lambda: defaultdict(dict))
+  job_times: dict[tuple[str, str], float] = {}
   with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    segment_msg_counts: dict[str, Counter] = {}
+    log_data: dict[str, list[tuple[dict[str, bool], bytes]]] = {}
     if not args.upload_only:
-      download_segments = [seg for car, seg in segments if car in tested_cars]
-      log_data: dict[str, LogReader] = {}
-      p1 = pool.map(get_log_data, download_segments)
-      for segment, lr in tqdm(p1, desc="Getting Logs", total=len(download_segments)):
-        log_data[segment] = lr
+      segment_migration_flags: dict[str, list[dict[str, bool]]] = defaultdict(list)
+      for segment, cfg in jobs:
+        if (migration_flags := get_migration_flags([cfg])) not in segment_migration_flags[segment]:
+          segment_migration_flags[segment].append(migration_flags)
 
-    pool_args: Any = []
-    for car_brand, segment in segments:
-      if car_brand not in tested_cars:
-        continue
-
-      for cfg in CONFIGS:
-        if cfg.proc_name not in tested_procs:
-          continue
+      p1 = pool.map(prepare_log_data, segment_migration_flags.items())
+      for segment, migrated, msg_counts in tqdm(p1, desc="Getting Logs", total=len(segment_migration_flags)):
+        log_data[segment] = migrated
+        segment_msg_counts[segment] = msg_counts
 
-        # to speed things up, we only test all segments on card
-        if cfg.proc_name not in ('card', 'controlsd', 'lagd') and car_brand not in ('HYUNDAI', 'TOYOTA'):
-          continue
+      # schedule the longest jobs first, estimated by the number of messages each process receives
+      jobs.sort(key=lambda job: sum(segment_msg_counts[job[0]][pub] for pub in job[1].pubs), reverse=True)
 
-        cur_log_fn = os.path.join(FAKEDATA, f"{segment}_{cfg.proc_name}_{cur_commit}.zst")
-        if args.update_refs:  # reference logs will not exist if routes were just regenerated
-          ref_log_path = get_url(*segment.rsplit("--", 1,), "rlog.zst")
-        else:
-          ref_log_fn = os.path.join(FAKEDATA, f"{segment}_{cfg.proc_name}_{ref_commit}.zst")
-          ref_log_path = ref_log_fn if os.path.exists(ref_log_fn) else BASE_URL + os.path.basename(ref_log_fn)
+    pool_args: Any = []
+    for segment, cfg in jobs:
+      cur_log_fn = os.path.join(FAKEDATA, f"{segment}_{cfg.proc_name}_{cur_commit}.zst")
+      if args.update_refs:  # reference logs will not exist if routes were just regenerated
+        ref_log_path = get_url(*segment.rsplit("--", 1,), "rlog.zst")
+      else:
+        ref_log_fn = os.path.join(FAKEDATA, f"{segment}_{cfg.proc_name}_{ref_commit}.zst")
+        ref_log_path = ref_log_fn if os.path.exists(ref_log_fn) else BASE_URL + os.path.basename(ref_log_fn)
 
-        dat = None if args.upload_only else log_data[segment]
-        pool_args.append((segment, cfg, args, cur_log_fn, ref_log_path, dat))
+      dat = None if args.upload_only else next(d for flags, d in log_data[segment] if flags == get_migration_flags([cfg]))
+      pool_args.append((segment, cfg, args, cur_log_fn, ref_log_path, dat))
 
-        log_paths[segment][cfg.proc_name]['ref'] = ref_log_path
-        log_paths[segment][cfg.proc_name]['new'] = cur_log_fn
+      log_paths[segment][cfg.proc_name]['ref'] = ref_log_path
+      log_paths[segment][cfg.proc_name]['new'] = cur_log_fn
 
     results: Any = defaultdict(dict)
     p2 = pool.map(run_test_process, pool_args)
-    for (segment, proc, result) in tqdm(p2, desc="Running Tests", total=len(pool_args)):
+    for (segment, proc, result, job_time) in tqdm(p2, desc="Running Tests", total=len(pool_args)):
+      job_times[(segment, proc)] = job_time
       if not args.upload_only:
         results[segment][proc] = result
 
+  print("\nJob wall times:")
+  for (segment, proc), job_time in sorted(job_times.items(), key=lambda x: x[1], reverse=True):
+    print(f"  {job_time:7.2f}s  {proc:<18} {segment}")
+
   diff_short, diff_long, failed = format_diff(results, log_paths, ref_commit)
   if not upload:
     with open(os.path.join(PROC_REPLAY_DIR, "diff.txt"), "w") as f:
@@ -2,6 +2,7 @@ from collections import namedtuple
 from msgq.visionipc import VisionStreamType
 from openpilot.common.realtime import DT_MDL, DT_DMON
 from openpilot.common.transformations.camera import DEVICE_CAMERAS
+from openpilot.selfdrive.test.process_replay.segment_profile import SegmentProfile
 
 VideoStreamMeta = namedtuple("VideoStreamMeta", ["camera_state", "encode_index", "stream", "dt", "frame_sizes"])
 ROAD_CAMERA_FRAME_SIZES = {k: (v.dcam.width, v.dcam.height) for k, v in DEVICE_CAMERAS.items()}
@@ -34,10 +35,5 @@ def available_streams(lr=None):
   if lr is None:
     return [VideoStreamMeta(*meta) for meta in VIPC_STREAM_METADATA]
 
-  result = []
-  for meta in VIPC_STREAM_METADATA:
-    has_cam_state = next((True for m in lr if m.which() == meta[0]), False)
-    if has_cam_state:
-      result.append(VideoStreamMeta(*meta))
-
-  return result
+  profile = lr if isinstance(lr, SegmentProfile) else SegmentProfile.from_msgs(lr)
+  return [VideoStreamMeta(*meta) for meta in VIPC_STREAM_METADATA if meta[0] in profile]
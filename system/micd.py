@@ -17,16 +17,16 @@ SAMPLE_BUFFER = 800  # 50ms
 
 @cache
 def get_a_weighting_filter():
-  # Calculate the A-weighting filter
+  # Calculate the A-weighting filter for the non-negative frequencies of a real FFT, it's symmetric for the negative ones
   # https://en.wikipedia.org/wiki/A-weighting
-  freqs = np.fft.fftfreq(FFT_SAMPLES, d=1 / SAMPLE_RATE)
+  freqs = np.fft.rfftfreq(FFT_SAMPLES, d=1 / SAMPLE_RATE)
   A = 12194 ** 2 * freqs ** 4 / ((freqs ** 2 + 20.6 ** 2) * (freqs ** 2 + 12194 ** 2) * np.sqrt((freqs ** 2 + 107.7 ** 2) * (freqs ** 2 + 737.9 ** 2)))
   return A / np.max(A)
 
 
 def calculate_spl(measurements):
   # https://www.engineeringtoolbox.com/sound-pressure-d_711.html
-  sound_pressure = np.sqrt(np.mean(measurements ** 2))  # RMS of amplitudes
+  sound_pressure = np.sqrt(np.dot(measurements, measurements) / measurements.size)  # RMS of amplitudes
   if sound_pressure > 0:
     sound_pressure_level = 20 * np.log10(sound_pressure / REFERENCE_SPL)  # dB
   else:
@@ -34,12 +34,21 @@ def calculate_spl(measurements):
   return sound_pressure, sound_pressure_level
 
 
-def apply_a_weighting(measurements: np.ndarray) -> np.ndarray:
-  # Generate a Hanning window of the same length as the audio measurements
-  measurements_windowed = measurements * np.hanning(len(measurements))
+class AWeighting:
+  """Applies A-weighting to windows of FFT_SAMPLES measurements, reusing preallocated buffers"""
+  def __init__(self):
+    self.window = np.hanning(FFT_SAMPLES)
+    self.filter = get_a_weighting_filter()
+    self.spectrum = np.empty(FFT_SAMPLES // 2 + 1, dtype=np.complex128)
+    self.weighted = np.empty(FFT_SAMPLES)
 
-  # Apply the A-weighting filter to the signal
-  return np.abs(np.fft.ifft(np.fft.fft(measurements_windowed) * get_a_weighting_filter()))
+  def __call__(self, measurements: np.ndarray) -> np.ndarray:
+    # Apply a Hanning window and the A-weighting filter to the signal. The signal is real, so the real FFT gives the same result
+    np.multiply(measurements, self.window, out=self.weighted)
+    np.fft.rfft(self.weighted, out=self.spectrum)
+    self.spectrum *= self.filter
+    np.fft.irfft(self.spectrum, n=FFT_SAMPLES, out=self.weighted)
+    return np.abs(self.weighted, out=self.weighted)
 
 
 class Mic:
@@ -47,7 +56,9 @@ class Mic:
     self.rk = Ratekeeper(RATE)
     self.pm = messaging.PubMaster(['soundPressure', 'rawAudioData'])
 
-    self.measurements = np.empty(0)
+    self.measurements = np.empty(FFT_SAMPLES)
+    self.num_measurements = 0
+    self.a_weighting = AWeighting()
 
     self.sound_pressure = 0
     self.sound_pressure_weighted = 0
@@ -82,17 +93,19 @@ class Mic:
     msg.rawAudioData.sampleRate = SAMPLE_RATE
     self.pm.send('rawAudioData', msg)
 
+    samples = indata[:, 0]
     with self.lock:
-      self.measurements = np.concatenate((self.measurements, indata[:, 0]))
-
-      while self.measurements.size >= FFT_SAMPLES:
-        measurements = self.measurements[:FFT_SAMPLES]
-
-        self.sound_pressure, _ = calculate_spl(measurements)
-        measurements_weighted = apply_a_weighting(measurements)
-        self.sound_pressure_weighted, self.sound_pressure_level_weighted = calculate_spl(measurements_weighted)
-
-        self.measurements = self.measurements[FFT_SAMPLES:]
+      while samples.size > 0:
+        n = min(FFT_SAMPLES - self.num_measurements, samples.size)
+        self.measurements[self.num_measurements:self.num_measurements + n] = samples[:n]
+        self.num_measurements += n
+        samples = samples[n:]
+
+        if self.num_measurements == FFT_SAMPLES:
+          self.sound_pressure, _ = calculate_spl(self.measurements)
+          measurements_weighted = self.a_weighting(self.measurements)
+          self.sound_pressure_weighted, self.sound_pressure_level_weighted = calculate_spl(measurements_weighted)
+          self.num_measurements = 0
 
   @retry(attempts=10, delay=3)
   def get_stream(self, sd):
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 import os
-from typing import NoReturn, TypedDict
+import time
+from operator import itemgetter
+from typing import NamedTuple, NoReturn, TypedDict
 
 from cereal import messaging
 from openpilot.common.realtime import Ratekeeper
 from openpilot.common.swaglog import cloudlog
+from openpilot.system.statsd import statlog
 
 JIFFY = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
 PAGE_SIZE = os.sysconf(os.sysconf_names['SC_PAGE_SIZE'])
@@ -64,8 +67,15 @@ _STAT_POS = {
   'rss': 24,
   'processor': 39,
 }
+_STAT_INT_FIELDS = ('ppid', 'utime', 'stime', 'cutime', 'cstime', 'priority', 'nice', 'num_threads', 'starttime', 'vsize', 'rss', 'processor')
+# fields after the name, which ends the 2nd field; the name may contain spaces and parentheses
+_get_stat_ints = itemgetter(*(_STAT_POS[k] - 3 for k in _STAT_INT_FIELDS))
+_STAT_NUM_FIELDS_AFTER_NAME = 52 - 2
+# don't keep more stat files open than this, the remaining processes are read with open/read/close
+MAX_OPEN_STAT_FILES = 512
 
-class ProcStat(TypedDict):
+
+class ProcStat(NamedTuple):
   name: str
   pid: int
   state: str
@@ -83,34 +93,17 @@ class ProcStat(TypedDict):
   processor: int
 
 
-def _parse_proc_stat(stat: str) -> ProcStat | None:
-  open_paren = stat.find('(')
-  close_paren = stat.rfind(')')
+def _parse_proc_stat(stat: bytes) -> ProcStat | None:
+  open_paren = stat.find(b'(')
+  close_paren = stat.rfind(b')')
   if open_paren == -1 or close_paren == -1 or open_paren > close_paren:
     return None
-  name = stat[open_paren + 1:close_paren]
-  stat = stat[:open_paren] + stat[open_paren:close_paren].replace(' ', '_') + stat[close_paren:]
-  parts = stat.split()
-  if len(parts) < 52:
+  fields = stat[close_paren + 2:].split()
+  if len(fields) < _STAT_NUM_FIELDS_AFTER_NAME:
     return None
   try:
-    return {
-      'name': name,
-      'pid': int(parts[_STAT_POS['pid'] - 1]),
-      'state': parts[_STAT_POS['state'] - 1][0],
-      'ppid': int(parts[_STAT_POS['ppid'] - 1]),
-      'utime': int(parts[_STAT_POS['utime'] - 1]),
-      'stime': int(parts[_STAT_POS['stime'] - 1]),
-      'cutime': int(parts[_STAT_POS['cutime'] - 1]),
-      'cstime': int(parts[_STAT_POS['cstime'] - 1]),
-      'priority': int(parts[_STAT_POS['priority'] - 1]),
-      'nice': int(parts[_STAT_POS['nice'] - 1]),
-      'num_threads': int(parts[_STAT_POS['num_threads'] - 1]),
-      'starttime': int(parts[_STAT_POS['starttime'] - 1]),
-      'vms': int(parts[_STAT_POS['vsize'] - 1]),
-      'rss': int(parts[_STAT_POS['rss'] - 1]),
-      'processor': int(parts[_STAT_POS['processor'] - 1]),
-    }
+    return ProcStat(stat[open_paren + 1:close_paren].decode('utf-8', errors='replace'), int(stat[:open_paren]),
+                    chr(fields[0][0]), *map(int, _get_stat_ints(fields)))
   except Exception:
     cloudlog.exception("failed to parse /proc/<pid>/stat")
     return None
@@ -144,46 +137,82 @@ def _get_proc_extra(pid: int, name: str) -> ProcExtra:
   return cache
 
 
-def _procs() -> list[ProcStat]:
-  stats: list[ProcStat] = []
-  for pid_str in os.listdir('/proc'):
-    if not pid_str.isdigit():
-      continue
+class ProcSampler:
+  """
+  Reads /proc/<pid>/stat of every process. The stat files stay open between samples and are re-read with pread,
+  exe and cmdline are only read for new processes, and everything kept for processes that exited is dropped.
+  """
+  def __init__(self):
+    self.stat_fds: dict[int, int] = {}
+
+  def _read_stat(self, pid: int) -> bytes | None:
+    fd = self.stat_fds.get(pid)
+    if fd is not None:
+      try:
+        return os.pread(fd, 4096, 0)
+      except OSError:
+        # the process exited, and the pid may have been reused
+        os.close(self.stat_fds.pop(pid))
+
     try:
-      with open(f'/proc/{pid_str}/stat') as f:
-        stat = f.read()
-      parsed = _parse_proc_stat(stat)
-      if parsed is not None:
-        stats.append(parsed)
+      fd = os.open(f'/proc/{pid}/stat', os.O_RDONLY)
+    except OSError:
+      return None
+    try:
+      stat = os.pread(fd, 4096, 0)
     except OSError:
-      continue
-  return stats
+      os.close(fd)
+      return None
+    if len(self.stat_fds) < MAX_OPEN_STAT_FILES:
+      self.stat_fds[pid] = fd
+    else:
+      os.close(fd)
+    return stat
 
+  def sample(self) -> list[ProcStat]:
+    stats: list[ProcStat] = []
+    pids = {int(pid_str) for pid_str in os.listdir('/proc') if pid_str.isdigit()}
+    for pid in pids:
+      stat = self._read_stat(pid)
+      if stat is not None and (parsed := _parse_proc_stat(stat)) is not None:
+        stats.append(parsed)
+
+    for pid in self.stat_fds.keys() - pids:
+      os.close(self.stat_fds.pop(pid))
+    for pid in _proc_cache.keys() - pids:
+      del _proc_cache[pid]
+    return stats
+
+  def close(self) -> None:
+    for fd in self.stat_fds.values():
+      os.close(fd)
+    self.stat_fds.clear()
 
-def build_proc_log_message(msg) -> None:
+
+def build_proc_log_message(msg, sampler: ProcSampler) -> None:
   pl = msg.procLog
 
-  procs = _procs()
+  procs = sampler.sample()
   l = pl.init('procs', len(procs))
   for i, r in enumerate(procs):
     proc = l[i]
-    proc.pid = r['pid']
-    proc.state = ord(r['state'][0])
-    proc.ppid = r['ppid']
-    proc.cpuUser = r['utime'] / JIFFY
-    proc.cpuSystem = r['stime'] / JIFFY
-    proc.cpuChildrenUser = r['cutime'] / JIFFY
-    proc.cpuChildrenSystem = r['cstime'] / JIFFY
-    proc.priority = r['priority']
-    proc.nice = r['nice']
-    proc.numThreads = r['num_threads']
-    proc.startTime = r['starttime'] / JIFFY
-    proc.memVms = r['vms']
-    proc.memRss = r['rss'] * PAGE_SIZE
-    proc.processor = r['processor']
-    proc.name = r['name']
-
-    extra = _get_proc_extra(r['pid'], r['name'])
+    proc.pid = r.pid
+    proc.state = ord(r.state)
+    proc.ppid = r.ppid
+    proc.cpuUser = r.utime / JIFFY
+    proc.cpuSystem = r.stime / JIFFY
+    proc.cpuChildrenUser = r.cutime / JIFFY
+    proc.cpuChildrenSystem = r.cstime / JIFFY
+    proc.priority = r.priority
+    proc.nice = r.nice
+    proc.numThreads = r.num_threads
+    proc.startTime = r.starttime / JIFFY
+    proc.memVms = r.vms
+    proc.memRss = r.rss * PAGE_SIZE
+    proc.processor = r.processor
+    proc.name = r.name
+
+    extra = _get_proc_extra(r.pid, r.name)
     proc.exe = extra['exe']
     cmdline = proc.init('cmdline', len(extra['cmdline']))
     for j, arg in enumerate(extra['cmdline']):
@@ -216,9 +245,13 @@ def build_proc_log_message(msg) -> None:
 def main() -> NoReturn:
   pm = messaging.PubMaster(['procLog'])
   rk = Ratekeeper(0.5)
+  sampler = ProcSampler()
   while True:
     msg = messaging.new_message('procLog', valid=True)
-    build_proc_log_message(msg)
+    st = time.process_time()
+    build_proc_log_message(msg, sampler)
+    # CPU time spent on sampling, to know what a higher procLog rate would cost
+    statlog.sample("proclogd_sample_cpu_time", time.process_time() - st)
     pm.send('procLog', msg)
     rk.keep_time()
 
@@ -0,0 +1,25 @@
+import numpy as np
+
+from openpilot.system.micd import FFT_SAMPLES, SAMPLE_RATE, AWeighting, calculate_spl
+
+
+def a_weighting_reference(measurements):
+  freqs = np.fft.fftfreq(FFT_SAMPLES, d=1 / SAMPLE_RATE)
+  A = 12194 ** 2 * freqs ** 4 / ((freqs ** 2 + 20.6 ** 2) * (freqs ** 2 + 12194 ** 2) * np.sqrt((freqs ** 2 + 107.7 ** 2) * (freqs ** 2 + 737.9 ** 2)))
+  return np.abs(np.fft.ifft(np.fft.fft(measurements * np.hanning(FFT_SAMPLES)) * A / np.max(A)))
+
+
+class TestMicd:
+  def test_a_weighting(self):
+    a_weighting = AWeighting()
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+      measurements = rng.uniform(-1, 1, FFT_SAMPLES) * rng.uniform(0, 1)
+      np.testing.assert_allclose(a_weighting(measurements), a_weighting_reference(measurements), rtol=1e-9, atol=1e-15)
+
+  def test_spl(self):
+    measurements = np.random.default_rng(0).uniform(-1, 1, FFT_SAMPLES)
+    sound_pressure, sound_pressure_level = calculate_spl(measurements)
+    assert np.isclose(sound_pressure, np.sqrt(np.mean(measurements ** 2)))
+    assert np.isclose(sound_pressure_level, 20 * np.log10(sound_pressure / 2e-5))
+    assert calculate_spl(np.zeros(FFT_SAMPLES)) == (0, 0)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+
+from openpilot.system import proclogd
+
+
+class TestProclogd:
+  def test_parse_proc_stat(self):
+    stat = b"123 (a b) (c)) S 1 " + b" ".join(str(i).encode() for i in range(2, 50))
+    parsed = proclogd._parse_proc_stat(stat)
+    assert parsed is not None
+    assert (parsed.name, parsed.pid, parsed.state, parsed.ppid) == ("a b) (c)", 123, "S", 1)
+    assert (parsed.utime, parsed.starttime, parsed.vms, parsed.rss, parsed.processor) == (11, 19, 20, 21, 36)
+
+    assert proclogd._parse_proc_stat(b"123 (short) S 1 2 3") is None
+
+  def test_sampler(self):
+    sampler = proclogd.ProcSampler()
+    proc = subprocess.Popen(["sleep", "10"])
+    try:
+      procs = sampler.sample()
+      assert any(p.pid == os.getpid() for p in procs)
+      assert any(p.pid == proc.pid for p in procs)
+      assert proc.pid in sampler.stat_fds
+      proclogd._get_proc_extra(proc.pid, "sleep")
+
+      # stat files stay open between samples
+      fd = sampler.stat_fds[proc.pid]
+      assert any(p.pid == proc.pid for p in sampler.sample())
+      assert sampler.stat_fds[proc.pid] == fd
+    finally:
+      proc.kill()
+      proc.wait()
+
+    # exited processes are dropped
+    assert not any(p.pid == proc.pid for p in sampler.sample())
+    assert proc.pid not in sampler.stat_fds
+    assert proc.pid not in proclogd._proc_cache
+    sampler.close()
@@ -2,7 +2,8 @@ import os
 import io
 import posixpath
 import socket
-from functools import cache
+from collections.abc import Iterator
+from functools import cache, partial
 from openpilot.common.utils import retry
 from urllib.parse import urlparse
 
@@ -50,6 +51,9 @@ class DiskFile(io.BufferedReader):
       parts.append(self.read(r[1] - r[0]))
     return parts
 
+  def iter_chunks(self, chunk_size: int) -> Iterator[bytes]:
+    yield from iter(partial(self.read, chunk_size), b"")
+
 def FileReader(fn):
   fn = resolve_name(fn)
   if fn.startswith(("http://", "https://")):
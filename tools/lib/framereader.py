@@ -4,6 +4,7 @@ import json
 import logging
 from collections.abc import Iterator
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import numpy as np
 from openpilot.tools.lib.filereader import FileReader, resolve_name
@@ -124,23 +125,42 @@ class FfmpegDecoder:
   def get_gop_start(self, frame_idx: int):
     return self.iframes[np.searchsorted(self.iframes, frame_idx, side="right") - 1]
 
+  def _decode_frames(self, off_b: int, off_e: int) -> np.ndarray:
+    with FileReader(self.fn) as f:
+      f.seek(off_b)
+      raw = self.prefix + f.read(off_e - off_b)
+    return decompress_video_data(raw, self.w, self.h, self.pix_fmt, hwaccel=self.hwaccel, loglevel=self.loglevel)
+
   def get_iterator(self, start_fidx: int = 0, end_fidx: int|None = None,
-                   frame_skip: int = 1) -> Iterator[tuple[int, np.ndarray]]:
+                   frame_skip: int = 1, decode_ahead: bool = False) -> Iterator[tuple[int, np.ndarray]]:
+    """With decode_ahead, the next GOP is decoded in the background while the frames of the current one are consumed"""
     end_fidx = end_fidx or self.frame_count
-    fidx = start_fidx
-    while fidx < end_fidx:
-      f_b, f_e, off_b, off_e = self._gop_bounds(fidx)
-      with FileReader(self.fn) as f:
-        f.seek(off_b)
-        raw = self.prefix + f.read(off_e - off_b)
-      # number of frames to discard inside this GOP before the wanted one
-      for i, frm in enumerate(decompress_video_data(raw, self.w, self.h, self.pix_fmt, hwaccel=self.hwaccel, loglevel=self.loglevel)):
-        fidx = f_b + i
-        if fidx >= end_fidx:
-          return
-        elif fidx >= start_fidx and (fidx - start_fidx) % frame_skip == 0:
-          yield fidx, frm
-      fidx += 1
+    executor = ThreadPoolExecutor(max_workers=1) if decode_ahead else None
+    ahead: tuple[int, Future] | None = None  # first frame of the next GOP, and its decoded frames
+    try:
+      fidx = start_fidx
+      while fidx < end_fidx:
+        f_b, f_e, off_b, off_e = self._gop_bounds(fidx)
+        if ahead is not None and ahead[0] == f_b:
+          frames = ahead[1].result()
+        else:
+          frames = self._decode_frames(off_b, off_e)
+        ahead = None
+        if executor is not None and f_e < end_fidx:
+          _, _, next_off_b, next_off_e = self._gop_bounds(f_e)
+          ahead = (f_e, executor.submit(self._decode_frames, next_off_b, next_off_e))
+
+        # number of frames to discard inside this GOP before the wanted one
+        for i, frm in enumerate(frames):
+          fidx = f_b + i
+          if fidx >= end_fidx:
+            return
+          elif fidx >= start_fidx and (fidx - start_fidx) % frame_skip == 0:
+            yield fidx, frm
+        fidx += 1
+    finally:
+      if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 def FrameIterator(fn: str, index_data: dict|None=None, pix_fmt: str = "rgb24",
                   start_fidx:int=0, end_fidx=None, frame_skip:int=1, hwaccel="auto", loglevel="quiet") -> Iterator[np.ndarray]:
@@ -150,22 +170,30 @@ def FrameIterator(fn: str, index_data: dict|None=None, pix_fmt: str = "rgb24",
 
 class FrameReader:
   def __init__(self, fn: str, index_data: dict|None = None, cache_size: int = 30,
-               pix_fmt: str = "rgb24", hwaccel="auto", loglevel="quiet"):
+               pix_fmt: str = "rgb24", hwaccel="auto", loglevel="quiet", decode_ahead: bool = False):
     self.decoder = FfmpegDecoder(fn, index_data=index_data, pix_fmt=pix_fmt, hwaccel=hwaccel, loglevel=loglevel)
     self.iframes = self.decoder.iframes
     self._cache: LRUCache = LRUCache(cache_size)
     self.w, self.h, self.frame_count, = self.decoder.w, self.decoder.h, self.decoder.frame_count
     self.pix_fmt = pix_fmt
+    self.decode_ahead = decode_ahead
 
     self.it: Iterator[tuple[int, np.ndarray]] | None = None
     self.fidx = -1
 
+  def _next_gop_start(self, fidx: int) -> int | None:
+    i = np.searchsorted(self.iframes, fidx, side="right")
+    return self.iframes[i] if i < len(self.iframes) else None
+
   def get(self, fidx:int):
     if fidx in self._cache:  # If frame is cached, return it
       return self._cache[fidx]
     read_start = self.decoder.get_gop_start(fidx)
-    if not self.it or fidx < self.fidx or read_start != self.decoder.get_gop_start(self.fidx):  # If the frame is in a different GOP, reset the iterator
-      self.it = self.decoder.get_iterator(read_start)
+    # If the frame is in a different GOP, reset the iterator. The iterator keeps going into the next GOP, which may already be decoded ahead
+    if not self.it or fidx < self.fidx or read_start not in (self.decoder.get_gop_start(self.fidx), self._next_gop_start(self.fidx)):
+      if self.it is not None:
+        self.it.close()
+      self.it = self.decoder.get_iterator(read_start, decode_ahead=self.decode_ahead)
       self.fidx = -1
     while self.fidx < fidx:
       self.fidx, frame = next(self.it)
@@ -1,5 +1,5 @@
 import os
-from cereal import log as capnp_log, messaging
+from cereal import messaging
 from cereal.services import SERVICE_LIST
 
 from openpilot.tools.lib.logreader import LogIterable, RawLogIterable
@@ -26,5 +26,5 @@ def raw_live_logreader(services: list[str] = ALL_SERVICES, addr: str = '127.0.0.
 
 def live_logreader(services: list[str] = ALL_SERVICES, addr: str = '127.0.0.1') -> LogIterable:
   for m in raw_live_logreader(services, addr):
-    with capnp_log.Event.from_bytes(m) as evt:
-      yield evt
+    if m is not None:
+      yield messaging.log_from_bytes(m)
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 import bz2
 from functools import partial
+import itertools
 import multiprocessing
 import capnp
 import enum
 import os
 import pathlib
+import struct
 import sys
 import tqdm
 import urllib.parse
@@ -20,12 +22,17 @@ from openpilot.common.swaglog import cloudlog
 from openpilot.tools.lib.filereader import FileReader
 from openpilot.tools.lib.file_sources import comma_api_source, internal_source, openpilotci_source, comma_car_segments_source, Source
 from openpilot.tools.lib.route import SegmentRange, FileName
+from openpilot.tools.lib.url_file import CHUNK_SIZE
 from openpilot.tools.lib.log_time_series import msgs_to_time_series
 
 LogMessage = type[capnp._DynamicStructReader]
 LogIterable = Iterable[LogMessage]
 RawLogIterable = Iterable[bytes]
 
+BZ2_MAGIC = b'BZh9'
+# https://github.com/facebook/zstd/blob/dev/doc/zstd_compression_format.md#zstandard-frames
+ZSTD_MAGIC = b'\x28\xB5\x2F\xFD'
+
 
 def save_log(dest, log_msgs, compress=True):
   dat = b"".join(msg.as_builder().to_bytes() for msg in log_msgs)
@@ -39,14 +46,109 @@ def save_log(dest, log_msgs, compress=True):
     f.write(dat)
 
 
-def decompress_stream(data: bytes):
-  dctx = zstd.ZstdDecompressor()
-  decompressed_data = b""
+def _decompressor(ext: str | None, head: bytes):
+  if ext == ".bz2" or head.startswith(BZ2_MAGIC):
+    return bz2.BZ2Decompressor()
+  elif ext == ".zst" or head.startswith(ZSTD_MAGIC):
+    return zstd.ZstdDecompressor().decompressobj(read_across_frames=True)
+  return None
 
-  with dctx.stream_reader(data) as reader:
-    decompressed_data = reader.read()
 
-  return decompressed_data
+def _decompress_chunks(dobj, chunks: Iterable[bytes]) -> Iterator[bytes]:
+  """Incrementally decompresses a stream of bz2 or zstd chunks"""
+  for chunk in chunks:
+    while chunk:
+      yield dobj.decompress(chunk)
+      chunk = b""
+      # a bz2 file can be several concatenated streams, a decompressor stops at the end of the first one
+      if isinstance(dobj, bz2.BZ2Decompressor) and dobj.eof:
+        chunk, dobj = dobj.unused_data, bz2.BZ2Decompressor()
+
+
+def _complete_messages_length(buf: bytes | bytearray) -> int:
+  """Returns the length of the longest prefix of buf made up of complete capnp messages"""
+  # https://capnproto.org/encoding.html#serialization-over-a-stream
+  offset, buf_len = 0, len(buf)
+  while offset + 4 <= buf_len:
+    num_segments = struct.unpack_from("<I", buf, offset)[0] + 1
+    header_len = (4 + 4 * num_segments + 7) & ~7
+    if offset + header_len > buf_len:
+      break
+
+    msg_len = header_len + 8 * sum(struct.unpack_from(f"<{num_segments}I", buf, offset + 4))
+    if offset + msg_len > buf_len:
+      break
+    offset += msg_len
+  return offset
+
+
+def _frame_events(chunks: Iterable[bytes]) -> Iterator[capnp._DynamicStructReader]:
+  """Parses events out of a stream of decompressed chunks as soon as each one is complete"""
+  buf = b""
+  for chunk in chunks:
+    buf = buf + chunk if buf else chunk
+    complete = _complete_messages_length(buf)
+    if complete:
+      # the events reference buf, only the incomplete message at the end is copied
+      yield from capnp_log.Event.read_multiple_bytes(memoryview(buf)[:complete])
+      buf = buf[complete:]
+
+  # a truncated message at the end raises, same as parsing the whole file at once
+  if len(buf):
+    yield from capnp_log.Event.read_multiple_bytes(buf)
+
+
+def _log_events(chunks: Iterable[bytes], ext: str | None = None, frame: bool = True) -> Iterator[capnp._DynamicStructReader]:
+  """
+  Parses the events of a stream of log file chunks. With frame set, events are parsed as soon as the chunks holding
+  them arrive, otherwise the whole log is decompressed first and parsed at once, which is faster.
+  """
+  chunks = iter(chunks)
+  head = next(chunks, b"")
+  dobj = _decompressor(ext, head)
+  dat = itertools.chain((head,), chunks) if dobj is None else _decompress_chunks(dobj, itertools.chain((head,), chunks))
+  if frame:
+    return _frame_events(dat)
+  elif dobj is None:
+    return capnp_log.Event.read_multiple_bytes(b"".join(dat))
+
+  # the compressed chunks are dropped as they're decompressed
+  buf = bytearray()
+  for chunk in dat:
+    buf += chunk
+  return capnp_log.Event.read_multiple_bytes(buf)
+
+
+def _read_chunks(fn: str, chunk_size: int) -> Iterator[bytes]:
+  with FileReader(fn) as f:
+    yield from f.iter_chunks(chunk_size)
+
+
+def _log_file_ext(fn: str) -> str:
+  _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+  if ext not in ('', '.bz2', '.zst'):
+    # old rlogs weren't compressed
+    raise ValueError(f"unknown extension {ext}")
+  return ext
+
+
+def stream_log(fn: str, only_union_types=False, chunk_size=CHUNK_SIZE) -> Iterator[capnp._DynamicStructReader]:
+  """
+  Yields the events of a local or remote log file while it's still being read. Each chunk is decompressed and
+  parsed as soon as it arrives, so memory use is bounded by the chunk size rather than by the size of the log.
+  """
+  ents = _log_events(_read_chunks(fn, chunk_size), _log_file_ext(fn))
+  try:
+    for e in ents:
+      ent = CachedEventReader(e)
+      if only_union_types:
+        try:
+          ent.which()
+        except capnp.lib.capnp.KjException:
+          continue
+      yield ent
+  except capnp.KjException:
+    warnings.warn("Corrupted events detected", RuntimeWarning, stacklevel=1)
 
 
 class CachedEventReader:
@@ -91,23 +193,10 @@ class _LogFileReader:
     self.data_version = None
     self._only_union_types = only_union_types
 
-    ext = None
     if not dat:
-      _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
-      if ext not in ('', '.bz2', '.zst'):
-        # old rlogs weren't compressed
-        raise ValueError(f"unknown extension {ext}")
-
-      with FileReader(fn) as f:
-        dat = f.read()
-
-    if ext == ".bz2" or dat.startswith(b'BZh9'):
-      dat = bz2.decompress(dat)
-    elif ext == ".zst" or dat.startswith(b'\x28\xB5\x2F\xFD'):
-      # https://github.com/facebook/zstd/blob/dev/doc/zstd_compression_format.md#zstandard-frames
-      dat = decompress_stream(dat)
-
-    ents = capnp_log.Event.read_multiple_bytes(dat)
+      ents = _log_events(_read_chunks(fn, CHUNK_SIZE), _log_file_ext(fn), frame=False)
+    else:
+      ents = _log_events([dat], frame=False)
 
     self._ents = []
     try:
@@ -269,6 +358,11 @@ class LogReader:
     for i in range(len(self.logreader_identifiers)):
       yield from self._get_lr(i)
 
+  def stream(self) -> Iterator[capnp._DynamicStructReader]:
+    """Iterates over all events without downloading whole segments or keeping them in memory. Ignores sort_by_time."""
+    for fn in self.logreader_identifiers:
+      yield from stream_log(fn, only_union_types=self.only_union_types)
+
   def _run_on_segment(self, func, i):
     return func(self._get_lr(i))
 
@@ -1,3 +1,4 @@
+import bz2
 import capnp
 import contextlib
 import io
@@ -6,11 +7,12 @@ import tempfile
 import os
 import pytest
 import requests
+import zstandard as zstd
 
 from parameterized import parameterized
 
 from cereal import log as capnp_log
-from openpilot.tools.lib.logreader import LogsUnavailable, LogIterable, LogReader, parse_indirect, ReadMode
+from openpilot.tools.lib.logreader import LogsUnavailable, LogIterable, LogReader, parse_indirect, ReadMode, save_log, stream_log
 from openpilot.tools.lib.file_sources import comma_api_source, InternalUnavailableException
 from openpilot.tools.lib.route import SegmentRange
 from openpilot.tools.lib.url_file import URLFileException
@@ -255,3 +257,31 @@ class TestLogReader:
       msgs = list(LogReader(qlog.name, only_union_types=True))
       assert len(msgs) == num_msgs
       [m.which() for m in msgs]
+
+  @pytest.mark.parametrize("ext", ["", ".bz2", ".zst"])
+  def test_stream(self, ext):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      fn = os.path.join(tmpdir, "rlog" + ext)
+      num_msgs = 1000
+      save_log(fn, [capnp_log.Event.new_message(logMonoTime=i, valid=bool(i % 2)).as_reader() for i in range(num_msgs)])
+
+      # tiny chunks split messages across chunk boundaries
+      msgs = list(stream_log(fn, chunk_size=7))
+      assert [m.logMonoTime for m in msgs] == list(range(num_msgs))
+      assert [m.valid for m in msgs] == [bool(i % 2) for i in range(num_msgs)]
+
+      assert [m.logMonoTime for m in LogReader(fn).stream()] == [m.logMonoTime for m in LogReader(fn)]
+
+  @pytest.mark.parametrize("ext", [".bz2", ".zst"])
+  def test_concatenated_streams(self, ext):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      num_msgs = 1000
+      dat = [b"".join(capnp_log.Event.new_message(logMonoTime=i).to_bytes() for i in r) for r in (range(300), range(300, num_msgs))]
+      compress = bz2.compress if ext == ".bz2" else zstd.compress
+      fn = os.path.join(tmpdir, "rlog" + ext)
+      with open(fn, "wb") as f:
+        f.write(compress(dat[0]) + compress(dat[1]))
+
+      # all the streams are read, not only the first one
+      assert [m.logMonoTime for m in LogReader(fn)] == list(range(num_msgs))
+      assert [m.logMonoTime for m in stream_log(fn, chunk_size=7)] == list(range(num_msgs))
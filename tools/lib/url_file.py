@@ -3,6 +3,7 @@ import os
 import re
 import socket
 import time
+from collections.abc import Iterator
 from hashlib import md5
 from urllib3 import PoolManager, Retry
 from urllib3.response import BaseHTTPResponse
@@ -88,9 +89,9 @@ class URLFile:
   def __exit__(self, exc_type, exc_value, traceback) -> None:
     pass
 
-  def _request(self, method: str, url: str, headers: dict[str, str] | None = None) -> BaseHTTPResponse:
+  def _request(self, method: str, url: str, headers: dict[str, str] | None = None, preload_content: bool = True) -> BaseHTTPResponse:
     try:
-      return URLFile.pool_manager().request(method, url, timeout=self._timeout, headers=headers)
+      return URLFile.pool_manager().request(method, url, timeout=self._timeout, headers=headers, preload_content=preload_content)
     except MaxRetryError as e:
       raise URLFileException(f"Failed to {method} {url}: {e}") from e
 
@@ -163,6 +164,33 @@ class URLFile:
     self._pos += len(data[0])
     return data[0]
 
+  def iter_chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Reads the rest of the file in chunks, so the data can be consumed as it arrives."""
+    if not self._force_download:
+      # go through the chunk cache
+      length = self.get_length()
+      if length == -1:
+        raise URLFileException(f"Remote file is empty or doesn't exist: {self._url}")
+      while self._pos < length:
+        yield self.read(min(chunk_size, length - self._pos))
+      return
+
+    # one request, streamed as it's received
+    r = self._request("GET", self._url, headers={"Range": f"bytes={self._pos}-"}, preload_content=False)
+    try:
+      # the range starts at the end of the file
+      if r.status == 416:
+        return
+      if r.status not in [200, 206]:
+        raise URLFileException(f"Expected 206 or 200 response {r.status} ({self._url})")
+      if r.status == 200 and self._pos:
+        raise URLFileException(f"Server ignored the range request ({self._url})")
+      for chunk in r.stream(chunk_size):
+        self._pos += len(chunk)
+        yield chunk
+    finally:
+      r.release_conn()
+
   def get_multi_range(self, ranges: list[tuple[int, int]]) -> list[bytes]:
     # HTTP range requests are inclusive
     assert all(e > s for s, e in ranges), "Range end must be greater than start"